@@ -0,0 +1,216 @@
+# bench/fake_ollama.py
+"""Stand-in for the Ollama HTTP API, so assistant and agent runs are reproducible offline.
+
+Responses are derived from the prompt: HCL prompts get the configuration
+from the prompt back, patch prompts get a disk resize patch, ReAct agent
+prompts get a tool call and then a final answer. Latency and token rate
+are configurable, so timings model a real model without depending on one.
+
+    python bench/fake_ollama.py --port 11435 --latency 0.5 --tokens-per-sec 40
+    OLLAMA_HOST=http://127.0.0.1:11435 python modules/terraform.backup.py
+"""
+
+import argparse
+import json
+import re
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HCL_BLOCK = re.compile(r'```hcl\n(.*?)```', re.DOTALL)
+VM_ADDRESS = re.compile(r'resource\s+"(azurerm_(?:linux|windows)_virtual_machine)"\s+"([^"]+)"')
+CHARS_PER_TOKEN = 4
+
+
+def respond(prompt: str) -> str:
+    """The canned answer for a prompt."""
+    if "Action Input:" in prompt and "Thought:" in prompt:
+        # ReAct agent: one tool call, then finish once the observation is in the prompt
+        if "Observation:" in prompt.rsplit("Question:", 1)[-1]:
+            return "Thought: I now know the final answer\nFinal Answer: Done."
+        return "Thought: I should read the configuration\nAction: ReadTerraform\nAction Input: main.tf"
+
+    config = HCL_BLOCK.search(prompt)
+    config = config.group(1).strip() if config else ""
+    if "Output only the JSON list" in prompt:
+        vm = VM_ADDRESS.search(config)
+        if not vm:
+            return "[]"
+        return json.dumps([{"op": "set", "address": f"{vm.group(1)}.{vm.group(2)}",
+                            "attribute": "os_disk.disk_size_gb", "value": "64"}])
+    if "Output only valid HCL code" in prompt:
+        return config
+    return "1. Check the resource arguments.\n2. Run terraform validate."
+
+
+class FakeOllama:
+    """Threaded HTTP server speaking the subset of the Ollama API that langchain uses."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, tokens_per_sec=0.0):
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.requests = 0
+        self._connections = set()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def drop_connections(self):
+        """Close every open client connection, like Ollama restarting or timing out idle sockets."""
+        for connection in list(self._connections):
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def tokens(self, text):
+        """Split text into token-sized pieces, sleeping to match the configured rate."""
+        time.sleep(self.latency)
+        delay = 1 / self.tokens_per_sec if self.tokens_per_sec else 0
+        for i in range(0, len(text), CHARS_PER_TOKEN):
+            if delay:
+                time.sleep(delay)
+            yield text[i:i + CHARS_PER_TOKEN]
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Like Ollama: small NDJSON chunks go out immediately instead of waiting on delayed ACKs
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                fake._connections.add(self.connection)
+
+            def finish(self):
+                fake._connections.discard(self.connection)
+                super().finish()
+
+            def _json(self, payload, status=200):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._json({"models": [{"name": "llama3:latest", "model": "llama3:latest", "size": 0}]})
+                elif self.path == "/api/version":
+                    self._json({"version": "0.0.0-fake"})
+                else:
+                    self._json({"status": "ok"} if self.path == "/" else {"error": "not found"},
+                               200 if self.path == "/" else 404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                fake.requests += 1
+                if self.path == "/api/generate" and not request.get("prompt"):
+                    # An empty prompt only loads the model (what clients send to preload it)
+                    self._json({"model": request.get("model", "llama3"), "response": "", "done": True,
+                                "done_reason": "load", "load_duration": 0})
+                elif self.path == "/api/generate":
+                    self._reply(request, request.get("prompt", ""), "response")
+                elif self.path == "/api/chat":
+                    prompt = "\n".join(m.get("content", "") for m in request.get("messages", []))
+                    self._reply(request, prompt, "message")
+                elif self.path == "/api/show":
+                    self._json({"modelfile": "", "parameters": "", "template": "", "details": {}})
+                else:
+                    self._json({"error": "not found"}, 404)
+
+            def _reply(self, request, prompt, field):
+                model = request.get("model", "llama3")
+                started = time.monotonic()
+
+                def message(text, done):
+                    payload = {"model": model, "created_at": datetime.now(timezone.utc).isoformat(), "done": done}
+                    payload[field] = {"role": "assistant", "content": text} if field == "message" else text
+                    return payload
+
+                answer = respond(prompt)
+                final_stats = {
+                    "done_reason": "stop",
+                    "total_duration": 0,
+                    "prompt_eval_count": len(prompt) // CHARS_PER_TOKEN,
+                    "eval_count": len(answer) // CHARS_PER_TOKEN + 1,
+                }
+                if not request.get("stream", True):
+                    text = "".join(fake.tokens(answer))
+                    final = message(text, True)
+                    final.update(final_stats, total_duration=int((time.monotonic() - started) * 1e9))
+                    self._json(final)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for token in fake.tokens(answer):
+                        self._chunk(message(token, False))
+                    final = message("", True)
+                    final.update(final_stats, total_duration=int((time.monotonic() - started) * 1e9))
+                    self._chunk(final)
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client stopped reading (e.g. the cleaner aborted the stream)
+                    pass
+
+            def _chunk(self, payload):
+                data = json.dumps(payload).encode() + b"\n"
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake Ollama server for offline benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0, help="Token rate (0 = as fast as possible)")
+    args = parser.parse_args(argv)
+
+    fake = FakeOllama(args.host, args.port, args.latency, args.tokens_per_sec)
+    print(f"Fake Ollama listening on {fake.url} (set OLLAMA_HOST={fake.url})")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# bench/import_budget.py
+"""Import-time budget for the planner startup path, measured with `python -X importtime`.
+
+Fails when importing planner or an agent tool module pulls in LangChain or
+another heavy package, or when planner's cumulative import time goes over
+the budget (best of several runs, to keep noise out).
+
+    python bench/import_budget.py
+    python bench/import_budget.py --budget-ms 100 --repeat 7
+"""
+
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+AGENTS_DIR = Path(__file__).resolve().parent.parent
+
+# Loaded on demand (AgentLoader, llm_client, terraform_runner) and never at startup
+HEAVY = {"langchain", "langchain_core", "langchain_community", "langchain_ollama", "pydantic", "httpx",
+         "requests", "ollama", "asyncio", "ssl"}
+MODULES = ["planner", "modules.parser", "modules.router", "modules.metrics", "modules.terraform_io",
+           "modules.state_reader", "modules.vm_manager", "modules.terraform_runner", "modules.observations"]
+DEFAULT_BUDGET_MS = 150
+
+
+def measure(module):
+    """(cumulative import time of `module` in ms, top-level packages it imported) in a fresh interpreter."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=AGENTS_DIR,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    total_us, packages = 0, set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # the header line
+        packages.add(name.strip().split(".")[0])
+        if name.strip() == module:
+            total_us = int(cumulative)
+    return total_us / 1000, packages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the planner's import-time budget.")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="Budget for `import planner`")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per module; the fastest one counts")
+    args = parser.parse_args(argv)
+
+    failures = []
+    for module in MODULES:
+        runs = [measure(module) for _ in range(args.repeat)]
+        best = min(ms for ms, _ in runs)
+        heavy = sorted(set().union(*(packages for _, packages in runs)) & HEAVY)
+        status = "✅"
+        if heavy:
+            failures.append(f"{module} imports {', '.join(heavy)} at startup")
+            status = "❌"
+        if module == "planner" and best > args.budget_ms:
+            failures.append(f"import planner took {best:.1f}ms (budget {args.budget_ms:.0f}ms)")
+            status = "❌"
+        print(f"{status} {module:<28} {best:>7.1f}ms{'  heavy: ' + ', '.join(heavy) if heavy else ''}")
+
+    for failure in failures:
+        print(f"[❌] {failure}")
+    if not failures:
+        print("[✅] Startup imports within budget")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
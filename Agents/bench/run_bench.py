@@ -0,0 +1,314 @@
+# bench/run_bench.py
+"""Benchmarks for the edit pipeline, emitted as JSON so runs can be compared across commits.
+
+Synthetic configurations of 10 to 10,000 resources are built from renamed
+copies of hcl/main.tf. End-to-end runs of the assistant and of the
+planner's LangChain agent talk to the fake Ollama server in
+bench/fake_ollama.py, so they need langchain but no model.
+
+    python bench/run_bench.py --out before.json
+    python bench/run_bench.py --sizes 10,100 --llm-latency 0.5 --llm-tokens-per-sec 40 --out after.json
+    python bench/run_bench.py --compare before.json after.json
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import logging
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+AGENTS_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(AGENTS_DIR))
+
+from bench.fake_ollama import FakeOllama
+from modules.backup_store import BackupStore
+from modules.hcl_lexer import find_syntax_error, parse_blocks
+from modules.llm_stream import clean_response
+from modules.metrics import metrics
+from modules.observations import observations
+from modules.terraform_io import TERRAFORM_PATH, read_terraform
+from modules.vm_manager import create_vm, modify_disk
+
+SAMPLE = AGENTS_DIR / "hcl" / "main.tf"
+DEFAULT_SIZES = "10,100,1000,10000"
+E2E_TASK = "increase the disk of vm vm by 10GB"
+# Not something the router handles, so the agent reads main.tf through its tool and answers
+AGENT_TASK = "what does the configuration deploy?"
+
+
+def synthetic_config(resources, sample=SAMPLE):
+    """A configuration with `resources` resource blocks: the sample's blocks, copied and renamed."""
+    text = Path(sample).read_text(encoding="utf-8")
+    blocks = parse_blocks(text)
+    # Provider and resource group are shared; everything else is copied with a _<n> suffix
+    shared = [b for b in blocks if b.type != "resource" or b.labels[0] == "azurerm_resource_group"]
+    templates = [b for b in blocks if b not in shared]
+    parts = [b.text(text) for b in shared]
+    count = sum(1 for b in shared if b.type == "resource")
+
+    copy = 0
+    while count < resources:
+        suffix = f"_{copy}" if copy else ""
+        for block in templates:
+            if count >= resources:
+                break
+            body = block.text(text)
+            for other in templates:
+                resource_type, name = other.labels
+                body = re.sub(rf'"{resource_type}"\s+"{name}"', f'"{resource_type}" "{name}{suffix}"', body)
+                body = re.sub(rf'\b{resource_type}\.{name}\b', f'{resource_type}.{name}{suffix}', body)
+            parts.append(body)
+            count += 1
+        copy += 1
+    return "\n\n".join(parts) + "\n"
+
+
+def timed(func, repeat, setup=None):
+    """Run func `repeat` times (setup untimed before each run); returns the timings in seconds."""
+    times = []
+    for i in range(repeat):
+        if setup:
+            setup(i)
+        started = time.perf_counter()
+        func(i)
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def result(name, resources, config, times, **extra):
+    entry = {
+        "name": name,
+        "resources": resources,
+        "bytes": len(config.encode("utf-8")),
+        "runs": len(times),
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+    }
+    entry.update(extra)
+    return entry
+
+
+def load_assistant(workspace, ollama_url):
+    """Import modules/terraform.backup.py against a scratch workspace; None if langchain is missing."""
+    os.environ["TF_ASSISTANT_WORKSPACE"] = str(workspace)
+    os.environ["TF_ASSISTANT_NO_CACHE"] = "1"
+    if ollama_url:
+        os.environ["OLLAMA_HOST"] = ollama_url
+    spec = importlib.util.spec_from_file_location("terraform_assistant", AGENTS_DIR / "modules" / "terraform.backup.py")
+    module = importlib.util.module_from_spec(spec)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            spec.loader.exec_module(module)
+    except ImportError as e:
+        return None, str(e)
+    logging.getLogger().setLevel(logging.ERROR)
+    return module, None
+
+
+def bench_size(resources, repeat, workdir, assistant, results):
+    config = synthetic_config(resources)
+    tf_path = Path(workdir) / TERRAFORM_PATH
+    tf_path.parent.mkdir(parents=True, exist_ok=True)
+
+    def reset(_):
+        tf_path.write_text(config, encoding="utf-8")
+
+    reset(0)
+    results.append(result("read_terraform", resources, config, timed(lambda i: read_terraform(""), repeat)))
+
+    status = modify_disk("vm=vm;mode=increment;amount=10")
+    if not status.startswith("[✅]"):
+        raise RuntimeError(f"modify_disk failed on the synthetic config: {status}")
+    results.append(result("modify_disk", resources, config, timed(
+        lambda i: modify_disk("vm=vm;mode=increment;amount=10"), repeat, reset)))
+    results.append(result("create_vm", resources, config, timed(
+        lambda i: create_vm(f"vm=bench-{i};region=eastus;size=30"), repeat, reset)))
+
+    response = f"Here is the updated configuration:\n```hcl\n{config}```\nI increased the disk size."
+    if assistant is not None:
+        validate, impl = assistant.validate_terraform_syntax, "TerraformAssistant"
+    else:
+        validate, impl = find_syntax_error, "modules (assistant not importable)"
+    results.append(result("clean_llm_response", resources, config, timed(lambda i: clean_response(response), repeat)))
+    results.append(result("validate_terraform_syntax", resources, config, timed(lambda i: validate(config), repeat),
+                          impl=impl))
+
+    store = BackupStore(Path(workdir) / "backups", keep_last=repeat + 1)
+    results.append(result("backup_write", resources, config, timed(
+        lambda i: store.save(config + f"\n# revision {i}\n"), repeat)))
+
+
+def bench_e2e(resources, repeat, module, assistant, fake, results):
+    config = synthetic_config(resources)
+    for mode in ("patch", "full"):
+        module.EDIT_MODE = mode
+        requests_before = fake.requests
+
+        def run(_):
+            with contextlib.redirect_stdout(io.StringIO()):
+                updated, _ops = assistant.get_updated_configuration(config, E2E_TASK)
+            if not updated:
+                raise RuntimeError(f"e2e {mode} run produced no configuration")
+
+        times = timed(run, repeat)
+        results.append(result(f"e2e_{mode}", resources, config, times,
+                              llm_requests=(fake.requests - requests_before) / repeat))
+
+
+def load_agent():
+    """The planner's agent, built the way planner.main builds it; None if langchain is missing."""
+    import planner
+    try:
+        from modules.llm_client import ollama_llm
+    except ImportError as e:
+        return None, str(e)
+
+    tool_funcs = {tool["name"]: metrics.traced(tool["name"], tool["func"]) for tool in planner.tools}
+    loader = planner.AgentLoader(tool_funcs, lambda: ollama_llm(planner.MODEL, preload=False, keep_warm=False))
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return loader.get(), None
+    except RuntimeError as e:
+        return None, str(e)
+
+
+def bench_agent(resources, repeat, agent, fake, results):
+    """A request through the agent: LLM, ReadTerraform (compacted), LLM again."""
+    config = synthetic_config(resources)
+    requests_before = fake.requests
+    observations.request = AGENT_TASK
+
+    def run(_):
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = agent.invoke(AGENT_TASK)
+        if not response:
+            raise RuntimeError("e2e agent run produced no answer")
+
+    times = timed(run, repeat)
+    results.append(result("e2e_agent", resources, config, times,
+                          llm_requests=(fake.requests - requests_before) / repeat))
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=AGENTS_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=AGENTS_DIR,
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    sizes = [int(s) for s in args.sizes.split(",")]
+    results = []
+    meta = {
+        "commit": git_revision(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "sizes": sizes,
+        "llm": {"latency": args.llm_latency, "tokens_per_sec": args.llm_tokens_per_sec},
+    }
+
+    fake = None
+    if not args.no_e2e:
+        fake = FakeOllama(latency=args.llm_latency, tokens_per_sec=args.llm_tokens_per_sec).start()
+    old_cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            module, reason = load_assistant(workdir, fake.url if fake else None)
+            assistant = None
+            if module is not None:
+                assistant = module.TerraformAssistant(Path(workdir) / "main.tf", Path(workdir) / "assistant_backups")
+            else:
+                meta["assistant_unavailable"] = reason
+            agent = None
+            if fake:
+                agent, agent_reason = load_agent()
+                if agent is None:
+                    meta["agent_unavailable"] = agent_reason
+
+            os.chdir(workdir)
+            for resources in sizes:
+                print(f"⏱️ {resources} resources...", file=sys.stderr)
+                bench_size(resources, args.repeat, workdir, assistant, results)
+                if fake and assistant and resources <= args.e2e_max_resources:
+                    bench_e2e(resources, args.e2e_repeat, module, assistant, fake, results)
+                if agent and resources <= args.e2e_max_resources:
+                    bench_agent(resources, args.e2e_repeat, agent, fake, results)
+            if fake and not assistant:
+                meta["e2e_skipped"] = f"assistant not importable: {reason}"
+    finally:
+        os.chdir(old_cwd)
+        if fake:
+            fake.stop()
+
+    report = json.dumps({"meta": meta, "results": results}, indent=2)
+    if args.out:
+        Path(args.out).write_text(report + "\n", encoding="utf-8")
+        print(f"📄 Results written to {args.out}", file=sys.stderr)
+    else:
+        print(report)
+    return 0
+
+
+def compare(old_path, new_path, threshold):
+    """Print median timings side by side; returns 1 if anything got slower than threshold allows."""
+    old = json.loads(Path(old_path).read_text(encoding="utf-8"))
+    new = json.loads(Path(new_path).read_text(encoding="utf-8"))
+    baseline = {(r["name"], r["resources"]): r for r in old["results"]}
+    print(f"{old['meta'].get('commit')} -> {new['meta'].get('commit')}")
+    print(f"{'Benchmark':<28} {'Resources':>9} {'Old (ms)':>10} {'New (ms)':>10} {'Ratio':>7}")
+    regressions = 0
+    for r in new["results"]:
+        before = baseline.get((r["name"], r["resources"]))
+        if before is None:
+            continue
+        ratio = r["median"] / before["median"] if before["median"] else float("inf")
+        flag = ""
+        if ratio > threshold:
+            flag, regressions = "  ⚠️ slower", regressions + 1
+        elif ratio < 1 / threshold:
+            flag = "  🚀 faster"
+        print(f"{r['name']:<28} {r['resources']:>9} {before['median'] * 1000:>10.2f} "
+              f"{r['median'] * 1000:>10.2f} {ratio:>6.2f}x{flag}")
+    print(f"{regressions} regression(s) beyond {threshold:.2f}x")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Terraform edit pipeline.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated resource counts")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per micro benchmark")
+    parser.add_argument("--out", help="Write JSON results here instead of stdout")
+    parser.add_argument("--no-e2e", action="store_true", help="Skip end-to-end runs against the fake Ollama server")
+    parser.add_argument("--e2e-max-resources", type=int, default=100, help="Largest config for end-to-end runs")
+    parser.add_argument("--e2e-repeat", type=int, default=3, help="Runs per end-to-end benchmark")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Fake model: seconds before the first token")
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=0.0, help="Fake model: token rate (0 = unlimited)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Slowdown ratio reported as a regression")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return compare(*args.compare, args.threshold)
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
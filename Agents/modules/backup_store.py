@@ -0,0 +1,148 @@
+# modules/backup_store.py
+
+import difflib
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+
+LEGACY_BACKUP = re.compile(r'^main_(\d{8}_\d{6})\.tf$')
+LEGACY_MARKER = ".legacy_imported"  # Written once the main_<timestamp>.tf copies are in the store
+
+
+class BackupStore:
+    """Deduplicated, compressed version history of a Terraform file.
+
+    Each distinct file content is stored once as objects/<sha256>.gz; the
+    version list lives in index.json. Listing, diffing and restoring only
+    touch the index and the objects involved, however long the history gets.
+    """
+
+    def __init__(self, backup_dir, keep_last=100, keep_days=30):
+        self.backup_dir = Path(backup_dir)
+        self.objects_dir = self.backup_dir / "objects"
+        self.index_path = self.backup_dir / "index.json"
+        self.keep_last = keep_last
+        self.keep_days = keep_days
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self._index = self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {"next": 1, "versions": []}
+        self._by_version = {v["version"]: v for v in index["versions"]}
+        return index
+
+    def _save_index(self):
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f, indent=1)
+        os.replace(tmp_path, self.index_path)
+
+    def _object_path(self, digest):
+        return self.objects_dir / f"{digest}.gz"
+
+    def _write_object(self, content):
+        data = content.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if not path.exists():
+            tmp_path = path.with_suffix(".tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(gzip.compress(data, compresslevel=9, mtime=0))
+            os.replace(tmp_path, path)
+        return digest, len(data)
+
+    def save(self, content, note="", timestamp=None, retain=True):
+        """Record a version; identical to the latest version means nothing new is stored."""
+        digest, size = self._write_object(content)
+        versions = self._index["versions"]
+        if versions and versions[-1]["hash"] == digest:
+            return versions[-1]
+
+        entry = {
+            "version": self._index["next"],
+            "hash": digest,
+            "size": size,
+            "timestamp": timestamp or datetime.now().isoformat(timespec="seconds"),
+            "note": note,
+        }
+        self._index["next"] += 1
+        versions.append(entry)
+        self._by_version[entry["version"]] = entry
+        if retain:
+            self.apply_retention(save=False)
+        self._save_index()
+        return entry
+
+    def list_versions(self):
+        return list(self._index["versions"])
+
+    def latest(self):
+        versions = self._index["versions"]
+        return versions[-1] if versions else None
+
+    def get(self, version) -> str:
+        entry = self._by_version.get(int(version))
+        if entry is None:
+            raise KeyError(f"No backup version {version}")
+        with open(self._object_path(entry["hash"]), "rb") as f:
+            return gzip.decompress(f.read()).decode("utf-8")
+
+    def diff(self, old_version, new_version=None, current_content=None) -> str:
+        """Unified diff between two versions, or between a version and current_content."""
+        old = self.get(old_version)
+        if new_version is not None:
+            new, new_label = self.get(new_version), f"version {new_version}"
+        else:
+            new, new_label = current_content or "", "current"
+        return "".join(difflib.unified_diff(
+            old.splitlines(keepends=True), new.splitlines(keepends=True),
+            fromfile=f"version {old_version}", tofile=new_label))
+
+    def apply_retention(self, save=True):
+        """Drop versions beyond the newest keep_last that are older than keep_days."""
+        versions = self._index["versions"]
+        cutoff = time.time() - self.keep_days * 86400
+        kept = []
+        for i, entry in enumerate(versions):
+            recent = i >= len(versions) - self.keep_last
+            if recent or datetime.fromisoformat(entry["timestamp"]).timestamp() >= cutoff:
+                kept.append(entry)
+        if len(kept) == len(versions):
+            return 0
+
+        removed = len(versions) - len(kept)
+        self._index["versions"] = kept
+        self._by_version = {v["version"]: v for v in kept}
+        live = {v["hash"] for v in kept}
+        for path in self.objects_dir.glob("*.gz"):
+            if path.stem not in live:
+                path.unlink()
+        if save:
+            self._save_index()
+        return removed
+
+    def import_legacy(self):
+        """Copy old main_<timestamp>.tf backups into the store, oldest first, once.
+
+        The files are left in place and retention is not applied, so an import
+        never loses a backup; the marker file keeps it from running again.
+        """
+        marker = self.backup_dir / LEGACY_MARKER
+        if marker.exists():
+            return 0
+        legacy = sorted(p for p in self.backup_dir.iterdir() if LEGACY_BACKUP.match(p.name))
+        for path in legacy:
+            stamp = datetime.strptime(LEGACY_BACKUP.match(path.name).group(1), "%Y%m%d_%H%M%S")
+            with open(path, "r", encoding="utf-8") as f:
+                self.save(f.read(), note=f"imported from {path.name}", timestamp=stamp.isoformat(), retain=False)
+        marker.write_text("".join(f"{p.name}\n" for p in legacy), encoding="utf-8")
+        return len(legacy)
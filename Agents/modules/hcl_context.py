@@ -0,0 +1,234 @@
+# modules/hcl_context.py
+
+import re
+
+from modules.hcl_lexer import parse_blocks
+from modules.terraform_io import BlockIndex
+
+# Words in a task that imply resource types, e.g. "resize the disk" -> the VM
+TYPE_KEYWORDS = {
+    r'\b(vms?|virtual machines?|disks?|os[ _]disk|vm size|image)\b':
+        ("azurerm_linux_virtual_machine", "azurerm_windows_virtual_machine"),
+    r'\b(nics?|network interfaces?|private ip)\b': ("azurerm_network_interface",),
+    r'\bsubnets?\b': ("azurerm_subnet",),
+    r'\b(vnets?|virtual networks?|address space)\b': ("azurerm_virtual_network",),
+    r'\bresource groups?\b': ("azurerm_resource_group",),
+    r'\b(nsgs?|network security groups?|security rules?)\b':
+        ("azurerm_network_security_group", "azurerm_network_interface_security_group_association"),
+    r'\bpublic ips?\b': ("azurerm_public_ip",),
+    r'\bstorage( accounts?)?\b': ("azurerm_storage_account",),
+}
+
+REFERENCE = re.compile(r'\b(data\.[\w-]+\.[\w-]+|module\.[\w-]+|var\.[\w-]+|local\.[\w-]+|[a-z][a-z0-9]*_[\w-]+\.[\w-]+)')
+ERROR_LINE = re.compile(r'on [^\s,]+\.tf line (\d+)')
+# How a scoped LLM response deletes a block: "# DELETE azurerm_public_ip.pip" on its own line
+DELETE_MARKER = re.compile(r'^\s*#\s*DELETE\s+([\w.-]+)\s*$', re.M)
+ERROR_BLOCK = re.compile(r'in (resource|data) "([\w-]+)" "([\w-]+)"')
+
+# Blocks every prompt needs regardless of the task
+ALWAYS_INCLUDE = ("provider", "terraform")
+# Resource names too common to be treated as a mention in free text
+GENERIC_NAMES = {"this", "main", "default", "example", "primary"}
+# Blocks that can be planned with -target, and blocks whose edits only reach resources through references
+TARGET_TYPES = ("resource", "data", "module")
+REFERENCED_TYPES = ("variable", "locals", "output")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for llama-style tokenizers)."""
+    return (len(text) + 3) // 4
+
+
+def reference_graph(index: BlockIndex):
+    """Map each block address to the addresses of the blocks it references."""
+    locals_block = index.get("locals")
+    graph = {}
+    for block in index.blocks:
+        refs = set()
+        for ref in REFERENCE.findall(block.text(index.content)):
+            if ref.startswith("local."):
+                if locals_block is not None:
+                    refs.add(locals_block.address)
+                continue
+            target = index.find(ref)
+            if target is None and ref.count(".") >= 2:
+                target = index.find(ref.rsplit(".", 1)[0])
+            if target is not None and target is not block:
+                refs.add(target.address)
+        graph[block.address] = refs
+    return graph
+
+
+class ContextSelection:
+    """The blocks chosen for a prompt, plus how much smaller the prompt got."""
+
+    def __init__(self, index, addresses, scoped):
+        self.addresses = addresses
+        self.scoped = scoped
+        if scoped:
+            selected = [b for b in index.blocks if b.address in addresses]
+            self.text = "\n\n".join(b.text(index.content) for b in selected) + "\n"
+        else:
+            self.text = index.content
+        self.total_blocks = len(index.blocks)
+        self.full_tokens = estimate_tokens(index.content)
+        self.context_tokens = estimate_tokens(self.text)
+
+    @property
+    def saved_tokens(self):
+        return self.full_tokens - self.context_tokens
+
+    def summary(self):
+        if not self.scoped:
+            return f"full file ({self.total_blocks} blocks, ~{self.full_tokens} tokens)"
+        return (f"{len(self.addresses)}/{self.total_blocks} blocks, ~{self.context_tokens} of "
+                f"~{self.full_tokens} tokens (saved ~{self.saved_tokens})")
+
+
+def _seed_blocks(index, task, error_msg):
+    text = f"{task}\n{error_msg}"
+    lowered = text.lower()
+    words = set(re.findall(r'[\w-]+', lowered))
+    seeds = set()
+
+    for block in index.blocks:
+        if block.type in ALWAYS_INCLUDE:
+            continue
+        name_attr = block.attributes.get("name")
+        name_value = name_attr.value(index.content).strip('"').lower() if name_attr else None
+        label = block.labels[-1].lower() if block.labels else None
+        if block.address.lower() in lowered or (label and label not in GENERIC_NAMES and label in words) \
+                or (name_value and name_value in words):
+            seeds.add(block.address)
+
+    for pattern, types in TYPE_KEYWORDS.items():
+        if re.search(pattern, lowered):
+            seeds.update(b.address for b in index.resources(*types))
+
+    # Terraform errors point at "on main.tf line N, in resource "type" "name""
+    for line in ERROR_LINE.findall(error_msg):
+        offset = _offset_of_line(index.content, int(line))
+        block = index.block_at(offset) if offset is not None else None
+        if block is not None:
+            seeds.add(block.address)
+    for block_type, resource_type, name in ERROR_BLOCK.findall(error_msg):
+        block = index.get(block_type, resource_type, name)
+        if block is not None:
+            seeds.add(block.address)
+    return seeds
+
+
+def _offset_of_line(content, line_number):
+    offset = 0
+    for _ in range(line_number - 1):
+        offset = content.find("\n", offset) + 1
+        if offset == 0:
+            return None
+    return offset
+
+
+def select_context(content: str, task: str, error_msg="") -> ContextSelection:
+    """Pick the blocks a task touches plus everything they reference.
+
+    Falls back to the whole file when nothing in the task or error can be
+    resolved to an existing block.
+    """
+    index = BlockIndex(content)
+    seeds = _seed_blocks(index, task, error_msg)
+    if not seeds:
+        return ContextSelection(index, {b.address for b in index.blocks}, scoped=False)
+
+    graph = reference_graph(index)
+    selected = set()
+    pending = list(seeds)
+    while pending:
+        address = pending.pop()
+        if address not in selected:
+            selected.add(address)
+            pending.extend(graph.get(address, ()))
+
+    selected.update(b.address for b in index.blocks if b.type in ALWAYS_INCLUDE)
+    if len(selected) == len(index.blocks):
+        return ContextSelection(index, selected, scoped=False)
+    return ContextSelection(index, selected, scoped=True)
+
+
+def merge_scoped_response(content: str, selection: ContextSelection, updated_text: str) -> str:
+    """Splice an LLM's updated copy of the selected blocks back into the full file.
+
+    Blocks in the response replace their originals and new blocks are
+    appended. Selected blocks missing from the response stay as they are: a
+    model that only echoes the block it changed must not wipe the context it
+    was given. A block is deleted only when the response says
+    `# DELETE <address>` for it.
+    """
+    index = BlockIndex(content)
+    for block in parse_blocks(updated_text):
+        if block.end is None:
+            continue
+        existing = index.find(block.address)
+        if existing is not None:
+            index.replace_span(existing.start, existing.end, block.text(updated_text))
+        else:
+            index.append_block(block.text(updated_text))
+
+    for address in DELETE_MARKER.findall(updated_text):
+        block = index.find(address) if address in selection.addresses else None
+        if block is not None and block.type not in ALWAYS_INCLUDE:
+            end = block.end
+            while index.content[end:end + 1] == "\n":
+                end += 1
+            index.replace_span(block.start, end, "")
+    return index.content
+
+
+def changed_blocks(old: str, new: str):
+    """Addresses of blocks added, removed or edited between two versions of a file (whitespace ignored).
+
+    Returns None when either version has an unterminated block.
+    """
+    versions = []
+    for content in (old, new):
+        blocks = parse_blocks(content)
+        if any(b.end is None for b in blocks):
+            return None
+        versions.append({b.address: " ".join(b.text(content).split()) for b in blocks})
+    before, after = versions
+    return {a for a in before.keys() | after.keys() if before.get(a) != after.get(a)}
+
+
+def plan_targets(old: str, new: str):
+    """Addresses a targeted plan must cover after `old` was edited into `new`.
+
+    The changed resources plus every block that references a changed block,
+    directly or through others; terraform adds what the targets depend on
+    itself. Returns None when only a full plan will do: a provider or
+    terraform block changed, a file could not be parsed, or nothing
+    targetable changed.
+    """
+    changed = changed_blocks(old, new)
+    if not changed:
+        return None
+    old_index, new_index = BlockIndex(old), BlockIndex(new)
+    types = {}
+    for index in (old_index, new_index):
+        types.update((b.address, b.type) for b in index.blocks)
+    if any(types[a] not in TARGET_TYPES + REFERENCED_TYPES for a in changed):
+        return None
+
+    # Removed blocks are only referenced in the old version
+    dependents = {}
+    for index in (old_index, new_index):
+        for address, refs in reference_graph(index).items():
+            for ref in refs:
+                dependents.setdefault(ref, set()).add(address)
+
+    affected = set()
+    pending = list(changed)
+    while pending:
+        address = pending.pop()
+        if address not in affected:
+            affected.add(address)
+            pending.extend(dependents.get(address, ()))
+    targets = sorted(a for a in affected if types[a] in TARGET_TYPES)
+    return targets or None
@@ -0,0 +1,526 @@
+# modules/hcl_lexer.py
+
+import os
+import re
+import sys
+from bisect import bisect_right
+
+
+class HclSyntaxError(ValueError):
+    """A structural error in HCL text, with the 1-based line and column where it starts."""
+
+    def __init__(self, message, text, pos):
+        self.message = message
+        self.pos = pos
+        self.line = text.count("\n", 0, pos) + 1
+        self.column = pos - text.rfind("\n", 0, pos)
+        super().__init__(f"line {self.line}, column {self.column}: {message}")
+
+
+class HclScanner:
+    """Incremental scanner that tracks brace depth, strings, heredocs and comments in HCL text.
+
+    This is the streaming counterpart of `lex`: it takes text in arbitrary
+    chunks and only ever counts block braces, so braces inside strings,
+    `${...}` interpolations, heredocs and comments never change `depth`.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.min_depth = 0
+        self.in_string = False
+        self.in_line_comment = False
+        self.in_block_comment = False
+        self.heredoc = None  # closing marker while inside a heredoc body
+        self._templates = []  # brace depth of each open ${...} inside a string
+        self._escape = False
+        self._prev = ""
+        self._line = ""
+
+    @property
+    def in_literal(self):
+        """True while inside a string, heredoc or comment, where braces don't count."""
+        return (self.in_string or self.in_line_comment or self.in_block_comment
+                or self.heredoc is not None or bool(self._templates))
+
+    @property
+    def balanced(self):
+        return self.depth == 0 and self.min_depth >= 0 and not self.in_literal
+
+    def feed(self, text: str):
+        """Consume the next chunk of text, updating the running state."""
+        for ch in text:
+            prev, self._prev = self._prev, ch
+            if ch == "\n":
+                line, self._line = self._line, ""
+            else:
+                self._line += ch
+
+            if self.heredoc is not None:
+                if ch == "\n" and line.strip() == self.heredoc:
+                    self.heredoc = None
+                continue
+
+            if self.in_line_comment:
+                if ch == "\n":
+                    self.in_line_comment = False
+                else:
+                    continue
+
+            if self.in_block_comment:
+                if prev == "*" and ch == "/":
+                    self.in_block_comment = False
+                    self._prev = ""
+                continue
+
+            if self.in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch in "$%" and prev == ch:
+                    self._prev = ""  # $${ and %%{ are literal
+                elif ch == "{" and prev in ("$", "%"):
+                    self.in_string = False
+                    self._templates.append(0)
+                elif ch == '"' or ch == "\n":
+                    self.in_string = False
+                continue
+
+            if ch == '"':
+                self.in_string = True
+            elif ch == "#":
+                self.in_line_comment = True
+            elif ch == "/" and prev == "/":
+                self.in_line_comment = True
+            elif ch == "*" and prev == "/":
+                self.in_block_comment = True
+                self._prev = ""
+            elif ch == "{":
+                if self._templates:
+                    self._templates[-1] += 1
+                else:
+                    self.depth += 1
+            elif ch == "}":
+                if not self._templates:
+                    self.depth -= 1
+                    self.min_depth = min(self.min_depth, self.depth)
+                elif self._templates[-1]:
+                    self._templates[-1] -= 1
+                else:
+                    # End of ${...}: back inside the string
+                    self._templates.pop()
+                    self.in_string = True
+            elif ch == "\n":
+                marker = HEREDOC_START.search(line)
+                if marker:
+                    self.heredoc = marker.group(1)
+        return self
+
+
+CODE_TOKEN = re.compile(r'''
+    (?P<newline>\n)
+  | (?P<ws>[ \t\r]+)
+  | (?P<comment>\#[^\n]*|//[^\n]*|/\*.*?\*/)
+  | (?P<heredoc><<-?(?P<marker>[A-Za-z_][\w-]*)[ \t]*\r?\n)
+  | (?P<quote>")
+  | (?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<ident>[A-Za-z_][\w-]*)
+  | (?P<op>==|!=|<=|>=|=>|&&|\|\||\.\.\.)
+  | (?P<punct>[{}\[\]()=,])
+  | (?P<open_comment>/\*)
+  | (?P<other>.)
+''', re.VERBOSE | re.DOTALL)
+# Only what matters for bracket structure. The leading character class skips identifiers,
+# numbers and whitespace in one step; every character it stops at matches an alternative.
+STRUCTURE = re.compile(r'''
+    [^"{}\[\]()\#/<]*
+  (?:
+    (?P<quote>")
+  | (?P<comment>\#[^\n]*|//[^\n]*|/\*.*?\*/)
+  | (?P<heredoc><<-?(?P<marker>[A-Za-z_][\w-]*)[ \t]*\r?\n)
+  | (?P<punct>[{}\[\]()])
+  | (?P<open_comment>/\*)
+  | (?P<other>[/<])
+  )
+''', re.VERBOSE | re.DOTALL)
+# Literal text of a quoted string or heredoc, up to its end or the next ${ / %{
+QUOTED_TEXT = re.compile(r'(?:[^"\\$%\n]|\\[^\n]|\$\$\{|%%\{|[$%](?!\{))*')
+HEREDOC_TEXT = re.compile(r'(?:[^$%]|\$\$\{|%%\{|[$%](?!\{))*')
+HEREDOC_START = re.compile(r'<<-?([A-Za-z_][\w-]*)[ \t]*\r?$')
+TOP_LEVEL_HEADER = re.compile(r'^(?:resource|data|provider|variable|output|module|terraform|locals)\b', re.MULTILINE)
+
+OPENERS = {"{": "}", "[": "]", "(": ")"}
+CLOSERS = set(OPENERS.values())
+
+
+class _Lexer:
+    """Tokenizes HCL code; strings and heredocs, with their interpolations, become single tokens.
+
+    Every character is matched once, so lexing is linear in the input. In
+    strict mode the first unterminated string, heredoc, comment or
+    interpolation raises HclSyntaxError; otherwise it is cut off at a
+    sensible point (end of line or input) and lexing carries on.
+    """
+
+    def __init__(self, text, strict=True):
+        self.text = text
+        self.strict = strict
+
+    def _fail(self, message, pos, fallback):
+        if self.strict:
+            raise HclSyntaxError(message, self.text, pos)
+        return fallback
+
+    def _line_end(self, pos, endpos):
+        end = self.text.find("\n", pos, endpos)
+        return endpos if end == -1 else end
+
+    def tokens(self, pos, endpos):
+        text = self.text
+        while pos < endpos:
+            match = CODE_TOKEN.match(text, pos, endpos)
+            kind, start, end = match.lastgroup, pos, match.end()
+            if kind == "quote":
+                kind, end = "string", self._string_end(start, endpos)
+            elif kind == "heredoc":
+                end = self._heredoc_end(match, endpos)
+            elif kind == "open_comment":
+                kind, end = "comment", self._fail("unterminated /* comment", start, endpos)
+            yield kind, text[start:end], start, end
+            pos = end
+
+    def brackets(self, pos, endpos):
+        """Yield (bracket, offset) for brackets outside strings, heredocs and comments."""
+        text = self.text
+        while True:
+            match = STRUCTURE.search(text, pos, endpos)
+            if match is None:
+                return
+            kind, pos = match.lastgroup, match.end()
+            start = match.start(kind)
+            if kind == "punct":
+                yield match.group(kind), start
+            elif kind == "quote":
+                pos = self._string_end(start, endpos)
+            elif kind == "heredoc":
+                pos = self._heredoc_end(match, endpos)
+            elif kind == "open_comment":
+                pos = self._fail("unterminated /* comment", start, endpos)
+
+    def _string_end(self, start, endpos):
+        pos = start + 1
+        while True:
+            pos = QUOTED_TEXT.match(self.text, pos, endpos).end()
+            ch = self.text[pos] if pos < endpos else ""
+            if ch == '"':
+                return pos + 1
+            if ch in ("$", "%"):
+                pos = self._interpolation_end(pos, endpos)
+                continue
+            return self._fail("unterminated string", start, pos)
+
+    def _heredoc_end(self, match, endpos):
+        marker = match.group("marker")
+        closing = re.compile(r'^[ \t]*' + re.escape(marker) + r'[ \t]*\r?$', re.MULTILINE)
+        terminator = closing.search(self.text, match.end(), endpos)
+        if terminator is None:
+            return self._fail(f"unterminated heredoc, no closing {marker} line", match.start("heredoc"), endpos)
+        pos, body_end = match.end(), terminator.start()
+        while True:
+            pos = HEREDOC_TEXT.match(self.text, pos, body_end).end()
+            if pos >= body_end:
+                return terminator.end()
+            pos = self._interpolation_end(pos, body_end)
+
+    def _interpolation_end(self, pos, endpos):
+        """Offset just past the } closing the ${ or %{ at pos."""
+        depth = 0
+        for bracket, start in self.brackets(pos + 2, endpos):
+            if bracket == "{":
+                depth += 1
+            elif bracket == "}":
+                if depth == 0:
+                    return start + 1
+                depth -= 1
+        return self._fail(f"unclosed {self.text[pos:pos + 2]}...}} interpolation", pos, self._line_end(pos, endpos))
+
+
+def lex(text: str, pos=0, endpos=None, strict=True):
+    """Yield (kind, value, start, end) for every token in text[pos:endpos].
+
+    Kinds: newline, ws, comment, string, heredoc, number, ident, op, punct
+    and other. Strings and heredocs are single tokens, interpolations included.
+    """
+    return _Lexer(text, strict).tokens(pos, len(text) if endpos is None else endpos)
+
+
+def find_syntax_error(text: str):
+    """Return the first structural HclSyntaxError in text, or None if it is well formed."""
+    stack = []  # (opener, offset)
+    try:
+        for value, start in _Lexer(text).brackets(0, len(text)):
+            if value in OPENERS:
+                stack.append((value, start))
+            elif value in CLOSERS:
+                if not stack:
+                    return HclSyntaxError(f"unexpected '{value}' with nothing open", text, start)
+                opener, opened_at = stack.pop()
+                if OPENERS[opener] != value:
+                    where = HclSyntaxError("", text, opened_at)
+                    return HclSyntaxError(f"expected '{OPENERS[opener]}' to close '{opener}' from line "
+                                          f"{where.line}, column {where.column}, found '{value}'", text, start)
+    except HclSyntaxError as e:
+        return e
+    if stack:
+        opener, opened_at = stack[-1]
+        return HclSyntaxError(f"'{opener}' is never closed", text, opened_at)
+    return None
+
+
+def close_unclosed(text: str, limit=None):
+    """Append the closing brackets text is missing at the end, if that is its only problem.
+
+    Returns the repaired text, or None when the error is anything else
+    (a stray or mismatched bracket, an unterminated string...) or more than
+    `limit` brackets are missing.
+    """
+    stack = []
+    try:
+        for value, start in _Lexer(text).brackets(0, len(text)):
+            if value in OPENERS:
+                stack.append(value)
+            elif value in CLOSERS:
+                if not stack or OPENERS[stack.pop()] != value:
+                    return None
+    except HclSyntaxError:
+        return None
+    if not stack:
+        return text
+    if limit is not None and len(stack) > limit:
+        return None
+    closing = "\n".join("  " * depth + OPENERS[opener] for depth, opener in reversed(list(enumerate(stack))))
+    return text.rstrip() + "\n" + closing + "\n"
+
+
+class Attribute:
+    """An `name = value` line inside a block; offsets index into the source text."""
+
+    __slots__ = ("name", "start", "end", "value_start", "value_end")
+
+    def __init__(self, name, start, end, value_start, value_end):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.value_start = value_start
+        self.value_end = value_end
+
+    def value(self, text):
+        return text[self.value_start:self.value_end]
+
+    def shift(self, delta):
+        self.start += delta
+        self.end += delta
+        self.value_start += delta
+        self.value_end += delta
+
+
+class Block:
+    """A `type "label" ... { }` block; `end` is the offset just past the closing brace."""
+
+    __slots__ = ("type", "labels", "start", "end", "body_start", "body_end", "attributes", "blocks")
+
+    def __init__(self, type, labels, start, body_start):
+        self.type = type
+        self.labels = labels
+        self.start = start
+        self.body_start = body_start
+        self.body_end = None
+        self.end = None
+        self.attributes = {}
+        self.blocks = []
+
+    @property
+    def key(self):
+        return (self.type, *self.labels)
+
+    @property
+    def address(self):
+        if self.type == "resource" and len(self.labels) == 2:
+            return ".".join(self.labels)
+        if self.type == "variable":
+            return ".".join(["var", *self.labels])
+        return ".".join(self.key)
+
+    def find_block(self, block_type):
+        """First nested block of the given type, e.g. `os_disk`."""
+        for block in self.blocks:
+            if block.type == block_type:
+                return block
+        return None
+
+    def text(self, text):
+        return text[self.start:self.end]
+
+    def shift(self, delta):
+        """Move the block and everything inside it by `delta` characters."""
+        self.start += delta
+        self.body_start += delta
+        if self.end is not None:
+            self.end += delta
+            self.body_end += delta
+        for attribute in self.attributes.values():
+            attribute.shift(delta)
+        for block in self.blocks:
+            block.shift(delta)
+
+
+def error_region(text: str, pos):
+    """(start, end) offsets of the top-level block around an error offset.
+
+    Brackets can't be trusted near a syntax error, so the region runs from
+    the last block header at column 0 before pos up to the next one.
+    """
+    starts = [match.start() for match in TOP_LEVEL_HEADER.finditer(text)]
+    i = bisect_right(starts, pos) - 1
+    start = starts[i] if i >= 0 else 0
+    end = starts[i + 1] if i + 1 < len(starts) else len(text)
+    return start, end
+
+
+def _tokens(text, pos=0, endpos=None):
+    for token in lex(text, pos, endpos, strict=False):
+        if token[0] not in ("ws", "comment"):
+            yield token
+
+
+def parse_blocks(text: str, pos=0, endpos=None):
+    """Parse the block structure of HCL text in a single pass.
+
+    Returns the top-level blocks found in text[pos:endpos], with offsets into
+    the full text. Unterminated blocks are left with `end` set to None; stray
+    closing braces are ignored.
+    """
+    top_level = []
+    stack = []
+    tokens = _tokens(text, pos, endpos)
+    line_start = True
+    header = []  # tokens seen since the start of the current statement
+
+    for kind, value, start, end in tokens:
+        if kind == "newline":
+            line_start = True
+            header = []
+            continue
+
+        if line_start and kind == "punct" and value == "}":
+            if stack:
+                block = stack.pop()
+                block.body_end = start
+                block.end = end
+            continue
+
+        if value == "=" and len(header) == 1 and header[0][0] == "ident":
+            # Attribute: the value runs to the end of the line, or further while brackets are open
+            name, name_start = header[0][1], header[0][2]
+            value_start = value_end = None
+            closes_block = None
+            depth = 0
+            for kind, value, start, end in tokens:
+                if kind == "newline" and depth == 0:
+                    break
+                if kind == "newline":
+                    continue
+                if value == "}" and depth == 0:
+                    # One-line block such as `features { enabled = true }`
+                    closes_block = (start, end)
+                    break
+                if value_start is None:
+                    value_start = start
+                value_end = end
+                if value in OPENERS:
+                    depth += 1
+                elif value in CLOSERS:
+                    depth -= 1
+            if value_start is None:
+                value_start = value_end = end
+            if stack:
+                stack[-1].attributes[name] = Attribute(name, name_start, value_end, value_start, value_end)
+                if closes_block:
+                    block = stack.pop()
+                    block.body_end, block.end = closes_block
+            line_start = True
+            header = []
+            continue
+
+        if value == "{" and header and header[0][0] == "ident" \
+                and all(k in ("ident", "string") for k, _, _, _ in header):
+            labels = [v[1:-1] if k == "string" else v for k, v, _, _ in header[1:]]
+            block = Block(header[0][1], labels, header[0][2], end)
+            (stack[-1].blocks if stack else top_level).append(block)
+            stack.append(block)
+            line_start = True
+            header = []
+            continue
+
+        header.append((kind, value, start, end))
+        line_start = False
+
+    return top_level
+
+
+def _count_based_check(text):
+    # The check validate_terraform_syntax used to do, kept for comparison in the benchmark
+    return text.count("{") == text.count("}") and text.count('"') % 2 == 0
+
+
+def bench(text, repeat=5):
+    """Time lexing, validation and block parsing of text; returns {name: (seconds, MB/s)}."""
+    import time
+
+    size_mb = len(text.encode("utf-8")) / 1024 / 1024
+    results = {}
+    for name, func in (("lex", lambda: sum(1 for _ in lex(text))),
+                       ("find_syntax_error", lambda: find_syntax_error(text)),
+                       ("parse_blocks", lambda: parse_blocks(text)),
+                       ("HclScanner (streaming)", lambda: HclScanner().feed(text)),
+                       ("count-based check (old)", lambda: _count_based_check(text))):
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - started)
+        results[name] = (best, size_mb / best if best else float("inf"))
+    return results
+
+
+def main(argv):
+    usage = "Usage: python -m modules.hcl_lexer [check <file> | bench [<file>] [--copies N]]"
+    if argv[:1] == ["check"] and argv[1:]:
+        with open(argv[1], "r", encoding="utf-8") as f:
+            error = find_syntax_error(f.read())
+        print(f"❌ {argv[1]}: {error}" if error else f"✅ {argv[1]}: no structural errors")
+        return 1 if error else 0
+    if argv[:1] == ["bench"]:
+        args = argv[1:]
+        copies = 2000
+        if "--copies" in args:
+            i = args.index("--copies")
+            copies = int(args[i + 1])
+            del args[i:i + 2]
+        path = args[0] if args else os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "hcl", "main.tf")
+        with open(path, "r", encoding="utf-8") as f:
+            sample = f.read()
+        # Renumber block labels so the copies form one valid, large configuration
+        text = "\n".join(re.sub(r'^(\w+\s+"[^"]+"\s+")([^"]+)"', lambda m, i=i: f'{m.group(1)}{m.group(2)}_{i}"',
+                                sample, flags=re.MULTILINE) for i in range(copies))
+        print(f"{path} x {copies}: {len(text) / 1024 / 1024:.1f} MB, {text.count(chr(10))} lines")
+        for name, (seconds, rate) in bench(text).items():
+            print(f"  {name:<24} {seconds * 1000:9.1f} ms  {rate:8.1f} MB/s")
+        return 0
+    print(usage)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
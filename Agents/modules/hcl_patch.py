@@ -0,0 +1,147 @@
+# modules/hcl_patch.py
+
+import json
+import re
+
+from modules.terraform_io import BlockIndex
+
+PATCH_OPS = ("set", "unset", "replace", "insert", "delete")
+
+
+class PatchError(ValueError):
+    pass
+
+
+def parse_patch(raw_response: str):
+    """Extract the list of patch operations from an LLM response."""
+    text = re.sub(r'```\w*', '', raw_response)
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end < start:
+        raise PatchError("No JSON patch found in response")
+    try:
+        ops = json.loads(text[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise PatchError(f"Invalid JSON patch: {e}")
+
+    if not isinstance(ops, list):
+        raise PatchError("Patch must be a JSON list of operations")
+    for op in ops:
+        if not isinstance(op, dict) or op.get("op") not in PATCH_OPS:
+            raise PatchError(f"Unsupported patch operation: {op}")
+    return ops
+
+
+def _line_start(content, pos):
+    return content.rfind("\n", 0, pos) + 1
+
+
+def _line_end(content, pos):
+    end = content.find("\n", pos)
+    return len(content) if end == -1 else end + 1
+
+
+def _indent_of(content, pos):
+    return re.match(r'[ \t]*', content[_line_start(content, pos):]).group()
+
+
+def _find(index, address):
+    block = index.find(address or "")
+    if block is None or block.end is None:
+        raise PatchError(f"Block not found: {address}")
+    return block
+
+
+def _target_block(index, op):
+    block = _find(index, op.get("address"))
+    if not op.get("attribute"):
+        raise PatchError(f"{op['op']} needs 'attribute'")
+
+    # Walk dotted attribute paths into nested blocks, e.g. os_disk.disk_size_gb
+    path = op["attribute"].split(".")
+    for name in path[:-1]:
+        nested = block.find_block(name)
+        if nested is None:
+            raise PatchError(f"Nested block '{name}' not found in {op['address']}")
+        block = nested
+    return block, path[-1]
+
+
+def apply_operation(index: BlockIndex, op: dict):
+    """Apply one patch operation to the indexed content in place."""
+    kind = op["op"]
+    content = index.content
+
+    if kind in ("insert", "replace"):
+        new_block = op.get("content", "").strip()
+        if not new_block:
+            raise PatchError(f"{kind} needs 'content'")
+
+    if kind == "insert":
+        if op.get("after"):
+            anchor = _find(index, op["after"])
+            index.replace_span(anchor.end, anchor.end, "\n\n" + new_block)
+        else:
+            index.append_block(new_block)
+        return
+
+    if kind == "replace":
+        block = _find(index, op.get("address"))
+        index.replace_span(block.start, block.end, new_block)
+        return
+
+    if kind == "delete":
+        block = _find(index, op.get("address"))
+        # Drop the block together with the blank line that separated it
+        end = _line_end(content, block.end)
+        if content[end:end + 1] == "\n":
+            end += 1
+        index.replace_span(block.start, end, "")
+        return
+
+    block, name = _target_block(index, op)
+    attribute = block.attributes.get(name)
+
+    if kind == "unset":
+        if attribute is None:
+            raise PatchError(f"Attribute '{name}' not found in {op['address']}")
+        index.replace_span(_line_start(content, attribute.start), _line_end(content, attribute.end), "")
+        return
+
+    if "value" not in op:
+        raise PatchError("set needs 'value'")
+    value = op["value"]
+    if not isinstance(value, str):
+        # Plain JSON values map directly onto HCL literals
+        value = json.dumps(value)
+    if attribute is not None:
+        index.set_attribute_value(attribute, value)
+        return
+
+    # New attribute: add it as the last line of the block
+    closing_line = _line_start(content, block.body_end)
+    if content[closing_line:block.body_end].strip():
+        # One-line block such as `features {}`
+        index.replace_span(block.body_end, block.body_end, f" {name} = {value} ")
+        return
+    indent = _indent_of(content, block.start) + "  "
+    index.replace_span(closing_line, closing_line, f"{indent}{name} = {value}\n")
+
+
+def apply_patch(content: str, ops) -> str:
+    """Apply patch operations in order, returning the updated file content."""
+    index = BlockIndex(content)
+    for op in ops:
+        apply_operation(index, op)
+    return index.content
+
+
+def describe_patch(ops) -> str:
+    lines = []
+    for op in ops:
+        target = op.get("address") or op.get("after") or "end of file"
+        if op.get("attribute"):
+            target += f".{op['attribute']}"
+        value = op.get("value")
+        detail = f" = {value if isinstance(value, str) else json.dumps(value)}" if op["op"] == "set" else ""
+        lines.append(f"  {op['op']:<8} {target}{detail}")
+    return "\n".join(lines)
@@ -0,0 +1,73 @@
+# modules/json_scan.py
+
+import re
+
+# A JSON string (without its closing quote when cut off at the end of the buffer) or a bracket
+TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*(?P<close>")?|[{}\[\]]')
+CHUNK_SIZE = 1 << 20
+
+
+def iter_array_items(stream, key: str, chunk_size=CHUNK_SIZE):
+    """Yield (start, end, raw_bytes) for each element of a top-level array in a JSON stream.
+
+    `stream` is any binary file-like object (a file, or a pipe from
+    `terraform show -json`). Only brackets and strings are tokenized, by a
+    regex, so the document is never decoded as a whole; memory use is one
+    chunk plus the element being yielded. Offsets are byte offsets into the
+    stream, so a file can later be re-read at exactly one element.
+    """
+    key_token = b'"' + key.encode() + b'"'
+    buffer = b""
+    base = 0  # stream offset of buffer[0]
+    pos = 0
+    depth = 0
+    last_key = None  # last string seen directly inside the top-level object
+    in_target = False
+    item_start = None
+
+    while True:
+        chunk = stream.read(chunk_size)
+        at_eof = not chunk
+        buffer += chunk
+
+        while True:
+            match = TOKEN.search(buffer, pos)
+            if match is None:
+                pos = len(buffer)
+                break
+            token = match.group()
+            if token[:1] == b'"' and match.group("close") is None and not at_eof:
+                # String continues in the next chunk; re-scan it from its opening quote
+                pos = match.start()
+                break
+            pos = match.end()
+
+            if token[:1] == b'"':
+                if depth == 1:
+                    last_key = token
+                continue
+
+            if token in (b"{", b"["):
+                depth += 1
+                if depth == 2 and token == b"[" and last_key == key_token:
+                    in_target = True
+                elif in_target and depth == 3:
+                    item_start = base + match.start()
+            else:
+                depth -= 1
+                if in_target and depth == 2 and item_start is not None:
+                    end = base + match.end()
+                    yield item_start, end, buffer[item_start - base:end - base]
+                    item_start = None
+                elif in_target and depth == 1:
+                    return
+
+        if at_eof:
+            return
+
+        # Keep only what is still needed: the open element, or the unscanned tail
+        keep_from = min(pos, item_start - base) if item_start is not None else pos
+        buffer = buffer[keep_from:]
+        base += keep_from
+        pos -= keep_from
+
@@ -0,0 +1,123 @@
+# modules/llm_cache.py
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+
+
+def normalize_task(task: str) -> str:
+    """Normalize whitespace so reflowed or padded task text shares a cache entry.
+
+    Case and punctuation are kept: "set tag Owner=Alice" is not "set tag owner=alice".
+    """
+    return re.sub(r'\s+', ' ', task).strip()
+
+
+class LLMCache:
+    """Content-addressed on-disk cache for LLM generations.
+
+    Entries are JSON files named by the SHA-256 of everything that determines
+    the response: config contents, normalized task, model and prompt template
+    version. An entry's mtime is its creation time and its atime its last
+    use (set on every hit). Entries expire max_age_days after they were
+    created, however often they are hit, and beyond that eviction is
+    least-recently-used, bounded by entry count and total size.
+    """
+
+    def __init__(self, cache_dir, max_entries=500, max_bytes=50 * 1024 * 1024,
+                 max_age_days=30, enabled=True):
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self.enabled = enabled and os.environ.get("TF_ASSISTANT_NO_CACHE") != "1"
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, kind, config, task, model, template_version, extra=""):
+        digest = hashlib.sha256()
+        for part in (kind, model, str(template_version), normalize_task(task), extra, config):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key):
+        """Return the cached response, or None on a miss (or when bypassed)."""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            created = entry.get("created") or path.stat().st_mtime
+            if time.time() - created > self.max_age:
+                path.unlink()
+                raise FileNotFoundError
+            os.utime(path, (time.time(), path.stat().st_mtime))  # mark as recently used, keep the creation time
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry["response"]
+
+    def put(self, key, response, kind=""):
+        if not self.enabled:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # A unique temp file per writer, so concurrent puts of one key never share it
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{key}.", suffix=".tmp", dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"kind": kind, "created": time.time(), "response": response}, f)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.evict()
+
+    def _entries(self):
+        entries = []
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_atime, stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self):
+        """Drop entries older than max_age, then the least recently used until within limits."""
+        now = time.time()
+        entries = []
+        for used, created, size, path in self._entries():
+            if now - created > self.max_age:
+                path.unlink(missing_ok=True)
+            else:
+                entries.append((used, size, path))
+
+        total = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > self.max_entries or total > self.max_bytes):
+            _, size, path = entries.pop(0)
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self):
+        for *_, path in self._entries():
+            path.unlink(missing_ok=True)
+
+    def stats(self):
+        entries = self._entries() if self.cache_dir.exists() else []
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(size for _, _, size, _ in entries),
+        }
@@ -0,0 +1,225 @@
+# modules/llm_client.py
+"""Shared Ollama client: pooled keep-alive connections, background model preload and keep-warm pings.
+
+OLLAMA_HOST picks the server (default http://127.0.0.1:11434) and
+OLLAMA_KEEP_ALIVE how long Ollama keeps the model loaded after a request.
+Every request records an `llm_request` span (with Ollama's load time, so
+cold starts stand out) and streamed requests an `llm_first_token` span.
+"""
+
+import http.client
+import json
+import os
+import threading
+import time
+from typing import Any, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+from modules.metrics import metrics
+
+DEFAULT_HOST = "http://127.0.0.1:11434"
+KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+KEEP_WARM_INTERVAL = 240  # Seconds of idle time between keep-warm pings; 0 disables them
+POOL_SIZE = 4  # Idle connections kept open per client
+TIMEOUT = 600
+
+
+class OllamaError(Exception):
+    pass
+
+
+class OllamaClient:
+    """Minimal Ollama HTTP client reusing connections across requests and threads."""
+
+    def __init__(self, model, host=None, keep_alive=KEEP_ALIVE, pool_size=POOL_SIZE, timeout=TIMEOUT):
+        url = host or os.environ.get("OLLAMA_HOST") or DEFAULT_HOST
+        parts = urlsplit(url if "://" in url else f"http://{url}")
+        self.model = model
+        self.keep_alive = keep_alive
+        self.https = parts.scheme == "https"
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or (443 if self.https else 11434)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.last_used = 0.0
+        self.loaded = threading.Event()
+        self._idle = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._keep_warm = None
+
+    def _connection(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return connection_class(self.host, self.port, timeout=self.timeout), False
+
+    def _release(self, connection):
+        with self._lock:
+            if len(self._idle) < self.pool_size and not self._stop.is_set():
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def _post(self, path, payload):
+        """Send a request; a pooled connection the server has since closed is retried on a fresh one."""
+        body = json.dumps(payload).encode("utf-8")
+        while True:
+            connection, reused = self._connection()
+            try:
+                connection.request("POST", path, body, {"Content-Type": "application/json"})
+                response = connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionError) as e:
+                connection.close()
+                if reused:
+                    continue
+                raise OllamaError(f"Cannot reach Ollama at {self.host}:{self.port}: {e}") from e
+            except OSError as e:
+                connection.close()
+                raise OllamaError(f"Cannot reach Ollama at {self.host}:{self.port}: {e}") from e
+            if response.status != 200:
+                detail = response.read().decode("utf-8", errors="replace")
+                connection.close()
+                raise OllamaError(f"Ollama returned HTTP {response.status}: {detail[:300]}")
+            return connection, response, reused
+
+    def generate(self, prompt, stop=None, options=None) -> Iterator[str]:
+        """Stream the response text of one generation, chunk by chunk."""
+        payload = {"model": self.model, "prompt": prompt, "stream": True, "keep_alive": self.keep_alive}
+        options = dict(options or {})
+        if stop:
+            options["stop"] = stop
+        if options:
+            payload["options"] = options
+
+        started = time.perf_counter()
+        self.last_used = time.monotonic()
+        connection, response, reused = self._post("/api/generate", payload)
+        first_token = None
+        final = {}
+        try:
+            for line in response:
+                if not line.strip():
+                    continue
+                message = json.loads(line)
+                if "error" in message:
+                    raise OllamaError(message["error"])
+                text = message.get("response", "")
+                if text and first_token is None:
+                    first_token = time.perf_counter() - started
+                    metrics.record("llm_first_token", first_token, model=self.model, reused_connection=reused)
+                if text:
+                    yield text
+                if message.get("done"):
+                    final = message
+                    response.read()  # the end of the chunked body, so the connection can be reused
+                    break
+        finally:
+            self.last_used = time.monotonic()
+            if final:
+                self.loaded.set()
+                self._release(connection)
+            else:
+                # Stopped early (or failed): the rest of the stream is unread, so the connection can't be reused
+                connection.close()
+            metrics.record("llm_request", time.perf_counter() - started, "ok" if final else "aborted",
+                           model=self.model, reused_connection=reused,
+                           load_seconds=round(final.get("load_duration", 0) / 1e9, 3),
+                           prompt_tokens=final.get("prompt_eval_count"), response_tokens=final.get("eval_count"))
+
+    def load(self):
+        """Ask Ollama to load the model (an empty generate request) and keep it for keep_alive."""
+        with metrics.span("llm_preload", model=self.model) as span:
+            connection, response, _ = self._post("/api/generate", {"model": self.model, "keep_alive": self.keep_alive,
+                                                                   "stream": False})
+            result = json.loads(response.read() or b"{}")
+            self._release(connection)
+            span.set(load_seconds=round(result.get("load_duration", 0) / 1e9, 3))
+        self.loaded.set()
+        self.last_used = time.monotonic()
+
+    def preload(self):
+        """Load the model in a background thread, so the first request doesn't pay for it."""
+        thread = threading.Thread(target=self._quietly, args=(self.load,), name="ollama-preload", daemon=True)
+        thread.start()
+        return thread
+
+    def start_keep_warm(self, interval=KEEP_WARM_INTERVAL):
+        """Re-load the model whenever it has been idle for `interval` seconds."""
+        if not interval or self._keep_warm is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                if time.monotonic() - self.last_used >= interval:
+                    self._quietly(self.load)
+
+        self._keep_warm = threading.Thread(target=loop, name="ollama-keep-warm", daemon=True)
+        self._keep_warm.start()
+
+    @staticmethod
+    def _quietly(func):
+        # Background loads are best effort; the next real request reports any problem
+        try:
+            func()
+        except (OllamaError, OSError, ValueError):
+            pass
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(model, host=None) -> OllamaClient:
+    """The process-wide client for a model, so every caller shares one connection pool."""
+    key = (model, host or os.environ.get("OLLAMA_HOST") or DEFAULT_HOST)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = OllamaClient(model, host)
+    return _clients[key]
+
+
+class PooledOllama(LLM):
+    """LangChain LLM backed by the shared OllamaClient."""
+
+    model: str = "llama3"
+    host: Optional[str] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "ollama-pooled"
+
+    @property
+    def client(self) -> OllamaClient:
+        return get_client(self.model, self.host)
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None,
+                **kwargs: Any) -> Iterator[GenerationChunk]:
+        for text in self.client.generate(prompt, stop=stop, options=kwargs.get("options")):
+            if run_manager:
+                run_manager.on_llm_new_token(text)
+            yield GenerationChunk(text=text)
+
+
+def ollama_llm(model="llama3", preload=True, keep_warm=True) -> PooledOllama:
+    """Build the LLM for an entry point, starting the model preload and keep-warm pings."""
+    llm = PooledOllama(model=model)
+    if preload:
+        llm.client.preload()
+    if keep_warm:
+        llm.client.start_keep_warm()
+    return llm
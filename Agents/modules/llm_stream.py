@@ -0,0 +1,115 @@
+# modules/llm_stream.py
+
+import re
+
+from modules.hcl_context import DELETE_MARKER
+from modules.hcl_lexer import HclScanner
+from modules.metrics import metrics
+
+BLOCK_START = re.compile(r'^\s*(resource|provider|variable|output|module|data|terraform|locals)\b')
+FENCE = re.compile(r'```\w*')
+COMMENT = re.compile(r'^\s*(#|//|/\*|\*)')
+# A sentence of plain English, e.g. "Note: I increased the disk size."
+PROSE = re.compile(r'^\s*[A-Z][A-Za-z\']*:?(\s+[^\s=]+){3,}\s*$')
+
+
+class ResponseCleaner:
+    """Extracts HCL from an LLM response line by line as it streams in.
+
+    The same cleaner is used for streamed and for already complete responses,
+    so there is no second pass over the full text. `feed` returns False once
+    the response should be cut off, with the reason left in `stop_reason`.
+    """
+
+    def __init__(self, max_chars=None, on_progress=None):
+        self.max_chars = max_chars
+        self.on_progress = on_progress
+        self.scanner = HclScanner()
+        self.lines = []
+        self.total_lines = 0
+        self.chars = 0
+        self.started = False
+        self.stop_reason = None
+        self.malformed = False
+        self._pending = ""
+
+    def feed(self, chunk: str) -> bool:
+        if self.stop_reason:
+            return False
+        self._pending += chunk
+        while "\n" in self._pending and not self.stop_reason:
+            line, self._pending = self._pending.split("\n", 1)
+            self._process_line(line)
+        return self.stop_reason is None
+
+    def finish(self) -> str:
+        if self._pending and not self.stop_reason:
+            self._process_line(self._pending)
+        self._pending = ""
+        return "\n".join(self.lines).strip()
+
+    def _stop(self, reason, malformed=False):
+        self.stop_reason = reason
+        self.malformed = malformed
+
+    def _process_line(self, line):
+        self.total_lines += 1
+        if self.scanner.heredoc is not None:
+            # Heredoc bodies are free text (scripts, cloud-init, plain sentences): keep them verbatim
+            if line.strip() == "```":
+                self._stop("code block closed inside a heredoc", malformed=True)
+                return
+            self._keep(line)
+            return
+
+        fence = FENCE.search(line)
+        line = FENCE.sub("", line)
+        stripped = line.strip()
+
+        if not self.started:
+            if BLOCK_START.match(line) or DELETE_MARKER.match(line):
+                self.started = True
+            else:
+                # Skip explanatory text and blank lines before the first block
+                return
+        elif fence and self.scanner.depth > 0 and not self.scanner.in_literal:
+            # The model closed its code block; the rest of the line ("}```") may still close the open block
+            if stripped:
+                self._keep(line)
+            if not self.stop_reason and (self.scanner.depth > 0 or self.scanner.in_literal):
+                self._stop("code block closed with unbalanced braces", malformed=True)
+            return
+        elif self.scanner.depth == 0 and not self.scanner.in_literal:
+            if stripped and not BLOCK_START.match(line) and not COMMENT.match(line) \
+                    and not any(char in stripped for char in '{}'):
+                # Configuration is complete and the model moved on to explanations
+                self._stop("explanatory text after configuration")
+                return
+        elif not self.scanner.in_literal and PROSE.match(line) \
+                and not any(char in stripped for char in '{}[]"'):
+            self._stop("explanatory text inside an open block", malformed=True)
+            return
+        self._keep(line)
+
+    def _keep(self, line):
+        self.lines.append(line)
+        self.chars += len(line) + 1
+        self.scanner.feed(line + "\n")
+
+        if self.scanner.min_depth < 0:
+            self._stop(f"unmatched closing brace on line {len(self.lines)}", malformed=True)
+        elif self.max_chars and self.chars > self.max_chars:
+            self._stop(f"response exceeded {self.max_chars} characters", malformed=True)
+
+        if self.on_progress:
+            self.on_progress(self)
+
+
+def clean_response(raw_response: str) -> str:
+    """Clean a complete (non-streamed) LLM response."""
+    with metrics.span("clean", streamed=False, bytes=len(raw_response)) as span:
+        cleaner = ResponseCleaner()
+        cleaner.feed(raw_response)
+        result = cleaner.finish()
+        span.set(lines=len(cleaner.lines), total_lines=cleaner.total_lines)
+    return result
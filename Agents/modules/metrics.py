@@ -0,0 +1,190 @@
+# modules/metrics.py
+"""Timing spans for each stage of a request (LLM, clean, validate, init, plan, ...).
+
+Every finished span is appended to metrics.jsonl and the per-stage totals of
+the session are rewritten to metrics.prom in the Prometheus text format, so
+the node_exporter textfile collector can pick them up.
+
+    python modules/metrics.py summary [path/to/metrics.jsonl]
+"""
+
+import json
+import math
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+JSONL_FILE = "metrics.jsonl"
+PROM_FILE = "metrics.prom"
+PROM_PREFIX = "tf_assistant_stage"
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q * len(ordered)) - 1, 0)]
+
+
+class Span:
+    """One timed stage; use as a context manager and add attributes with set()."""
+
+    def __init__(self, recorder, stage, attrs):
+        self.recorder = recorder
+        self.stage = stage
+        self.attrs = attrs
+        self.outcome = "ok"
+        self.started = None
+
+    def set(self, outcome=None, **attrs):
+        if outcome is not None:
+            self.outcome = outcome
+        self.attrs.update(attrs)
+        return self
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.outcome == "ok":
+            self.outcome = "cancelled" if exc_type.__name__ in ("CancelledByUser", "KeyboardInterrupt") else "error"
+            self.attrs.setdefault("error", f"{exc_type.__name__}: {exc}"[:200])
+        self.recorder.record(self.stage, self.elapsed, self.outcome, **self.attrs)
+
+
+class Metrics:
+    """Collects spans for this session and exports them to `directory` (in memory only when None)."""
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.session = f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}"
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def configure(self, directory):
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def jsonl_path(self):
+        return os.path.join(self.directory, JSONL_FILE) if self.directory else None
+
+    def span(self, stage, **attrs) -> Span:
+        return Span(self, stage, attrs)
+
+    def record(self, stage, seconds, outcome="ok", **attrs):
+        entry = {"ts": datetime.now().isoformat(timespec="milliseconds"), "session": self.session,
+                 "stage": stage, "seconds": round(seconds, 6), "outcome": outcome}
+        entry.update(attrs)
+        with self._lock:
+            self.spans.append(entry)
+            if self.directory:
+                try:
+                    with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(entry, default=str) + "\n")
+                    self._write_prometheus()
+                except OSError:
+                    pass  # Metrics must never break a request
+        return entry
+
+    def _write_prometheus(self):
+        stages = {}
+        for span in self.spans:
+            stages.setdefault(span["stage"], []).append(span)
+
+        lines = [f"# HELP {PROM_PREFIX}_seconds Duration of assistant stages in this session",
+                 f"# TYPE {PROM_PREFIX}_seconds summary"]
+        for stage, spans in sorted(stages.items()):
+            seconds = [s["seconds"] for s in spans]
+            for q in (0.5, 0.95):
+                lines.append(f'{PROM_PREFIX}_seconds{{stage="{stage}",quantile="{q}"}} {percentile(seconds, q):.6f}')
+            lines.append(f'{PROM_PREFIX}_seconds_sum{{stage="{stage}"}} {sum(seconds):.6f}')
+            lines.append(f'{PROM_PREFIX}_seconds_count{{stage="{stage}"}} {len(seconds)}')
+        lines += [f"# HELP {PROM_PREFIX}_outcomes_total Finished stages by outcome",
+                  f"# TYPE {PROM_PREFIX}_outcomes_total counter"]
+        for stage, spans in sorted(stages.items()):
+            outcomes = {}
+            for s in spans:
+                outcomes[s["outcome"]] = outcomes.get(s["outcome"], 0) + 1
+            for outcome, count in sorted(outcomes.items()):
+                lines.append(f'{PROM_PREFIX}_outcomes_total{{stage="{stage}",outcome="{outcome}"}} {count}')
+
+        # Write then rename, so a scraper never reads half a file
+        path = os.path.join(self.directory, PROM_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(path + ".tmp", path)
+
+    def traced(self, name, func):
+        """Wrap a LangChain tool function so each call is recorded as a `tool.<name>` span."""
+        def wrapper(tool_input):
+            with self.span(f"tool.{name}", input_chars=len(str(tool_input))) as span:
+                output = func(tool_input)
+                text = str(output)
+                span.set(output_chars=len(text))
+                if text.startswith("[❌]") or text.startswith("Error"):
+                    span.set("error")
+                return output
+        return wrapper
+
+    def summary(self, spans=None) -> str:
+        """p50/p95 per stage for the given spans (default: this session)."""
+        spans = self.spans if spans is None else spans
+        return summarize(spans)
+
+
+def summarize(spans) -> str:
+    if not spans:
+        return "No timings recorded yet."
+    stages = {}
+    for span in spans:
+        stages.setdefault(span["stage"], []).append(span)
+
+    width = max(24, max(len(stage) for stage in stages) + 1)
+    lines = [f"{'Stage':<{width}} {'Count':>6} {'Errors':>6} {'p50':>9} {'p95':>9} {'Total':>9}"]
+    # Slowest stages first, since that's where the time goes
+    for stage, group in sorted(stages.items(), key=lambda item: -sum(s["seconds"] for s in item[1])):
+        seconds = [s["seconds"] for s in group]
+        errors = sum(1 for s in group if s["outcome"] not in ("ok", "skipped", "aborted"))
+        lines.append(f"{stage:<{width}} {len(group):>6} {errors:>6} {percentile(seconds, 0.5):>8.2f}s "
+                     f"{percentile(seconds, 0.95):>8.2f}s {sum(seconds):>8.1f}s")
+    return "\n".join(lines)
+
+
+def load_spans(path):
+    """Read spans from a metrics.jsonl file, skipping lines that aren't valid JSON."""
+    spans = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                spans.append(json.loads(line))
+            except ValueError:
+                continue
+    return spans
+
+
+# Shared by the assistant, the runner and the planner tools
+metrics = Metrics(os.environ.get("TF_ASSISTANT_METRICS_DIR"))
+
+
+def main(argv):
+    if not argv or argv[0] != "summary":
+        print("Usage: python modules/metrics.py summary [metrics.jsonl]")
+        return 2
+    path = argv[1] if len(argv) > 1 else JSONL_FILE
+    if not os.path.exists(path):
+        print(f"[❌] Error: {path} not found")
+        return 1
+    print(summarize(load_spans(path)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,195 @@
+# modules/observations.py
+"""Keeps tool outputs fed back to the agent within a token budget.
+
+Every agent step re-reads the whole scratchpad, so a 3,000-line plan in one
+observation slows down every step after it. Large outputs are compacted
+per tool (plan/apply output to resource-level changes, main.tf to the
+blocks the request is about) and the full text is kept, retrievable with
+the ShowFullOutput tool.
+"""
+
+import os
+import re
+from collections import OrderedDict
+
+from modules.hcl_context import estimate_tokens, select_context
+from modules.hcl_lexer import parse_blocks
+
+TOKEN_BUDGET = int(os.environ.get("TF_ASSISTANT_OBSERVATION_TOKENS", "800"))
+KEEP_OUTPUTS = 20  # Full outputs kept for ShowFullOutput
+PAGE_BUDGET_FACTOR = 4  # ShowFullOutput pages are this many observation budgets long
+
+ANSI = re.compile(r'\x1b\[[0-9;]*m')
+BOX_DRAWING = re.compile(r'^[│╷╵]\s?')
+# "  # azurerm_linux_virtual_machine.vm will be updated in-place"
+CHANGE_HEADER = re.compile(r'^\s*# (\S+) (?:will be|must be) (.+?)\s*$')
+# "      ~ disk_size_gb = 30 -> 40"
+ATTRIBUTE_CHANGE = re.compile(r'^\s*[~+-]\s+("?[\w.-]+"?)\s+=\s+(.+?->.+?)\s*$')
+APPLY_EVENT = re.compile(r'^(\S+): (?:Creation|Modifications|Destruction) complete')
+SUMMARY_LINE = re.compile(r'^(Plan:|Apply complete!|Destroy complete!|No changes\.|Changes to Outputs:|'
+                          r'Terraform has been successfully initialized|Terraform already initialized|'
+                          r'No saved plan|Error running terraform)')
+ISSUE_LINE = re.compile(r'^(Error|Warning):')
+ATTRIBUTES_PER_RESOURCE = 5
+ISSUE_CONTEXT_LINES = 4
+OMITTED_BLOCKS_LISTED = 10
+
+TERRAFORM_TOOLS = {"TerraformInit", "TerraformPlan", "TerraformApply", "TerraformDestroy", "InitAndPlan",
+                   "TerraformPlanThenApply"}
+UNCOMPACTED_TOOLS = {"ShowFullOutput", "ParseRequest"}
+
+
+def summarize_terraform_output(text: str) -> str:
+    """Resource-level changes, apply events, errors and the summary line of terraform output."""
+    lines = [BOX_DRAWING.sub("", ANSI.sub("", line)) for line in text.splitlines()]
+    summary = []
+    attributes = None  # attribute changes still shown for the current resource
+    issue_lines = 0
+    for line in lines:
+        stripped = line.strip()
+        header = CHANGE_HEADER.match(line)
+        if header:
+            summary.append(f"{header.group(1)}: {header.group(2)}")
+            attributes = ATTRIBUTES_PER_RESOURCE
+            issue_lines = 0
+            continue
+        change = ATTRIBUTE_CHANGE.match(line)
+        if change and attributes:
+            summary.append(f"    {change.group(1)}: {change.group(2)}")
+            attributes -= 1
+            continue
+        if ISSUE_LINE.match(stripped):
+            summary.append(stripped)
+            issue_lines = ISSUE_CONTEXT_LINES
+            continue
+        if issue_lines and stripped:
+            summary.append(f"    {stripped}")
+            issue_lines -= 1
+            continue
+        if SUMMARY_LINE.match(stripped) or APPLY_EVENT.match(stripped):
+            summary.append(stripped)
+            attributes = None
+    return "\n".join(summary)
+
+
+def outline_terraform(content: str) -> str:
+    """One line per top-level block: address and line range."""
+    lines = []
+    for block in parse_blocks(content):
+        first = content.count("\n", 0, block.start) + 1
+        last = content.count("\n", 0, block.end) + 1 if block.end is not None else "?"
+        lines.append(f"{block.address} (lines {first}-{last})")
+    return "\n".join(lines)
+
+
+def truncate(text: str, budget: int) -> str:
+    """Head and tail of text within `budget` tokens, cut at line boundaries."""
+    lines = text.splitlines()
+    head, tail = [], []
+    used = 0
+    half = budget // 2
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if used + cost > half:
+            break
+        head.append(line)
+        used += cost
+    for line in reversed(lines[len(head):]):
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            break
+        tail.insert(0, line)
+        used += cost
+    skipped = len(lines) - len(head) - len(tail)
+    if skipped <= 0:
+        return text
+    return "\n".join(head + [f"... ({skipped} lines omitted) ..."] + tail)
+
+
+class ObservationStore:
+    """Compacts tool outputs for the agent and keeps the full text of the last few."""
+
+    def __init__(self, budget=TOKEN_BUDGET, keep=KEEP_OUTPUTS):
+        self.budget = budget
+        self.keep = keep
+        self.request = ""  # The user request the agent is working on, to pick relevant blocks
+        self._outputs = OrderedDict()
+        self._next_id = 1
+
+    def _store(self, text):
+        output_id = f"obs-{self._next_id}"
+        self._next_id += 1
+        self._outputs[output_id] = text
+        while len(self._outputs) > self.keep:
+            self._outputs.popitem(last=False)
+        return output_id
+
+    def compact(self, tool_name, tool_input, output) -> str:
+        text = str(output)
+        tokens = estimate_tokens(text)
+        if tokens <= self.budget or tool_name in UNCOMPACTED_TOOLS:
+            return text
+
+        if tool_name in TERRAFORM_TOOLS:
+            compacted = summarize_terraform_output(text) or text
+            kind = "resource-level summary"
+        elif tool_name == "ReadTerraform":
+            compacted, kind = self._relevant_blocks(text, tool_input)
+        else:
+            compacted, kind = text, "truncated"
+        if estimate_tokens(compacted) > self.budget:
+            compacted = truncate(compacted, self.budget)
+
+        output_id = self._store(text)
+        return (f"{compacted}\n[{tool_name} output compacted ({kind}, ~{estimate_tokens(compacted)} of ~{tokens} "
+                f"tokens). Full text: ShowFullOutput with input '{output_id}' or '{output_id}:<first line>-<last line>']")
+
+    def _relevant_blocks(self, content, tool_input):
+        selection = select_context(content, f"{self.request}\n{tool_input}")
+        if selection.scoped and selection.context_tokens <= self.budget:
+            others = [b.address for b in parse_blocks(content) if b.address not in selection.addresses]
+            listed = ", ".join(others[:OMITTED_BLOCKS_LISTED]) + (", ..." if len(others) > OMITTED_BLOCKS_LISTED else "")
+            return (selection.text.rstrip() + f"\n\n# {len(others)} other blocks omitted: {listed}",
+                    f"{len(selection.addresses)} relevant blocks")
+        return outline_terraform(content), "block outline"
+
+    def wrap(self, tool_name, func):
+        """Tool function returning the compacted output instead of the full one."""
+        def wrapper(tool_input):
+            return self.compact(tool_name, tool_input, func(tool_input))
+        return wrapper
+
+    def show(self, query: str) -> str:
+        """Full text of a stored output, paged by lines: 'obs-3' or 'obs-3:120-240'."""
+        match = re.fullmatch(r'\s*[\'"]?(obs-\d+)(?::(\d+)-(\d+))?[\'"]?\s*', query or "")
+        if not match:
+            return "[❌] Error: input must be an output id like 'obs-3' or 'obs-3:120-240'"
+        output_id = match.group(1)
+        if output_id not in self._outputs:
+            known = ", ".join(self._outputs) or "none"
+            return f"[❌] Error: no stored output '{output_id}' (available: {known})"
+
+        lines = self._outputs[output_id].splitlines()
+        if match.group(2):
+            first, last = max(int(match.group(2)), 1), min(int(match.group(3)), len(lines))
+            return "\n".join(lines[first - 1:last]) + f"\n[{output_id} lines {first}-{last} of {len(lines)}]"
+
+        page_budget = self.budget * PAGE_BUDGET_FACTOR
+        page, used = [], 0
+        for line in lines:
+            used += estimate_tokens(line) + 1
+            if used > page_budget and page:
+                break
+            page.append(line)
+        if len(page) == len(lines):
+            return "\n".join(lines)
+        return ("\n".join(page) + f"\n[{output_id} lines 1-{len(page)} of {len(lines)}; "
+                f"ask for '{output_id}:{len(page) + 1}-{min(2 * len(page), len(lines))}' for more]")
+
+
+# Shared by the planner's agent tools
+observations = ObservationStore()
+
+
+def show_full_output(query: str) -> str:
+    return observations.show(query)
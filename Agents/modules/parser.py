@@ -1,26 +1,157 @@
 # modules/parser.py
 import re
 
-def parse_request(request: str):
-    request = request.lower()
+# Whole-request Terraform commands: "plan", "run terraform apply", "destroy everything"
+TF_COMMAND = re.compile(r'^(?:please\s+)?(?:run\s+)?(?:terraform\s+)?(init|plan|apply|destroy)'
+                        r'(?:\s+(?:it|now|changes|the changes|everything|(?:the\s+)?infrastructure))?[.!]?$')
+PLAN_AND_APPLY = re.compile(r'^(?:please\s+)?(?:run\s+)?(?:terraform\s+)?plan\s+(?:and|then)\s+apply[.!]?$')
+VM_WORD = r'(?:vm|virtual machine|machine)'
+VM_NAME = re.compile(r'\bvm=([\w-]+)|\b' + VM_WORD + r's?\s+(?:named\s+|called\s+)?"?([\w-]+)"?', re.I)
+NAMED = re.compile(r'\b(?:named|called|name)\s+"?([\w-]+)"?', re.I)
+# "to web", "of vm web", "on web": a VM referred to without the word "vm" right before its name
+VM_REF = re.compile(r'\b(?:of|for|on|from)\s+(?:the\s+)?(?:' + VM_WORD + r'\s+)?"?([\w-]+)"?', re.I)
+REGION = re.compile(r'\bregion=([\w-]+)', re.I)
+AZURE_REGIONS = {
+    "eastus", "eastus2", "westus", "westus2", "westus3", "centralus", "northcentralus", "southcentralus",
+    "westcentralus", "canadacentral", "canadaeast", "brazilsouth", "northeurope", "westeurope", "uksouth",
+    "ukwest", "francecentral", "germanywestcentral", "switzerlandnorth", "norwayeast", "swedencentral",
+    "polandcentral", "italynorth", "spaincentral", "eastasia", "southeastasia", "japaneast", "japanwest",
+    "koreacentral", "centralindia", "southindia", "westindia", "australiaeast", "australiasoutheast",
+    "australiacentral", "uaenorth", "southafricanorth", "qatarcentral", "israelcentral", "mexicocentral",
+}
+# More than one request in one line: "... and ...", "...; ...", "also ..."
+COMPOUND = re.compile(r';|\s(?:and|also|then|plus)\s', re.I)
+VERB = re.compile(r'\b(?:create|provision|deploy|add|attach|delete|remove|destroy|drop|clear|increase|raise|'
+                  r'decrease|reduce|shrink|set|put|make|change|resize|scale|switch|upgrade|downgrade)\b', re.I)
+AZURE_SIZE = re.compile(r'\b((?:standard|basic)_\w+)\b', re.I)
+DISK_WORD = re.compile(r'\b(?:os[_ ]?)?disk\b')
+# Resources other than the OS disk; a size in a request naming one of these is not a disk resize
+OTHER_RESOURCE = re.compile(r'\b(?:(?:add|attach|create)\s+an?\s+(?:\d+\s*gb\s+)?disks?|data\s+disks?|managed\s+disks?|(?:additional|new|another|second|extra)\s+disks?|attach|storage|accounts?|subnets?|'
+                            r'vnets?|virtual\s+networks?|networks?|nics?|ips?|address(?:es)?|databases?|sql|blobs?|'
+                            r'shares?|volumes?|snapshots?|nsgs?|security|load\s*balancers?|gateways?|clusters?|'
+                            r'caches?|redis|queues?|buckets?)\b')
+# Words that follow "vm" without being its name, as in "vm size" or "the vm disk"
+NOT_A_NAME = {"size", "sku", "disk", "os_disk", "os", "to", "by", "with", "in", "on", "from", "and", "tag", "tags",
+              "the", "a", "it", "all"}
+
+TF_ACTIONS = {
+    "init": "TerraformInit",
+    "plan": "TerraformPlan",
+    "apply": "TerraformApply",
+    "destroy": "TerraformDestroy",
+}
+
+
+def _vm_name(text):
+    for match in VM_NAME.finditer(text):
+        name = match.group(1) or match.group(2)
+        if name.lower() not in NOT_A_NAME:
+            return name
+    for match in VM_REF.finditer(text):
+        name = match.group(1)
+        # "of the vm by 10GB" names no VM
+        if name.lower() not in NOT_A_NAME | {"vm", "machine"} and not re.fullmatch(r'\d+\s*gb', name, re.I):
+            return name
+    return None
+
+
+def _region(text):
+    """An Azure region named in the request ("in eastus", "West Europe"); only known regions count."""
+    explicit = REGION.search(text)
+    if explicit:
+        return explicit.group(1)
+    words = re.findall(r'[a-z0-9]+', text.lower())
+    for i, word in enumerate(words):
+        for candidate in (word + "".join(words[i + 1:i + 3]), word + "".join(words[i + 1:i + 2]), word):
+            if candidate in AZURE_REGIONS:
+                return candidate
+    return None
+
+
+def is_compound(request: str) -> bool:
+    """True when one line asks for several things, e.g. "delete vm web and create vm api"."""
+    # key=value pairs may contain any word, e.g. "set tag stage=deploy"
+    text = re.sub(r'\S+=\S+', ' ', request)
+    return bool(COMPOUND.search(text)) or len(VERB.findall(text)) > 1
+
+
+def _tag_request(text, vm_name):
+    set_match = re.search(r'\b(?:add|set|put)\s+(?:a\s+|the\s+)?tag\s+"?([\w./-]+)"?\s*(?:=|:|to)\s*"?([^"\s;]+)"?', text, re.I)
+    if set_match:
+        return {"action": "SetTag", "tag": set_match.group(1), "value": set_match.group(2), "vm": vm_name}
+    remove_match = re.search(r'\b(?:remove|delete|drop|clear)\s+(?:the\s+)?tag\s+"?([\w./-]+)"?', text, re.I)
+    if remove_match:
+        return {"action": "RemoveTag", "tag": remove_match.group(1), "vm": vm_name}
+    return None
+
+
+def disk_change(request: str):
+    """(mode, amount) of a size change like "add 50GB" or "make it 300GB", or None.
 
-    # Relative increase: "add 50GB", "increase by 20GB"
+    Doesn't check what is being resized; parse_request does that first.
+    """
+    request = request.lower()
+    # A target size: "increase the disk to 100GB", "set os_disk to 150GB"
+    to_match = re.search(r'\bto\s+(\d+)\s*gb', request)
+    if to_match:
+        return "absolute", int(to_match.group(1))
+    # Relative increase: "add 50GB to the disk", "increase the disk by 20GB"
     inc_match = re.search(r'(increase|add|raise).*?(\d+)\s*gb', request)
-    # Absolute set: "make it 300GB", "set to 150GB"
+    if inc_match:
+        return "increment", int(inc_match.group(2))
+    # Absolute set: "make the disk 300GB", "set os_disk to 150GB"
     abs_match = re.search(r'(set|make|change).*?(\d+)\s*gb', request)
+    if abs_match:
+        return "absolute", int(abs_match.group(2))
+    return None
 
-    if inc_match:
-        return {
-            "action": "ModifyDiskSize",
-            "mode": "increment",
-            "amount": int(inc_match.group(2))
-        }
 
-    elif abs_match:
+def parse_request(request: str):
+    text = request.strip()
+    request = text.lower()
+
+    # Terraform commands, only when they are the whole request
+    if PLAN_AND_APPLY.match(request):
+        return {"action": "TerraformPlanThenApply"}
+    command = TF_COMMAND.match(request)
+    if command:
+        return {"action": TF_ACTIONS[command.group(1)]}
+
+    # One request per line; anything longer goes to the agent as a whole
+    if is_compound(text):
+        return {"action": "unknown"}
+
+    vm_name = _vm_name(text)
+
+    # Tags: "add tag env=prod", "set tag owner to alice on vm web", "remove tag env"
+    if re.search(r'\btags?\b', request):
+        return _tag_request(text, vm_name) or {"action": "unknown"}
+
+    # New VM: "create a vm called web in eastus with 50GB disk"
+    if re.search(r'\b(create|provision|deploy|add)\s+(?:an?\s+|another\s+|new\s+|linux\s+)*' + VM_WORD + r'\b', request):
+        named = NAMED.search(text)
+        size = re.search(r'(\d+)\s*gb', request)
         return {
-            "action": "ModifyDiskSize",
-            "mode": "absolute",
-            "amount": int(abs_match.group(2))
+            "action": "CreateVM",
+            "vm": named.group(1) if named else vm_name,
+            "region": _region(text),
+            "size": int(size.group(1)) if size else None,
         }
 
-    return {"action": "unknown"}
+    # Delete a VM: "delete vm web", "remove the virtual machine named web"
+    if re.search(r'\b(delete|remove|destroy)\s+(?:the\s+)?' + VM_WORD + r'\b', request):
+        return {"action": "DeleteVM", "vm": vm_name}
+
+    # VM size: "resize vm web to Standard_B2s", "change the vm size to standard_d2s_v3"
+    size_match = AZURE_SIZE.search(text)
+    if size_match and re.search(r'\b(resize|change|set|make|scale|switch|upgrade|downgrade)\b', request):
+        return {"action": "SetVMSize", "size": size_match.group(1), "vm": vm_name}
+
+    # Disk size only when the request is plainly about the OS disk; anything vaguer goes to the agent
+    if not DISK_WORD.search(request) or OTHER_RESOURCE.search(request):
+        return {"action": "unknown"}
+    change = disk_change(request)
+    if change is None:
+        return {"action": "unknown"}
+    mode, amount = change
+    return {"action": "ModifyDiskSize", "mode": mode, "amount": amount, "vm": vm_name}
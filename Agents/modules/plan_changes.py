@@ -0,0 +1,173 @@
+# modules/plan_changes.py
+"""Compact change set of a saved plan, read from `terraform show -json` as a stream.
+
+Only the `resource_changes` array is parsed, one resource at a time (see
+json_scan), and only what changes is kept: the actions per address, the
+attributes whose value differs and the attributes forcing a replacement.
+"""
+
+import json
+
+from modules.json_scan import CHUNK_SIZE, iter_array_items
+
+UNKNOWN = "(known after apply)"
+SENSITIVE = "(sensitive value)"
+MAX_ATTRIBUTES = 10  # Attribute changes rendered per resource
+MAX_VALUE_CHARS = 60
+
+# Same wording as terraform's own plan output, so people and the agent read it the same way
+DESCRIPTIONS = {
+    "create": "will be created",
+    "update": "will be updated in-place",
+    "delete": "will be destroyed",
+    "replace": "must be replaced",
+    "read": "will be read during apply",
+}
+
+
+def _flag(marks, key):
+    """Sub-tree of a before_sensitive/after_unknown mirror, which may be a bare true."""
+    if isinstance(marks, dict):
+        return marks.get(key, False)
+    if isinstance(marks, list):
+        return marks[key] if isinstance(key, int) and key < len(marks) else False
+    return marks
+
+
+def _merge(a, b):
+    """Union of two sensitivity mirrors: a value is redacted if it was or will be sensitive."""
+    if a is True or b is True:
+        return True
+    if isinstance(a, dict) and isinstance(b, dict):
+        return {key: _merge(a.get(key, False), b.get(key, False)) for key in {**a, **b}}
+    if isinstance(a, list) and isinstance(b, list):
+        return [_merge(_flag(a, i), _flag(b, i)) for i in range(max(len(a), len(b)))]
+    return a or b
+
+
+def _diff(before, after, unknown, sensitive, path=""):
+    """Yield (path, before, after) for every leaf that differs."""
+    if sensitive is True:
+        if before != after or unknown is True:
+            yield path, SENSITIVE, SENSITIVE
+        return
+    if unknown is True:
+        yield path, before, UNKNOWN
+        return
+    # Descend into objects, and into lists of the same length (nested blocks like os_disk)
+    if isinstance(before, dict) and isinstance(after, dict):
+        keys = list(before) + [k for k in after if k not in before]
+        for key in keys:
+            yield from _diff(before.get(key), after.get(key), _flag(unknown, key), _flag(sensitive, key),
+                             f"{path}.{key}" if path else key)
+        return
+    if isinstance(before, list) and isinstance(after, list) and len(before) == len(after):
+        for i, (old, new) in enumerate(zip(before, after)):
+            # The single element of a nested block adds nothing to the path
+            step = path if len(before) == 1 else f"{path}[{i}]"
+            yield from _diff(old, new, _flag(unknown, i), _flag(sensitive, i), step)
+        return
+    if before != after:
+        yield path, before, after
+
+
+def _format(value):
+    if value in (UNKNOWN, SENSITIVE):
+        return value
+    text = json.dumps(value)
+    return text if len(text) <= MAX_VALUE_CHARS else text[:MAX_VALUE_CHARS - 3] + "..."
+
+
+def _path(steps):
+    """replace_paths entries are lists of keys and indexes."""
+    return ".".join(str(step) for step in steps if not isinstance(step, int))
+
+
+class ResourceChange:
+    """Planned change of one resource instance."""
+
+    def __init__(self, address, action, attributes=None, replaced_by=None, reason=None):
+        self.address = address
+        self.action = action  # create | update | delete | replace | read
+        self.attributes = attributes or []  # [(path, before, after)]
+        self.replaced_by = replaced_by or []  # attribute paths forcing the replacement
+        self.reason = reason
+
+    @property
+    def replace(self):
+        return self.action == "replace"
+
+    @classmethod
+    def from_json(cls, item):
+        change = item.get("change", {})
+        actions = change.get("actions", [])
+        if "create" in actions and "delete" in actions:
+            action = "replace"
+        else:
+            action = actions[0] if actions else "no-op"
+        attributes = []
+        if action in ("update", "replace"):
+            attributes = list(_diff(change.get("before"), change.get("after"), change.get("after_unknown", {}),
+                                    _merge(change.get("before_sensitive", {}), change.get("after_sensitive", {}))))
+        replaced_by = [_path(p) for p in change.get("replace_paths") or []]
+        return cls(item["address"], action, attributes, replaced_by, item.get("action_reason"))
+
+    def render(self, max_attributes=MAX_ATTRIBUTES):
+        lines = [f"  # {self.address} {DESCRIPTIONS.get(self.action, self.action)}"]
+        for path, before, after in self.attributes[:max_attributes]:
+            forces = " # forces replacement" if path in self.replaced_by else ""
+            lines.append(f"      ~ {path} = {_format(before)} -> {_format(after)}{forces}")
+        if len(self.attributes) > max_attributes:
+            lines.append(f"      ... {len(self.attributes) - max_attributes} more changed attributes")
+        return "\n".join(lines)
+
+
+class ChangeSet:
+    """Every resource a plan changes, in plan order."""
+
+    def __init__(self, changes=None):
+        self.changes = changes or []
+
+    def __len__(self):
+        return len(self.changes)
+
+    def __iter__(self):
+        return iter(self.changes)
+
+    def get(self, address):
+        return next((c for c in self.changes if c.address == address), None)
+
+    def counts(self):
+        """{"add": n, "change": n, "destroy": n}, counted the way terraform's plan summary does."""
+        counts = {"add": 0, "change": 0, "destroy": 0}
+        for change in self.changes:
+            if change.action in ("create", "replace"):
+                counts["add"] += 1
+            if change.action in ("delete", "replace"):
+                counts["destroy"] += 1
+            if change.action == "update":
+                counts["change"] += 1
+        return counts
+
+    def summary(self):
+        counts = self.counts()
+        if not any(counts.values()):
+            return "No changes. Your infrastructure matches the configuration."
+        return f"Plan: {counts['add']} to add, {counts['change']} to change, {counts['destroy']} to destroy."
+
+    def render(self, max_attributes=MAX_ATTRIBUTES):
+        if not self.changes:
+            return self.summary()
+        lines = ["Terraform will perform the following actions:", ""]
+        lines += [change.render(max_attributes) for change in self.changes]
+        return "\n".join(lines + ["", self.summary()])
+
+
+def load_changeset(stream, chunk_size=CHUNK_SIZE) -> ChangeSet:
+    """Build the change set from a binary stream of `terraform show -json <plan>` output."""
+    changes = []
+    for _, _, raw in iter_array_items(stream, "resource_changes", chunk_size):
+        change = ResourceChange.from_json(json.loads(raw))
+        if change.action != "no-op":
+            changes.append(change)
+    return ChangeSet(changes)
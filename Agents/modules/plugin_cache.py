@@ -0,0 +1,231 @@
+# modules/plugin_cache.py
+
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, usage updates may race
+    fcntl = None
+
+CACHE_DIR = os.environ.get("TF_ASSISTANT_PLUGIN_CACHE", os.path.expanduser("~/.terraform.d/plugin-cache"))
+USAGE_FILE = "assistant_usage.json"
+LOCK_PROVIDER = re.compile(r'provider\s+"([^"]+)"\s*\{[^}]*?version\s*=\s*"([^"]+)"', re.DOTALL)
+
+
+def is_offline():
+    return os.environ.get("TF_ASSISTANT_OFFLINE") == "1"
+
+
+def lock_file_providers(workspace):
+    """(source, version) pairs pinned by a workspace's .terraform.lock.hcl."""
+    path = os.path.join(workspace, ".terraform.lock.hcl")
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return LOCK_PROVIDER.findall(f.read())
+
+
+def _cli_config(cache_dir):
+    """CLI config that installs providers only from the cache, for fully offline runs."""
+    path = os.path.join(cache_dir, "offline.tfrc")
+    config = f'provider_installation {{\n  filesystem_mirror {{\n    path = "{cache_dir}"\n  }}\n}}\n'
+    try:
+        with open(path, "r") as f:
+            if f.read() == config:
+                return path
+    except OSError:
+        pass
+    _write_atomic(cache_dir, path, config)
+    return path
+
+
+def _write_atomic(cache_dir, path, text):
+    # A unique temp file per writer, so concurrent runs never share one
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", dir=cache_dir)
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+@contextmanager
+def _locked(cache_dir):
+    """Exclusive lock on the usage file across threads and processes."""
+    with open(os.path.join(cache_dir, USAGE_FILE + ".lock"), "w") as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def terraform_env(cache_dir=None, offline=None):
+    """Environment for terraform processes so every workspace shares one plugin cache.
+
+    Online, the cache is used as TF_PLUGIN_CACHE_DIR: providers are downloaded
+    once, then linked into each workspace. Offline, the same directory is used
+    as the only filesystem mirror, so init never touches the network.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    offline = is_offline() if offline is None else offline
+    os.makedirs(cache_dir, exist_ok=True)
+    env = dict(os.environ)
+    if offline:
+        env.pop("TF_PLUGIN_CACHE_DIR", None)
+        env.setdefault("TF_CLI_CONFIG_FILE", _cli_config(cache_dir))
+    else:
+        env.setdefault("TF_PLUGIN_CACHE_DIR", cache_dir)
+    return env
+
+
+def _load_usage(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, USAGE_FILE), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def record_usage(workspace, cache_dir=None):
+    """Remember that the providers pinned by a workspace were just used."""
+    cache_dir = cache_dir or CACHE_DIR
+    providers = lock_file_providers(workspace)
+    if not providers:
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    with _locked(cache_dir):
+        usage = _load_usage(cache_dir)
+        now = time.time()
+        for source, version in providers:
+            usage[f"{source}/{version}"] = now
+        _write_atomic(cache_dir, os.path.join(cache_dir, USAGE_FILE), json.dumps(usage))
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def cached_versions(cache_dir=None):
+    """Provider versions in the cache as dicts with source, version, path, bytes and last_used."""
+    cache_dir = cache_dir or CACHE_DIR
+    usage = _load_usage(cache_dir)
+    versions = []
+    # Layout: <hostname>/<namespace>/<type>/<version>/<os_arch>/
+    for version_dir in sorted(_glob_depth(cache_dir, 4)):
+        source = os.path.relpath(os.path.dirname(version_dir), cache_dir).replace(os.sep, "/")
+        version = os.path.basename(version_dir)
+        key = f"{source}/{version}"
+        versions.append({
+            "source": source,
+            "version": version,
+            "path": version_dir,
+            "bytes": _dir_size(version_dir),
+            "last_used": usage.get(key, os.path.getmtime(version_dir)),
+        })
+    return versions
+
+
+def _glob_depth(root, depth):
+    paths = [root]
+    for _ in range(depth):
+        paths = [os.path.join(p, name) for p in paths if os.path.isdir(p)
+                 for name in os.listdir(p) if os.path.isdir(os.path.join(p, name))]
+    return paths
+
+
+def disk_usage_report(cache_dir=None) -> str:
+    versions = cached_versions(cache_dir)
+    if not versions:
+        return f"Plugin cache {cache_dir or CACHE_DIR} is empty."
+    lines = [f"Plugin cache: {cache_dir or CACHE_DIR}"]
+    for v in versions:
+        age_days = (time.time() - v["last_used"]) / 86400
+        lines.append(f"  {v['source']} {v['version']:<10} {v['bytes'] / 1024 / 1024:8.1f} MB  last used {age_days:.0f}d ago")
+    lines.append(f"  Total: {sum(v['bytes'] for v in versions) / 1024 / 1024:.1f} MB in {len(versions)} provider versions")
+    return "\n".join(lines)
+
+
+def evict(workspaces=(), max_age_days=30, cache_dir=None):
+    """Delete provider versions no workspace pins and that were not used for max_age_days."""
+    cache_dir = cache_dir or CACHE_DIR
+    pinned = {f"{s}/{v}" for ws in workspaces for s, v in lock_file_providers(ws)}
+    removed = []
+    for v in cached_versions(cache_dir):
+        key = f"{v['source']}/{v['version']}"
+        if key in pinned or time.time() - v["last_used"] < max_age_days * 86400:
+            continue
+        shutil.rmtree(v["path"])
+        removed.append(v)
+    return removed
+
+
+def prewarm(workspaces, cache_dir=None, echo=True):
+    """Download every provider pinned by the workspaces' lock files into the cache.
+
+    Each lock file is initialized in a scratch directory, so the real
+    workspaces and their backends are never touched.
+    """
+    from modules.terraform_runner import run_terraform
+
+    cache_dir = cache_dir or CACHE_DIR
+    results = {}
+    for workspace in workspaces:
+        providers = lock_file_providers(workspace)
+        if not providers:
+            results[workspace] = "no lock file"
+            continue
+        with tempfile.TemporaryDirectory() as scratch:
+            required = "\n".join(
+                f'    {source.split("/")[-1]} = {{\n      source  = "{source}"\n      version = "= {version}"\n    }}'
+                for source, version in providers
+            )
+            with open(os.path.join(scratch, "main.tf"), "w") as f:
+                f.write(f"terraform {{\n  required_providers {{\n{required}\n  }}\n}}\n")
+            shutil.copy(os.path.join(workspace, ".terraform.lock.hcl"), scratch)
+            result = run_terraform(["init", "-backend=false", "-input=false"], cwd=scratch,
+                                   echo=echo, env=terraform_env(cache_dir, offline=False))
+        if result.ok:
+            record_usage(workspace, cache_dir)
+        results[workspace] = "ok" if result.ok else result.stderr.strip()
+    return results
+
+
+def main(argv):
+    usage = "Usage: python -m modules.plugin_cache [usage | prewarm <workspace>... | evict [--days N] <workspace>...]"
+    if not argv or argv[0] == "usage":
+        print(disk_usage_report())
+    elif argv[0] == "prewarm" and argv[1:]:
+        for workspace, status in prewarm(argv[1:]).items():
+            print(f"{'✅' if status == 'ok' else '❌'} {workspace}: {status}")
+    elif argv[0] == "evict":
+        args = argv[1:]
+        days = 30
+        if args[:1] == ["--days"]:
+            days, args = int(args[1]), args[2:]
+        removed = evict(args, max_age_days=days)
+        for v in removed:
+            print(f"🧹 Removed {v['source']} {v['version']} ({v['bytes'] / 1024 / 1024:.1f} MB)")
+        print(f"Evicted {len(removed)} provider versions.")
+    else:
+        print(usage)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,131 @@
+# modules/router.py
+
+import time
+
+from modules.parser import parse_request
+from modules.terraform_io import workspace
+from modules.vm_manager import VM_TYPES
+
+AGENT = "LLM agent"
+# Routes that edit an existing VM: the VM must be one main.tf actually has
+EDIT_ACTIONS = {"ModifyDiskSize", "SetVMSize", "DeleteVM", "SetTag", "RemoveTag"}
+
+
+def _vm(parsed):
+    return f"vm={parsed['vm']};" if parsed.get("vm") else ""
+
+
+def _disk(parsed):
+    return f"{_vm(parsed)}mode={parsed['mode']};amount={parsed['amount']}"
+
+
+def _create_vm(parsed):
+    # CreateVM needs a name and a region; anything vaguer goes to the agent
+    if not (parsed.get("vm") and parsed.get("region")):
+        return None
+    return f"vm={parsed['vm']};region={parsed['region']};size={parsed.get('size') or 30}"
+
+
+# parse_request action -> (tool name, function building the tool input or returning None to fall back)
+ROUTES = {
+    "ModifyDiskSize": ("ModifyDiskSize", _disk),
+    "SetVMSize": ("SetVMSize", lambda p: f"{_vm(p)}size={p['size']}"),
+    "CreateVM": ("CreateVM", _create_vm),
+    # Deleting needs an explicit VM name; "delete the vm" goes to the agent
+    "DeleteVM": ("DeleteVM", lambda p: f"vm={p['vm']}" if p.get("vm") else None),
+    "SetTag": ("SetTag", lambda p: f"{_vm(p)}tag={p['tag']};value={p['value']}"),
+    "RemoveTag": ("RemoveTag", lambda p: f"{_vm(p)}tag={p['tag']}"),
+    "TerraformInit": ("TerraformInit", lambda p: ""),
+    "TerraformPlan": ("TerraformPlan", lambda p: ""),
+    "TerraformApply": ("TerraformApply", lambda p: ""),
+    "TerraformDestroy": ("TerraformDestroy", lambda p: ""),
+    "TerraformPlanThenApply": ("TerraformPlanThenApply", lambda p: ""),
+}
+
+
+def _vm_names():
+    """(names, VM count) of main.tf's VMs; names are Terraform names and `name` attributes."""
+    index = workspace.index()
+    vms = index.resources(*VM_TYPES)
+    names = {vm.labels[1] for vm in vms}
+    for vm in vms:
+        name_attr = vm.attributes.get("name")
+        if name_attr:
+            names.add(name_attr.value(index.content).strip('"'))
+    return names, len(vms)
+
+
+def _unambiguous(parsed):
+    """Whether the VM a parsed request is about is clear from main.tf."""
+    action, vm = parsed.get("action"), parsed.get("vm")
+    if action not in EDIT_ACTIONS and action != "CreateVM":
+        return True
+    try:
+        names, count = _vm_names()
+    except FileNotFoundError:
+        return False
+    if action == "CreateVM":
+        return vm not in names
+    # A name must be a VM that exists ("make the vm bigger" names no VM); no name means the only VM
+    return vm in names if vm else count == 1
+
+
+def route(request: str):
+    """Return (tool_name, tool_input) when a request can skip the agent, else None."""
+    parsed = parse_request(request)
+    target = ROUTES.get(parsed.get("action"))
+    if target is None or not _unambiguous(parsed):
+        return None
+    tool_name, build_input = target
+    tool_input = build_input(parsed)
+    if tool_input is None:
+        return None
+    return tool_name, tool_input
+
+
+class RouteStats:
+    """How many requests each route handled and how long they took, versus the agent."""
+
+    def __init__(self):
+        self.hits = {}
+        self.seconds = {}
+
+    def record(self, route_name, seconds):
+        route_name = route_name or AGENT
+        self.hits[route_name] = self.hits.get(route_name, 0) + 1
+        self.seconds[route_name] = self.seconds.get(route_name, 0.0) + seconds
+
+    def timed(self, route_name):
+        """Context manager recording the time spent handling one request."""
+        return _Timer(self, route_name)
+
+    def report(self) -> str:
+        total = sum(self.hits.values())
+        if not total:
+            return "No requests yet."
+        lines = [f"{'Route':<24} {'Hits':>5} {'Share':>7} {'Avg time':>9}"]
+        for name, hits in sorted(self.hits.items(), key=lambda item: -item[1]):
+            lines.append(f"{name:<24} {hits:>5} {hits / total:>7.1%} {self.seconds[name] / hits:>8.2f}s")
+
+        routed = total - self.hits.get(AGENT, 0)
+        summary = f"Fast path handled {routed}/{total} requests ({routed / total:.1%})"
+        if self.hits.get(AGENT):
+            # Estimate: each routed request would have cost an average agent run
+            agent_avg = self.seconds[AGENT] / self.hits[AGENT]
+            routed_time = sum(s for name, s in self.seconds.items() if name != AGENT)
+            summary += f"; ~{max(routed * agent_avg - routed_time, 0):.1f}s of LLM agent time saved"
+        lines.append(summary)
+        return "\n".join(lines)
+
+
+class _Timer:
+    def __init__(self, stats, route_name):
+        self.stats = stats
+        self.route_name = route_name
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.record(self.route_name, time.monotonic() - self.started)
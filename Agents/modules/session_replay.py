@@ -0,0 +1,253 @@
+# modules/session_replay.py
+"""Record agent sessions and replay them offline, with LLM responses served from the recording.
+
+A session file is gzipped JSON lines: a header with a snapshot of main.tf,
+then one event per request, LLM call, tool call and result. Replaying runs
+the same requests through the current agent and tools in a scratch copy of
+the workspace, so what's left of the time is agent parsing, tool execution
+and file I/O, without the model.
+
+    python planner.py --record sessions/slow.jsonl.gz
+    python planner.py --replay sessions/slow.jsonl.gz
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, List, Optional
+
+from langchain_core.language_models.llms import LLM
+
+FORMAT_VERSION = 1
+# Tools that talk to Terraform, Azure or the user: replayed from the recording, never run
+EXTERNAL_TOOLS = {"TerraformInit", "TerraformPlan", "TerraformApply", "TerraformDestroy", "InitAndPlan",
+                  "TerraformPlanThenApply", "ReadState"}
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class ReplayError(Exception):
+    pass
+
+
+class SessionRecorder:
+    """Writes one session file; wrap the LLM in RecordingLLM and each tool with wrap_tool()."""
+
+    def __init__(self, path, main_tf=None, model=None):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self.event("session", version=FORMAT_VERSION, started=datetime.now().isoformat(timespec="seconds"),
+                   model=model, main_tf=main_tf)
+
+    def event(self, kind, **fields):
+        self._file.write(json.dumps({"type": kind, **fields}, separators=(",", ":")) + "\n")
+        self._file.flush()
+
+    def request(self, text):
+        """Context manager around one user request."""
+        return _Request(self, text)
+
+    def llm_call(self, prompt, stop, response, seconds):
+        # Prompts repeat the whole tool list every call; a hash is enough to detect divergence
+        self.event("llm", prompt=_digest(prompt), prompt_chars=len(prompt), stop=stop, response=response,
+                   seconds=round(seconds, 4))
+
+    def wrap_tool(self, name, func):
+        def wrapper(tool_input):
+            started = time.perf_counter()
+            try:
+                output = func(tool_input)
+            except Exception as e:
+                self.event("tool", name=name, input=str(tool_input), error=f"{type(e).__name__}: {e}",
+                           seconds=round(time.perf_counter() - started, 4))
+                raise
+            self.event("tool", name=name, input=str(tool_input), output=str(output),
+                       seconds=round(time.perf_counter() - started, 4))
+            return output
+        return wrapper
+
+    def close(self):
+        self._file.close()
+
+
+class _Request:
+    def __init__(self, recorder, text):
+        self.recorder = recorder
+        self.text = text
+
+    def __enter__(self):
+        self.recorder.event("request", text=self.text)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.recorder.event("result", seconds=round(time.perf_counter() - self.started, 4),
+                            error=f"{exc_type.__name__}: {exc}" if exc_type else None)
+
+
+def load_session(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    if not events or events[0].get("type") != "session":
+        raise ReplayError(f"{path} is not a session recording")
+    if events[0]["version"] != FORMAT_VERSION:
+        raise ReplayError(f"{path} has format version {events[0]['version']}, expected {FORMAT_VERSION}")
+    return events
+
+
+class SessionReplay:
+    """Serves the LLM responses and external tool outputs of a recording, in order."""
+
+    def __init__(self, path):
+        self.path = path
+        events = load_session(path)
+        self.header = events[0]
+        self.requests = []
+        for event in events[1:]:
+            if event["type"] == "request":
+                current = {"text": event["text"], "llm": [], "tools": [], "seconds": None}
+                self.requests.append(current)
+            elif event["type"] == "llm":
+                current["llm"].append(event)
+            elif event["type"] == "tool":
+                current["tools"].append(event)
+            elif event["type"] == "result":
+                current["seconds"] = event["seconds"]
+        self.results = []
+        self._current = None
+
+    def prepare_workspace(self):
+        """Scratch workspace holding the recorded main.tf; the cwd moves there so tools edit the copy."""
+        workspace = tempfile.mkdtemp(prefix="tf-replay-")
+        os.makedirs(os.path.join(workspace, "hcl"))
+        with open(os.path.join(workspace, "hcl", "main.tf"), "w", encoding="utf-8") as f:
+            f.write(self.header.get("main_tf") or "")
+        os.chdir(workspace)
+        os.environ["TF_ASSISTANT_HCL_DIR"] = os.path.join(workspace, "hcl")
+        return workspace
+
+    def request(self, recorded):
+        return _ReplayRequest(self, recorded)
+
+    def next_llm_response(self, prompt):
+        run = self._current
+        if run is None or run["llm_served"] >= len(run["recorded"]["llm"]):
+            raise ReplayError("the recording has no more LLM responses for this request")
+        event = run["recorded"]["llm"][run["llm_served"]]
+        run["llm_served"] += 1
+        if event["prompt"] != _digest(prompt):
+            run["prompt_mismatches"] += 1
+        return event["response"]
+
+    def wrap_tool(self, name, func):
+        def wrapper(tool_input):
+            run = self._current
+            recorded = self._next_tool(run, name) if run else None
+            if name in EXTERNAL_TOOLS:
+                if recorded is None:
+                    raise ReplayError(f"the recording has no {name} call to replay")
+                if "error" in recorded:
+                    raise ReplayError(f"recorded {name} call failed: {recorded['error']}")
+                return recorded["output"]
+
+            started = time.perf_counter()
+            output = func(tool_input)
+            if run:
+                run["tool_seconds"] += time.perf_counter() - started
+                if recorded is None or recorded.get("output") != str(output):
+                    run["tool_mismatches"] += 1
+            return output
+        return wrapper
+
+    @staticmethod
+    def _next_tool(run, name):
+        tools = run["recorded"]["tools"]
+        while run["tool_index"] < len(tools):
+            event = tools[run["tool_index"]]
+            run["tool_index"] += 1
+            if event["name"] == name:
+                return event
+        return None
+
+    def report(self) -> str:
+        """Per-request local time (everything but the LLM and external tools), recorded vs replayed."""
+        lines = [f"{'#':>3} {'Request':<34} {'Recorded':>9} {'Replayed':>9} {'Ratio':>6}  Divergence"]
+        recorded_total = replayed_total = 0.0
+        for n, run in enumerate(self.results, 1):
+            recorded = run["recorded"]
+            external = sum(e["seconds"] for e in recorded["llm"]) + \
+                sum(e["seconds"] for e in recorded["tools"] if e["name"] in EXTERNAL_TOOLS)
+            before = max((recorded["seconds"] or 0.0) - external, 0.0)
+            after = run["seconds"]
+            recorded_total += before
+            replayed_total += after
+            divergence = []
+            if run["prompt_mismatches"]:
+                divergence.append(f"{run['prompt_mismatches']} prompt(s)")
+            if run["tool_mismatches"]:
+                divergence.append(f"{run['tool_mismatches']} tool output(s)")
+            if run["llm_served"] < len(recorded["llm"]):
+                divergence.append(f"{len(recorded['llm']) - run['llm_served']} LLM call(s) unused")
+            if run["error"]:
+                divergence.append(run["error"])
+            ratio = f"{after / before:>5.2f}x" if before else "     -"
+            lines.append(f"{n:>3} {recorded['text'][:34]:<34} {before:>8.3f}s {after:>8.3f}s {ratio}  "
+                         f"{', '.join(divergence) or 'none'}")
+        lines.append(f"Local time: {recorded_total:.3f}s recorded, {replayed_total:.3f}s replayed")
+        return "\n".join(lines)
+
+
+class _ReplayRequest:
+    def __init__(self, replay, recorded):
+        self.replay = replay
+        self.run = {"recorded": recorded, "llm_served": 0, "tool_index": 0, "tool_seconds": 0.0,
+                    "prompt_mismatches": 0, "tool_mismatches": 0, "seconds": 0.0, "error": None}
+
+    def __enter__(self):
+        self.replay._current = self.run
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.run["seconds"] = time.perf_counter() - self.started
+        if exc_type:
+            self.run["error"] = f"{exc_type.__name__}: {exc}"
+        self.replay.results.append(self.run)
+        self.replay._current = None
+
+
+class RecordingLLM(LLM):
+    """Passes prompts to `inner` and records every prompt/response pair."""
+
+    inner: Any
+    recorder: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "recording"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        started = time.perf_counter()
+        response = self.inner.invoke(prompt, stop=stop, **kwargs)
+        self.recorder.llm_call(prompt, stop, response, time.perf_counter() - started)
+        return response
+
+
+class ReplayLLM(LLM):
+    """Answers with the recorded responses instead of calling a model."""
+
+    replay: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        return self.replay.next_llm_response(prompt)
@@ -0,0 +1,170 @@
+# modules/state_reader.py
+
+import json
+import os
+import re
+
+from modules.json_scan import CHUNK_SIZE, iter_array_items
+
+STATE_FILE = "terraform.tfstate"
+# Fields Terraform writes before "instances" in every resource object
+HEAD_FIELD = re.compile(rb'"(module|mode|type|name)":\s*"((?:[^"\\]|\\.)*)"')
+INDEX_KEY = re.compile(r'\[(\d+|"[^"]*")\]')
+SENSITIVE = "(sensitive value)"
+
+_indexes = {}  # state path -> StateIndex
+
+
+def read_state_header(cwd):
+    """Return (lineage, serial) of the local state without parsing the whole file."""
+    return _read_header(os.path.join(cwd, STATE_FILE))
+
+
+def _read_header(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            header = f.read(4096)
+    except OSError:
+        return None, None
+    serial = re.search(r'"serial":\s*(\d+)', header)
+    lineage = re.search(r'"lineage":\s*"([^"]*)"', header)
+    return (lineage.group(1) if lineage else None), (int(serial.group(1)) if serial else None)
+
+
+def resource_address(raw: bytes) -> str:
+    """Address of a raw state resource, e.g. module.net.data.azurerm_subnet.main."""
+    cut = raw.find(b'"instances"')
+    fields = {k.decode(): json.loads(b'"' + v + b'"') for k, v in HEAD_FIELD.findall(raw[:cut])} if cut > 0 else {}
+    if not {"mode", "type", "name"} <= fields.keys():
+        fields = json.loads(raw)
+    address = f"{fields['type']}.{fields['name']}"
+    if fields["mode"] == "data":
+        address = "data." + address
+    if fields.get("module"):
+        address = f"{fields['module']}.{address}"
+    return address
+
+
+def _redact(attributes, sensitive_paths):
+    """Replace every value listed in an instance's sensitive_attributes."""
+    for path in sensitive_paths or []:
+        parent, key = None, None
+        node = attributes
+        for step in path:
+            parent, key = node, step.get("value")
+            if isinstance(key, dict):  # index steps wrap the key as {"value": ..., "type": ...}
+                key = key.get("value")
+            try:
+                node = parent[key]
+            except (KeyError, IndexError, TypeError):
+                parent = None
+                break
+        if parent is not None:
+            parent[key] = SENSITIVE
+    return attributes
+
+
+def _step(value, part):
+    if isinstance(value, list):
+        if part.isdigit():
+            return value[int(part)]
+        # Nested blocks are stored as lists; most (os_disk, identity, ...) hold exactly one
+        if len(value) == 1:
+            value = value[0]
+    if isinstance(value, dict) and part in value:
+        return value[part]
+    available = ", ".join(sorted(value)) if isinstance(value, dict) else type(value).__name__
+    raise ValueError(f"No attribute '{part}' (available: {available})")
+
+
+class StateIndex:
+    """Byte spans of every resource in a state file, keyed by address.
+
+    Building the index streams the file once; a lookup then reads and parses
+    only the one resource it needs.
+    """
+
+    def __init__(self, path, chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.lineage, self.serial = _read_header(path)
+        self.size = os.path.getsize(path)
+        self.spans = {}
+        with open(path, "rb") as f:
+            for start, end, raw in iter_array_items(f, "resources", chunk_size):
+                self.spans[resource_address(raw)] = (start, end)
+
+    def is_current(self):
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return False
+        return size == self.size and _read_header(self.path) == (self.lineage, self.serial)
+
+    def addresses(self):
+        return list(self.spans)
+
+    def resource(self, address):
+        start, end = self.spans[address]
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            return json.loads(f.read(end - start))
+
+    def _match(self, query):
+        # Longest address the query starts with, so "vm.os_disk" never matches "vm.os" by accident
+        matches = [a for a in self.spans if query == a or query.startswith((a + ".", a + "["))]
+        if not matches:
+            raise ValueError(f"No resource in state matches '{query}'")
+        return max(matches, key=len)
+
+    def lookup(self, query):
+        """Return (address, value) for e.g. azurerm_linux_virtual_machine.vm.os_disk.disk_size_gb."""
+        address = self._match(query)
+        rest = query[len(address):]
+        instances = self.resource(address).get("instances", [])
+
+        match = INDEX_KEY.match(rest)
+        if match:
+            index_key = json.loads(match.group(1))
+            rest = rest[match.end():]
+            instances = [i for i in instances if i.get("index_key") == index_key]
+            address += match.group()
+        if not instances:
+            raise ValueError(f"{address} has no instances in state")
+        if len(instances) > 1:
+            keys = ", ".join(json.dumps(i.get("index_key")) for i in instances)
+            raise ValueError(f"{address} has several instances; pick one with [key] ({keys})")
+
+        instance = instances[0]
+        value = _redact(instance.get("attributes", {}), instance.get("sensitive_attributes"))
+        for part in filter(None, rest.split(".")):
+            value = _step(value, part)
+            address += "." + part
+        return address, value
+
+
+def load_state_index(path):
+    """Index for a state file, reused while its lineage, serial and size are unchanged."""
+    path = os.path.abspath(path)
+    index = _indexes.get(path)
+    if index is None or not index.is_current():
+        index = _indexes[path] = StateIndex(path)
+    return index
+
+
+def read_state(query: str) -> str:
+    """Look up deployed values in terraform.tfstate by address."""
+    from modules.terraform_runner import get_hcl_dir
+
+    query = query.strip().strip("'\"`")
+    path = os.path.join(get_hcl_dir(), STATE_FILE)
+    if not os.path.exists(path):
+        return "[❌] Error: No terraform.tfstate found; nothing has been applied yet."
+    try:
+        index = load_state_index(path)
+        if query in ("", "list"):
+            addresses = "\n".join(f"  {a}" for a in index.addresses())
+            return f"[📦] {len(index.spans)} resources in state (serial {index.serial}):\n{addresses}"
+        address, value = index.lookup(query)
+    except (OSError, ValueError) as e:
+        return f"[❌] Error: {e}"
+    return f"{address} = {json.dumps(value, indent=2)}"
@@ -1,17 +1,50 @@
+import argparse
 import os
 import subprocess
-import shutil
 import json
+import difflib
 import logging
-from datetime import datetime
-from langchain_ollama import OllamaLLM
 import re
+import sys
+import time
+from contextlib import contextmanager
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from modules.llm_stream import ResponseCleaner, clean_response
+from modules.hcl_patch import PatchError, apply_patch, describe_patch, parse_patch
+from modules.llm_cache import LLMCache
+from modules.hcl_context import DELETE_MARKER, estimate_tokens, merge_scoped_response, plan_targets, select_context
+from modules.backup_store import BackupStore
+from modules.terraform_runner import apply_saved_plan, ensure_init, last_refresh, run_saved_plan, run_terraform
+from modules.terraform_io import BlockIndex, Workspace
+from modules.hcl_lexer import close_unclosed, error_region, find_syntax_error, parse_blocks
+from modules.parser import parse_request
+from modules.vm_manager import apply_parsed_request
+from modules.metrics import load_spans, metrics
+from modules.llm_client import ollama_llm
+
 # === CONFIG ===
-TERRAFORM_FILE = "/mnt/c/Users/TonyFelix/Documents/AI-ASSISTANT/AzureVm/main.tf"
-BACKUP_DIR = "/mnt/c/Users/TonyFelix/Documents/AI-ASSISTANT/AzureVm/backups"
-LOG_FILE = "/mnt/c/Users/TonyFelix/Documents/AI-ASSISTANT/AzureVm/terraform_assistant.log"
+WORKSPACE_DIR = os.environ.get("TF_ASSISTANT_WORKSPACE", "/mnt/c/Users/TonyFelix/Documents/AI-ASSISTANT/AzureVm")
+TERRAFORM_FILE = os.path.join(WORKSPACE_DIR, "main.tf")
+BACKUP_DIR = os.path.join(WORKSPACE_DIR, "backups")
+LOG_FILE = os.path.join(WORKSPACE_DIR, "terraform_assistant.log")
+STREAM_LLM = True  # Consume LLM output as it arrives and abort early on malformed output
+EDIT_MODE = "patch"  # "patch" asks the LLM for block-level edits, "full" for the whole file
+LLM_MODEL = "llama3"
+LLM_CACHE_ENABLED = True  # Set TF_ASSISTANT_NO_CACHE=1 to bypass for a single run
+# Bump when a prompt template changes so old cached generations are not reused
+PROMPT_VERSIONS = {"fix": 3, "patch": 2, "suggestions": 2}
+SCOPED_CONTEXT = True  # Only send the blocks a task touches (plus their dependencies) to the LLM
+TERRAFORM_INIT_UPGRADE = False  # Pass -upgrade to terraform init (re-resolves provider versions)
+FAST_PLAN = True  # Check edits with a plan of only the changed resources first; the full plan still runs before apply
+FAST_PLAN_REFRESH_MAX_AGE = 600  # Fast plans skip refresh if the state was refreshed this many seconds ago (0: always refresh)
+BACKUP_KEEP_LAST = 100  # Versions always kept in the backup store...
+BACKUP_KEEP_DAYS = 30   # ...plus any version newer than this
+TERRAFORM_BLOCK_TYPES = ("resource", "provider", "data", "module", "variable", "output")
+MAX_REPAIRS = 3  # Localized repair prompts per generation, each covering one broken block
+BATCH_GROUP_SIZE = 8  # Batch mode: tasks sent to the LLM together in one request
+BATCH_REFUSED_ACTIONS = {"TerraformApply", "TerraformPlanThenApply", "TerraformDestroy"}  # Never run inside a batch
 
 # === LOGGING SETUP ===
 logging.basicConfig(
@@ -23,15 +56,30 @@ logging.basicConfig(
     ]
 )
 logger = logging.getLogger(__name__)
+# Stage timings go to metrics.jsonl / metrics.prom next to the log
+metrics.configure(os.environ.get("TF_ASSISTANT_METRICS_DIR") or WORKSPACE_DIR)
 
 # === LLM SETUP ===
-llm = OllamaLLM(model="llama3")
+# Pooled keep-alive connections; the model is preloaded in the background and kept warm while idle
+llm = ollama_llm(LLM_MODEL)
 
 class TerraformAssistant:
     def __init__(self, terraform_file_path, backup_dir):
         self.terraform_file = Path(terraform_file_path)
+        self.workspace = Workspace(self.terraform_file)  # cached content, atomic writes
         self.backup_dir = Path(backup_dir)
         self.backup_dir.mkdir(parents=True, exist_ok=True)
+        self.backups = BackupStore(self.backup_dir, keep_last=BACKUP_KEEP_LAST, keep_days=BACKUP_KEEP_DAYS)
+        imported = self.backups.import_legacy()
+        if imported:
+            logger.info(f"Imported {imported} legacy backup files into the backup store")
+        self.cache = LLMCache(self.terraform_file.parent / ".llm_cache", enabled=LLM_CACHE_ENABLED)
+        self.last_syntax_error = None
+        self.plan_baseline = None  # main.tf as of the last successful full plan
+        self.request_baseline = None  # main.tf before the first write of the current request
+
+    def _cache_key(self, kind, tf_code, user_task, extra=""):
+        return self.cache.make_key(kind, tf_code, user_task, LLM_MODEL, PROMPT_VERSIONS[kind], extra)
         
     def read_terraform_file(self):
         """Read the Terraform file and return its content."""
@@ -40,106 +88,99 @@ class TerraformAssistant:
             return ""
         
         try:
-            with open(self.terraform_file, "r", encoding="utf-8") as f:
-                content = f.read()
-                logger.info(f"Successfully read Terraform file: {self.terraform_file}")
-                return content
+            return self.workspace.content()
         except Exception as e:
             logger.error(f"Error reading file: {e}")
             return ""
 
-    def write_terraform_file(self, content):
+    def write_terraform_file(self, content, note=""):
         """Write content to Terraform file after creating a backup."""
         try:
-            # Create backup
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_path = self.backup_dir / f"main_{timestamp}.tf"
-            shutil.copy(self.terraform_file, backup_path)
-            logger.info(f"Backup saved to: {backup_path}")
-            print(f"📦 Backup saved to: {backup_path}")
-
-            # Write new content
-            with open(self.terraform_file, "w", encoding="utf-8") as f:
-                f.write(content)
-                f.flush()
-                os.fsync(f.fileno())
+            # Create backup (deduplicated: an unchanged file does not add a version)
+            with metrics.span("backup") as span:
+                entry = self.backups.save(self.read_terraform_file(), note=note)
+                span.set(version=entry["version"])
+            logger.info(f"Backup saved as version {entry['version']} ({entry['hash'][:12]})")
+            print(f"📦 Backup saved as version {entry['version']} (use 'history' / 'restore {entry['version']}')")
+
+            # Write new content: temp file, fsync, rename, so a crash never leaves a truncated main.tf
+            with metrics.span("write", bytes=len(content.encode("utf-8"))):
+                self.workspace.write(content)
             logger.info("Terraform file updated successfully")
             
         except Exception as e:
             logger.error(f"Error writing file: {e}")
             raise
 
-    def validate_terraform_syntax(self, content):
-        """Enhanced validation of Terraform syntax."""
+    def validate_terraform_syntax(self, content, scoped=False):
+        """Validate Terraform syntax with the HCL lexer, remembering the first error in last_syntax_error.
+
+        A scoped answer may consist of `# DELETE <address>` lines only.
+        """
+        with metrics.span("validate", bytes=len(content or "")) as span:
+            valid = self._check_syntax(content, scoped)
+            span.set("ok" if valid else "invalid")
+        return valid
+
+    def _check_syntax(self, content, scoped=False):
+        self.last_syntax_error = None
         if not content or not content.strip():
             logger.warning("Content is empty")
             return False
-            
-        # Check for basic Terraform blocks
-        required_patterns = [
-            r'\bresource\s+"[^"]+"\s+"[^"]+"\s*\{',
-            r'\bprovider\s+"[^"]+"\s*\{',
-            r'\bdata\s+"[^"]+"\s+"[^"]+"\s*\{',
-            r'\bmodule\s+"[^"]+"\s*\{',
-            r'\bvariable\s+"[^"]+"\s*\{',
-            r'\boutput\s+"[^"]+"\s*\{'
-        ]
-        
-        has_terraform_block = any(re.search(pattern, content) for pattern in required_patterns)
-        
-        if not has_terraform_block:
-            logger.warning("Content doesn't appear to contain valid Terraform blocks")
-            return False
-        
-        # Check for balanced braces
-        open_braces = content.count('{')
-        close_braces = content.count('}')
-        
-        if open_braces != close_braces:
-            logger.warning(f"Unbalanced braces: {open_braces} open, {close_braces} close")
-            # Try to auto-balance if only off by one
-            if abs(open_braces - close_braces) == 1:
-                logger.info("Attempting to auto-balance braces")
-                return self.try_auto_balance_braces(content, open_braces, close_braces)
+
+        # Strings, heredocs, comments and ${} interpolations are lexed, so braces inside them don't count
+        error = find_syntax_error(content)
+        if error:
+            self.last_syntax_error = error
+            logger.warning(f"Syntax error at {error}")
             return False
-            
-        # Check for basic syntax issues
-        if content.count('"') % 2 != 0:
-            logger.warning("Unbalanced quotes detected")
+
+        if not any(block.type in TERRAFORM_BLOCK_TYPES for block in parse_blocks(content)) \
+                and not (scoped and DELETE_MARKER.search(content)):
+            logger.warning("Content doesn't appear to contain valid Terraform blocks")
             return False
-            
         return True
 
-    def try_auto_balance_braces(self, content, open_count, close_count):
-        """Attempt to auto-balance braces if only off by one."""
-        if open_count > close_count:
-            # Missing closing brace - add it at the end
-            content += "\n}"
-            logger.info("Added missing closing brace")
-        elif close_count > open_count:
-            # Extra closing brace - try to remove the last one
-            last_brace_pos = content.rfind('}')
-            if last_brace_pos != -1:
-                content = content[:last_brace_pos] + content[last_brace_pos+1:]
-                logger.info("Removed extra closing brace")
-        
-        # Store the corrected content for potential use
-        self._corrected_content = content
-        return True
+    def try_auto_balance_braces(self, content):
+        """Close a single block left open at the end of the file; returns the repaired content or None."""
+        repaired = close_unclosed(content, limit=1)
+        if repaired is None or repaired == content:
+            return None
+        logger.info("Added missing closing brace at end of file")
+        return repaired
+
+    def get_fix_from_llm(self, tf_code, user_task, error_msg="", retry_count=0, cache_key=None, scoped=False):
+        """Get updated Terraform configuration from LLM.
+
+        With scoped=True, tf_code holds only the relevant blocks and the LLM
+        returns updated copies of those blocks instead of the whole file.
+        """
+        if retry_count == 0:
+            cache_key = self._cache_key("fix", tf_code, user_task, error_msg + ("scoped" if scoped else ""))
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info("Using cached LLM configuration")
+                print("⚡ Using cached configuration for this request")
+                return cached
 
-    def get_fix_from_llm(self, tf_code, user_task, error_msg="", retry_count=0):
-        """Get updated Terraform configuration from LLM."""
         context = "You are a Terraform expert specializing in Azure infrastructure."
         
         if retry_count > 0:
             context += f" This is retry attempt #{retry_count}. The previous attempt had syntax issues (unbalanced braces). Please be extremely careful with brace matching - every opening brace {{ must have a corresponding closing brace }}."
         
         error_section = f"Terraform Error that needs to be fixed:\n{error_msg}\n" if error_msg else ""
+        if scoped:
+            heading = "Below are the blocks of the Terraform file relevant to this request (all other blocks are omitted and stay unchanged):"
+            output_rule = ("- Return ONLY the blocks you change plus any new blocks; blocks you leave out stay unchanged\n"
+                           "- To delete a block, write a line `# DELETE <address>`, e.g. `# DELETE azurerm_public_ip.pip`")
+        else:
+            heading = "Below is the current Terraform file:"
+            output_rule = "- Return ONLY the updated full Terraform file content"
         
         prompt = f"""
 {context}
 
-Below is the current Terraform file:
+{heading}
 ```hcl
 {tf_code}
 ```
@@ -150,7 +191,7 @@ User request:
 {error_section}
 
 CRITICAL INSTRUCTIONS:
-- Return ONLY the updated full Terraform file content
+{output_rule}
 - Use proper HCL (HashiCorp Configuration Language) syntax
 - ENSURE ALL BRACES ARE BALANCED - count your opening and closing braces carefully
 - Every resource block, provider block, and nested block MUST be properly closed
@@ -166,113 +207,252 @@ Output only valid HCL code:
         logger.info(f"Sending prompt to LLM (attempt {retry_count + 1})")
         
         try:
-            raw_response = llm.invoke(prompt).strip()
-            logger.info("Received response from LLM")
-            
-            # Clean the response
-            cleaned_response = self.clean_llm_response(raw_response)
-            
-            # Check if we have a corrected version from auto-balancing
-            if hasattr(self, '_corrected_content'):
-                cleaned_response = self._corrected_content
-                delattr(self, '_corrected_content')
-                logger.info("Using auto-corrected content with balanced braces")
+            if STREAM_LLM:
+                cleaned_response, malformed = self.stream_llm_response(prompt, max_chars=len(tf_code) * 3 + 4000)
+            else:
+                raw_response = self.invoke_llm(prompt, "fix")
+                logger.info("Received response from LLM")
+                cleaned_response, malformed = clean_response(raw_response), False
             
-            if not self.validate_terraform_syntax(cleaned_response):
+            valid = not malformed and self.validate_terraform_syntax(cleaned_response, scoped)
+            if not valid and not malformed:
+                # A missing final brace is fixed locally instead of costing another generation
+                repaired = self.try_auto_balance_braces(cleaned_response)
+                if repaired and self.validate_terraform_syntax(repaired, scoped):
+                    cleaned_response, valid = repaired, True
+
+            if not valid and not malformed and self.last_syntax_error:
+                # Regenerate only the broken block(s), so a retry costs as much as the block, not the file
+                cleaned_response = self.repair_syntax(cleaned_response, user_task)
+                valid = self.validate_terraform_syntax(cleaned_response, scoped)
+                if not valid:
+                    logger.error("Localized repair could not fix the LLM response")
+                    print("⚠️ Warning: LLM struggled to generate perfect syntax. You may need to manually review the output.")
+                    return cleaned_response
+
+            if not valid:
+                # Truncated or block-less output: nothing to repair locally, generate again
                 logger.warning("LLM response failed validation")
                 if retry_count < 2:  # Allow up to 3 attempts
                     logger.info("Retrying with LLM...")
-                    error_detail = "Previous attempt had syntax issues. Please ensure proper HCL syntax with balanced braces."
+                    if self.last_syntax_error:
+                        error_detail = (f"Previous attempt had a syntax error at {self.last_syntax_error}. "
+                                        "Please ensure proper HCL syntax with balanced braces.")
+                    else:
+                        error_detail = "Previous attempt had syntax issues. Please ensure proper HCL syntax with balanced braces."
                     if error_msg:
                         error_detail += f"\n\nOriginal error: {error_msg}"
-                    return self.get_fix_from_llm(tf_code, user_task, error_detail, retry_count + 1)
+                    return self.get_fix_from_llm(tf_code, user_task, error_detail, retry_count + 1, cache_key, scoped)
                 else:
                     logger.error("LLM failed to generate valid Terraform code after multiple attempts")
                     # Return the best attempt we have, even if not perfect
                     print("⚠️ Warning: LLM struggled to generate perfect syntax. You may need to manually review the output.")
                     return cleaned_response
             
+            self.cache.put(cache_key, cleaned_response, kind="fix")
             return cleaned_response
             
         except Exception as e:
             logger.error(f"Error getting fix from LLM: {e}")
             raise
 
-    def clean_llm_response(self, raw_response):
-        """Enhanced cleaning of LLM response to extract only valid HCL code."""
-        # Remove markdown code blocks if present
-        raw_response = re.sub(r'```\w*\n?', '', raw_response)
-        raw_response = re.sub(r'```', '', raw_response)
-        
-        # Remove common LLM explanatory prefixes
-        prefixes_to_remove = [
-            r'^Here\'s the updated Terraform configuration:?\s*\n',
-            r'^Here is the updated Terraform file:?\s*\n',
-            r'^Updated Terraform configuration:?\s*\n',
-            r'^The updated configuration is:?\s*\n'
-        ]
-        
-        for prefix in prefixes_to_remove:
-            raw_response = re.sub(prefix, '', raw_response, flags=re.IGNORECASE | re.MULTILINE)
-        
-        # Split into lines for processing
-        lines = raw_response.splitlines()
-        cleaned_lines = []
-        terraform_started = False
-        brace_count = 0
-        
-        for line in lines:
-            stripped_line = line.strip()
-            
-            # Skip empty lines at the beginning
-            if not terraform_started and not stripped_line:
-                continue
-                
-            # Start capturing when we see terraform blocks
-            if re.match(r'^\s*(resource|provider|variable|output|module|data|terraform|locals)\b', line):
-                terraform_started = True
-                cleaned_lines.append(line)
-                brace_count += line.count('{') - line.count('}')
-            elif terraform_started:
-                # Continue capturing all lines after terraform blocks start
-                cleaned_lines.append(line)
-                brace_count += line.count('{') - line.count('}')
-                
-                # If we've closed all braces and hit a non-terraform line, we might be done
-                if brace_count == 0 and stripped_line and not re.match(r'^\s*(#|//)', line) and not any(char in stripped_line for char in '{}'):
-                    # This might be explanatory text after the code, stop here
-                    break
-            elif not terraform_started and stripped_line and not stripped_line.startswith('#'):
-                # Skip explanatory text before terraform blocks
-                continue
-            else:
-                # Include comments and empty lines if terraform has started
-                if terraform_started:
-                    cleaned_lines.append(line)
-        
-        result = "\n".join(cleaned_lines).strip()
-        
-        # Final cleanup - remove any trailing explanatory text that might have slipped through
-        result = re.sub(r'\n\n[A-Za-z][^{}\n]*$', '', result, flags=re.MULTILINE | re.DOTALL)
+    def repair_syntax(self, content, user_task):
+        """Fix syntax errors by sending only the block around each error to the LLM and splicing it back."""
+        for attempt in range(MAX_REPAIRS):
+            error = find_syntax_error(content)
+            if error is None:
+                break
+            start, end = error_region(content, error.pos)
+            fragment = content[start:end].rstrip()
+            # Positions relative to the fragment, which is all the LLM sees
+            local_error = find_syntax_error(fragment) or error
+            others = [b.address for b in parse_blocks(content, 0, start) + parse_blocks(content, end)]
+            logger.info(f"Repairing {len(fragment)} of {len(content)} chars around line {error.line}: {error.message}")
+            print(f"🩹 Repairing the block at line {error.line} ({len(fragment)} of {len(content)} chars): {error.message}")
+
+            fixed = self.get_repair_from_llm(fragment, local_error, user_task, others)
+            if not fixed:
+                logger.warning("Repair attempt returned nothing usable")
+                break
+            content = content[:start] + fixed.strip() + ("\n\n" if end < len(content) else "\n") + content[end:].lstrip("\n")
+        return content
+
+    def get_repair_from_llm(self, fragment, error, user_task, other_addresses):
+        """Ask the LLM to fix the syntax of one fragment; returns the cleaned fragment or None."""
+        prompt = f"""
+You are a Terraform expert specializing in Azure infrastructure.
+
+This fragment of a generated Terraform file has a syntax error:
+```hcl
+{fragment}
+```
+
+Syntax error: {error} (counting from the first line of the fragment)
+
+The file was written for this request: "{user_task}"
+Other blocks in the file, unchanged and available for references: {", ".join(other_addresses) or "none"}
+
+CRITICAL INSTRUCTIONS:
+- Return ONLY the corrected fragment, with the same blocks, names and values
+- Fix the syntax error and make no other changes
+- Do NOT include markdown formatting, explanations, or backticks
+
+Output only valid HCL code:
+"""
+        if STREAM_LLM:
+            fixed, malformed = self.stream_llm_response(prompt, max_chars=len(fragment) * 3 + 1000, kind="repair")
+            if malformed:
+                return None
+        else:
+            fixed = clean_response(self.invoke_llm(prompt, "repair"))
+        return fixed or None
+
+    def get_patch_from_llm(self, tf_code, user_task, selection=None, numbered_tasks=False):
+        """Ask the LLM for a compact block-level patch and apply it locally."""
+        if selection is not None and selection.scoped:
+            heading = "Below are the blocks of the Terraform file relevant to this request (other blocks are omitted):"
+            context_code = selection.text
+        else:
+            heading = "Below is the current Terraform file:"
+            context_code = tf_code
+        task_rule = ('- The request is a numbered list: add "task": <number> to every operation, '
+                     'naming the request it implements\n') if numbered_tasks else ""
+        prompt = f"""
+You are a Terraform expert specializing in Azure infrastructure.
+
+{heading}
+```hcl
+{context_code}
+```
+
+User request:
+👉 "{user_task}"
+
+Describe the change as a JSON list of edit operations instead of rewriting the file.
+Blocks are addressed as "<resource_type>.<name>" for resources, "data.<type>.<name>",
+"module.<name>", "provider.<name>", "var.<name>" and "output.<name>".
+
+Supported operations:
+- {{"op": "set", "address": "<block>", "attribute": "<name or nested.name>", "value": "<HCL expression>"}}
+- {{"op": "unset", "address": "<block>", "attribute": "<name or nested.name>"}}
+- {{"op": "replace", "address": "<block>", "content": "<complete new HCL block>"}}
+- {{"op": "insert", "content": "<complete new HCL block>", "after": "<optional block>"}}
+- {{"op": "delete", "address": "<block>"}}
+
+Example - resize the OS disk of azurerm_linux_virtual_machine.vm to 64 GB:
+[{{"op": "set", "address": "azurerm_linux_virtual_machine.vm", "attribute": "os_disk.disk_size_gb", "value": "64"}}]
+
+CRITICAL INSTRUCTIONS:
+- Prefer "set"/"unset" for attribute changes; use "replace" only when most of a block changes
+- String values must include their HCL quotes, e.g. "\"Standard_B2s\""
+- Make minimal changes and keep existing resource naming conventions
+{task_rule}- Do NOT include explanations
+
+Output only the JSON list:
+"""
+        cached = self.cache.get(self._cache_key("patch", tf_code, user_task))
+        if cached is not None:
+            logger.info("Using cached LLM patch")
+            print("⚡ Using cached patch for this request")
+            raw_response = cached
+        else:
+            logger.info("Requesting patch from LLM")
+            raw_response = self.invoke_llm(prompt, "patch")
+            logger.info(f"Received patch from LLM ({len(raw_response)} chars)")
+
+        ops = parse_patch(raw_response)
+        updated = apply_patch(tf_code, ops)
+        logger.info(f"Applied {len(ops)} patch operation(s)")
+        return updated, ops
+
+    def get_updated_configuration(self, tf_code, user_task):
+        """Return (updated_content, patch_ops), falling back to full regeneration when patching fails."""
+        selection = self.select_prompt_context(tf_code, user_task)
+        if EDIT_MODE == "patch":
+            try:
+                updated, ops = self.get_patch_from_llm(tf_code, user_task, selection)
+                if self.validate_terraform_syntax(updated):
+                    self.cache.put(self._cache_key("patch", tf_code, user_task), json.dumps(ops), kind="patch")
+                    return updated, ops
+                logger.warning("Patched configuration failed validation")
+            except PatchError as e:
+                logger.warning(f"Could not apply LLM patch: {e}")
+            print("⚠️ Patch edit failed, falling back to full file regeneration...")
+        if selection.scoped:
+            updated_blocks = self.get_fix_from_llm(selection.text, user_task, scoped=True)
+            return merge_scoped_response(tf_code, selection, updated_blocks), None
+        return self.get_fix_from_llm(tf_code, user_task), None
+
+    def select_prompt_context(self, tf_code, user_task, error_msg=""):
+        """Choose which blocks go into the prompt and report the tokens saved."""
+        if not SCOPED_CONTEXT:
+            return select_context(tf_code, "", "")  # never scoped: nothing to seed from
+        with metrics.span("prompt_build", bytes=len(tf_code)) as span:
+            selection = select_context(tf_code, user_task, error_msg)
+            span.set(context_tokens=selection.context_tokens, full_tokens=selection.full_tokens,
+                     scoped=selection.scoped)
+        logger.info(f"Prompt context: {selection.summary()}")
+        if selection.scoped:
+            print(f"🎯 Prompt context: {selection.summary()}")
+        return selection
+
+    def invoke_llm(self, prompt, kind):
+        """Non-streaming LLM call, timed as an `llm` span."""
+        with metrics.span("llm", kind=kind, streamed=False, prompt_tokens=estimate_tokens(prompt)) as span:
+            response = llm.invoke(prompt).strip()
+            span.set(response_tokens=estimate_tokens(response))
+        return response
+
+    def stream_llm_response(self, prompt, max_chars=None, kind="fix"):
+        """Stream the LLM response through the cleaner, stopping early on malformed output.
+
+        Returns the cleaned configuration and whether the stream was cut off as malformed.
+        """
+        def show_progress(cleaner):
+            print(f"\r⏳ Receiving configuration: {len(cleaner.lines)} lines, depth {cleaner.scanner.depth}   ", end="", flush=True)
+
+        cleaner = ResponseCleaner(max_chars=max_chars, on_progress=show_progress)
+        clean_seconds = 0.0
+        with metrics.span("llm", kind=kind, streamed=True, prompt_tokens=estimate_tokens(prompt)) as span:
+            stream = llm.stream(prompt)
+            try:
+                # Time to first token is recorded by the client (llm_first_token)
+                for chunk in stream:
+                    started = time.perf_counter()
+                    keep_going = cleaner.feed(chunk)
+                    clean_seconds += time.perf_counter() - started
+                    if not keep_going:
+                        break
+            finally:
+                # Closing the generator drops the connection so the model stops generating
+                stream.close()
+            span.set(response_tokens=estimate_tokens("\n".join(cleaner.lines)), stop_reason=cleaner.stop_reason)
+        print()
         
-        logger.info(f"Cleaned LLM response - {len(lines)} lines -> {len(cleaned_lines)} lines")
-        return result
+        started = time.perf_counter()
+        result = cleaner.finish()
+        # Cleaning runs interleaved with the stream, so its span is the sum of the feed() calls
+        metrics.record("clean", clean_seconds + time.perf_counter() - started,
+                       "malformed" if cleaner.malformed else "ok", streamed=True, lines=len(cleaner.lines))
+        if cleaner.stop_reason:
+            logger.info(f"Stopped LLM stream early: {cleaner.stop_reason}")
+        logger.info(f"Cleaned LLM response - {cleaner.total_lines} lines -> {len(cleaner.lines)} lines")
+        if cleaner.malformed:
+            logger.warning("Streamed LLM response was malformed")
+        return result, cleaner.malformed
 
     def run_terraform_command(self, command, cwd=None):
-        """Run a terraform command and return the result."""
+        """Run a terraform command, streaming its output, and return the result."""
         if cwd is None:
             cwd = self.terraform_file.parent
             
         logger.info(f"Running terraform command: {' '.join(command)}")
         
         try:
-            result = subprocess.run(
-                command, 
-                cwd=cwd, 
-                capture_output=True, 
-                text=True,
-                timeout=300  # 5 minute timeout
-            )
+            # Output is streamed to the console line by line while the command runs
+            result = run_terraform(command[1:], cwd=str(cwd), timeout=300)  # 5 minute timeout
+            if result.timed_out:
+                raise subprocess.TimeoutExpired(command, 300)
             
             if result.returncode == 0:
                 logger.info(f"Command successful: {' '.join(command)}")
@@ -290,12 +470,14 @@ Output only valid HCL code:
 
     def get_error_suggestions(self, tf_code, user_task, error_msg):
         """Get detailed suggestions and explanations for fixing Terraform errors."""
+        selection = self.select_prompt_context(tf_code, user_task, error_msg)
+        heading = "Relevant parts of the Terraform Configuration:" if selection.scoped else "Current Terraform Configuration:"
         prompt = f"""
 You are a Terraform expert consultant. Instead of providing code, give detailed explanations and suggestions.
 
-Current Terraform Configuration:
+{heading}
 ```hcl
-{tf_code}
+{selection.text}
 ```
 
 User's Original Request: "{user_task}"
@@ -323,11 +505,18 @@ Please provide a detailed analysis in the following format:
 Be detailed in your explanations but keep it practical and actionable. Focus on helping the user understand WHY the fix is needed, not just WHAT to change.
 """
         
+        cache_key = self._cache_key("suggestions", tf_code, user_task, error_msg)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            logger.info("Using cached error analysis")
+            return cached
+
         logger.info("Requesting error analysis from LLM")
         
         try:
-            response = llm.invoke(prompt).strip()
+            response = self.invoke_llm(prompt, "suggestions")
             logger.info("Received error analysis from LLM")
+            self.cache.put(cache_key, response, kind="suggestions")
             return response
             
         except Exception as e:
@@ -383,6 +572,41 @@ Be detailed in your explanations but keep it practical and actionable. Focus on
         
         print("\n💡 TIP: Make small, incremental changes and test each one with 'terraform plan'.")
 
+    def show_history(self):
+        """List backup versions, newest first."""
+        versions = self.backups.list_versions()
+        if not versions:
+            print("📭 No backups yet.")
+            return
+        print("\n🗂️ BACKUP HISTORY:")
+        for entry in reversed(versions):
+            print(f"  v{entry['version']:<4} {entry['timestamp']}  {entry['size']:>7} bytes  {entry['note']}")
+
+    def show_diff(self, old_version, new_version=None):
+        """Diff two backup versions, or a version against the current file."""
+        try:
+            diff = self.backups.diff(old_version, new_version, current_content=self.read_terraform_file())
+        except (KeyError, ValueError) as e:
+            print(f"❌ {e}")
+            return
+        print(diff or "No differences.")
+
+    def restore_version(self, version):
+        """Restore a backup version locally; the current file is backed up first."""
+        try:
+            content = self.backups.get(version)
+        except (KeyError, ValueError) as e:
+            print(f"❌ {e}")
+            return False
+        self.show_diff(version)
+        confirm = input(f"\n⏪ Restore version {version} over the current file? (yes/no): ").strip().lower()
+        if confirm not in ['yes', 'y']:
+            print("❌ Restore cancelled.")
+            return False
+        self.write_terraform_file(content, note=f"before restore of v{version}")
+        print(f"✅ Restored version {version}.")
+        return True
+
     def show_current_file(self):
         """Display the current Terraform file content."""
         current_content = self.read_terraform_file()
@@ -407,21 +631,31 @@ Be detailed in your explanations but keep it practical and actionable. Focus on
             tf_code = self.read_terraform_file()
             if not tf_code:
                 return False
+            self.request_baseline = tf_code
 
             print("\n🧠 Getting updated configuration from LLM...")
-            raw_response = self.get_fix_from_llm(tf_code, task_description)
+            raw_response, patch_ops = self.get_updated_configuration(tf_code, task_description)
 
-            print("\n🔍 LLM-generated updated Terraform configuration:\n")
-            print("=" * 60)
-            print(raw_response)
-            print("=" * 60)
+            if patch_ops is not None:
+                print("\n🔍 LLM-generated patch:\n")
+                print(describe_patch(patch_ops))
+                print("=" * 60)
+                print("".join(difflib.unified_diff(
+                    tf_code.splitlines(keepends=True), raw_response.splitlines(keepends=True),
+                    fromfile="main.tf (current)", tofile="main.tf (updated)")))
+                print("=" * 60)
+            else:
+                print("\n🔍 LLM-generated updated Terraform configuration:\n")
+                print("=" * 60)
+                print(raw_response)
+                print("=" * 60)
 
             confirm = input("\n✅ Do you want to apply this update? (yes/no): ").strip().lower()
             if confirm not in ['yes', 'y']:
                 print("❌ Change cancelled.")
                 return False
 
-            self.write_terraform_file(raw_response)
+            self.write_terraform_file(raw_response, note=f"before: {task_description}")
             print("✅ Terraform file updated successfully.")
 
             # Ask about running terraform plan
@@ -437,37 +671,195 @@ Be detailed in your explanations but keep it practical and actionable. Focus on
             print(f"❌ Error: {e}")
             return False
 
+    def _batch_llm_group(self, content, group, tasks, report):
+        """Send a group of tasks to the LLM as one patch request; returns (content, llm_calls)."""
+        combined = "Make ALL of the following changes:\n" + "\n".join(f"{n}. {tasks[n - 1]}" for n in group)
+        selection = self.select_prompt_context(content, combined)
+        try:
+            updated, ops = self.get_patch_from_llm(content, combined, selection, numbered_tasks=True)
+            if not self.validate_terraform_syntax(updated):
+                raise PatchError(f"patched configuration failed validation ({self.last_syntax_error or 'no blocks'})")
+        except Exception as e:
+            # PatchError, a failed validation or the LLM request itself; each task gets its own report
+            if len(group) == 1:
+                report[group[0]] = ("❌", "llm", str(e))
+                return content, 1
+            # One bad task shouldn't sink the whole group: retry them one at a time
+            logger.warning(f"Batch patch for tasks {group} failed ({e}); retrying individually")
+            print(f"⚠️ Grouped patch failed ({e}), retrying tasks {', '.join(map(str, group))} one by one...")
+            calls = 1
+            for n in group:
+                content, extra_calls = self._batch_llm_group(content, [n], tasks, report)
+                calls += extra_calls
+            return content, calls
+
+        self.cache.put(self._cache_key("patch", content, combined), json.dumps(ops), kind="patch")
+        by_task = {}
+        for op in ops:
+            # A single-task request needs no attribution
+            task = group[0] if len(group) == 1 else op.get("task")
+            by_task.setdefault(str(task), []).append(op)
+        for n in group:
+            task_ops = by_task.pop(str(n), None)
+            if task_ops:
+                report[n] = ("✅", "llm", "; ".join(line.strip() for line in describe_patch(task_ops).splitlines()))
+            else:
+                report[n] = ("⚠️", "llm", "no operation was attributed to this task; check the diff")
+        if by_task:
+            logger.warning(f"{sum(map(len, by_task.values()))} patch operation(s) had no valid task number")
+        return updated, 1
+
+    def run_batch(self, tasks, assume_yes=False):
+        """Apply many change requests at once: local edits where possible, grouped LLM calls, one plan."""
+        def confirm(question):
+            if assume_yes:
+                return True
+            try:
+                return input(question).strip().lower() in ['yes', 'y']
+            except EOFError:
+                return False
+
+        # A batch only edits and plans; applying or destroying needs its own request and confirmation
+        parsed_tasks = [parse_request(task) for task in tasks]
+        refused = [n for n, parsed in enumerate(parsed_tasks, 1) if parsed["action"] in BATCH_REFUSED_ACTIONS]
+        if refused:
+            for n in refused:
+                print(f"❌ Task {n} ({tasks[n - 1]}) applies or destroys infrastructure; batches only edit and plan.")
+            print("❌ Batch refused. Remove those tasks and run them on their own after the batch.")
+            return False
+
+        tf_code = self.read_terraform_file()
+        if not tf_code:
+            return False
+        self.request_baseline = tf_code
+
+        # Pass 1: deterministic edits, applied locally in task order
+        index = BlockIndex(tf_code)
+        report = {}
+        llm_tasks = []
+        for n, parsed in enumerate(parsed_tasks, 1):
+            if parsed["action"].startswith("Terraform"):
+                report[n] = ("⏭️", "skip", "covered by the single plan at the end of the batch")
+                continue
+            try:
+                message = apply_parsed_request(index, parsed)
+            except ValueError as e:
+                # e.g. the VM it names is only created by another task; let the LLM handle it
+                logger.info(f"Task {n} not applied locally: {e}")
+                message = None
+            if message:
+                report[n] = ("✅", "local", message)
+            else:
+                llm_tasks.append(n)
+        print(f"\n⚡ {len(tasks) - len(llm_tasks)} of {len(tasks)} tasks handled without the LLM")
+
+        # Pass 2: everything else, BATCH_GROUP_SIZE tasks per LLM request
+        content = index.content
+        llm_calls = 0
+        for i in range(0, len(llm_tasks), BATCH_GROUP_SIZE):
+            group = llm_tasks[i:i + BATCH_GROUP_SIZE]
+            print(f"\n🧠 Asking the LLM for tasks {', '.join(map(str, group))}...")
+            content, calls = self._batch_llm_group(content, group, tasks, report)
+            llm_calls += calls
+
+        print("\n📋 Batch report:")
+        print("=" * 60)
+        for n, task in enumerate(tasks, 1):
+            icon, source, detail = report[n]
+            print(f"{icon} {n:>2}. [{source:<5}] {task}\n        {detail}")
+        print("=" * 60)
+        print(f"{len(tasks)} tasks, {llm_calls} LLM request(s)")
+        logger.info(f"Batch of {len(tasks)} tasks: " + ", ".join(f"{n}={report[n][1]}:{report[n][0]}" for n in report))
+
+        if content == tf_code:
+            print("ℹ️ No changes to write.")
+            return all(report[n][0] != "❌" for n in report)
+        print("".join(difflib.unified_diff(
+            tf_code.splitlines(keepends=True), content.splitlines(keepends=True),
+            fromfile="main.tf (current)", tofile="main.tf (batch)")))
+        print("=" * 60)
+        if not self.validate_terraform_syntax(content):
+            print(f"⚠️ The combined configuration failed validation ({self.last_syntax_error or 'no Terraform blocks'}); "
+                  "review the diff carefully.")
+
+        if not confirm("\n✅ Do you want to apply this update? (yes/no): "):
+            print("❌ Batch cancelled.")
+            return False
+        self.write_terraform_file(content, note=f"before batch of {len(tasks)} tasks")
+        print("✅ Terraform file updated successfully.")
+
+        if not confirm("\n🔍 Run one 'terraform plan' for the whole batch? (yes/no): "):
+            print("🔁 Skipped terraform plan.")
+            return True
+        description = "; ".join(tasks[n - 1] for n in sorted(report) if report[n][1] != "skip")
+        return self.handle_terraform_workflow(description)
+
+    def fast_plan(self, repo_dir):
+        """Plan only what changed since the last full plan (or since this request started); None when a full plan is needed.
+
+        The request baseline is taken before its first write, so a fix written
+        after a failed plan still plans the request's own edits too.
+        """
+        baseline = self.plan_baseline if self.plan_baseline is not None else self.request_baseline
+        targets = plan_targets(baseline, self.read_terraform_file()) if baseline is not None else None
+        if not targets:
+            return None
+
+        refreshed = last_refresh(str(repo_dir))
+        refresh = not (FAST_PLAN_REFRESH_MAX_AGE and refreshed and time.time() - refreshed < FAST_PLAN_REFRESH_MAX_AGE)
+        print(f"\n⚡ Running fast plan for {', '.join(targets)}"
+              f"{'' if refresh else ' (state refreshed recently, skipping refresh)'}...")
+        logger.info(f"Fast plan: {len(targets)} target(s), refresh={refresh}")
+        return run_saved_plan(str(repo_dir), targets=targets, refresh=refresh)
+
     def handle_terraform_workflow(self, task_description):
         """Handle the terraform init, plan, and apply workflow."""
         try:
             repo_dir = self.terraform_file.parent
             
-            # Run terraform init
+            # Run terraform init, unless nothing it depends on changed since the last one
             print("\n🔄 Running terraform init...")
-            init_result = self.run_terraform_command(
-                ["terraform", "init", "-input=false", "-upgrade"], 
-                repo_dir
-            )
+            init_result, skipped = ensure_init(str(repo_dir), upgrade=TERRAFORM_INIT_UPGRADE)
+            if skipped:
+                logger.info("Skipped terraform init: workspace fingerprint unchanged")
+                print("⏭️ Init skipped - providers, modules and backend unchanged since last init.")
             
             if init_result.returncode != 0:
                 print("❌ Terraform init failed:")
                 print(init_result.stderr)
                 return False
 
-            # Run terraform plan
+            # Check the edit with a plan of only the changed resources; the full plan still runs before apply
+            fast = self.fast_plan(repo_dir) if FAST_PLAN else None
+            if fast is not None:
+                plan_result, plan_path = fast
+                if plan_path is None:
+                    print("⚠️ Terraform plan failed. Attempting to fix...")
+                    return self.handle_terraform_error(plan_result, task_description)
+                print("✅ Fast plan successful!")
+                print(plan_result.stdout)
+                print("ℹ️ This plan was targeted (-target) at the changed resources only; "
+                      "it is not a complete plan and cannot be applied.")
+                run_full = input("\n📋 Run the full plan now, to review and apply? (yes/no): ").strip().lower()
+                if run_full not in ['yes', 'y']:
+                    print("⏭️ Full plan skipped. Nothing was applied; run a full terraform plan before applying these changes.")
+                    return True
+
+            # Run terraform plan, saving it so apply executes exactly what was reviewed
             print("\n📋 Running terraform plan...")
-            plan_result = self.run_terraform_command(["terraform", "plan"], repo_dir)
+            logger.info("Running terraform command: terraform plan -out=<saved plan>")
+            plan_result, plan_path = run_saved_plan(str(repo_dir))
 
-            if plan_result.returncode == 0:
+            if plan_path is not None:
                 print("✅ Plan successful!")
                 print(plan_result.stdout)
+                self.plan_baseline = self.read_terraform_file()
+                logger.info(f"Plan saved to: {plan_path}")
                 
                 run_apply = input("\n🚀 Do you want to apply these changes? (yes/no): ").strip().lower()
                 if run_apply in ['yes', 'y']:
-                    apply_result = self.run_terraform_command(
-                        ["terraform", "apply", "-auto-approve"], 
-                        repo_dir
-                    )
+                    logger.info("Running terraform command: terraform apply <saved plan>")
+                    apply_result = apply_saved_plan(str(repo_dir))
                     if apply_result.returncode == 0:
                         print("🎉 Changes applied successfully!")
                         return True
@@ -530,9 +922,56 @@ Be detailed in your explanations but keep it practical and actionable. Focus on
             print(f"❌ Error analyzing terraform issues: {e}")
             return False
 
-def main():
+def read_batch_tasks(source):
+    """Batch tasks, one per line, from a file or stdin ('-'); blank lines and '#' comments are skipped."""
+    if source == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith("#")]
+
+
+@contextmanager
+def terminal_prompts():
+    """Answer input() prompts from the terminal while stdin is a used-up pipe, for this block only."""
+    if sys.stdin.isatty():
+        yield
+        return
+    try:
+        tty = open("/dev/tty")
+    except OSError:
+        yield  # No terminal: prompts read EOF and count as "no"
+        return
+    piped = sys.stdin
+    sys.stdin = tty
+    try:
+        yield
+    finally:
+        sys.stdin = piped
+        tty.close()
+
+
+def main(argv=None):
     """Main function to run the Terraform AI Assistant."""
+    parser = argparse.ArgumentParser(description="Terraform AI Assistant")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="Run the change requests in FILE (one per line, '-' for stdin) as a single batch")
+    parser.add_argument("--yes", action="store_true", help="Batch mode: write the update and plan without asking")
+    args = parser.parse_args(argv)
+
     assistant = TerraformAssistant(TERRAFORM_FILE, BACKUP_DIR)
+
+    if args.batch:
+        tasks = read_batch_tasks(args.batch)
+        if not tasks:
+            print("⚠️ No tasks found.")
+            return 1
+        if args.batch != "-" or args.yes:
+            return 0 if assistant.run_batch(tasks, assume_yes=args.yes) else 1
+        # Tasks were piped in; confirmations still come from the terminal
+        with terminal_prompts():
+            return 0 if assistant.run_batch(tasks) else 1
     
     print("🤖 Enhanced Terraform AI Assistant with Manual Error Resolution")
     print("=" * 70)
@@ -545,6 +984,9 @@ def main():
     print("Commands:")
     print("  - Describe your terraform modification request")
     print("  - Type 'show' to view current file content")
+    print("  - Type 'history', 'diff <v> [v]' or 'restore <v>' to manage backups")
+    print("  - Type 'batch <file>' to run many requests with one generation and one plan")
+    print("  - Type 'metrics' for p50/p95 timings per stage")
     print("  - Type 'help' for more information")
     print("  - Type 'exit' to quit")
     print("=" * 70)
@@ -573,12 +1015,50 @@ def main():
                 print("   • You maintain full control - no automatic fixes!")
                 print("\n🔹 ADDITIONAL COMMANDS:")
                 print("   • 'show' - Display current Terraform file")
+                print("   • 'history' - List backup versions")
+                print("   • 'diff <v> [v2]' - Compare a backup version with the current file or another version")
+                print("   • 'restore <v>' - Roll back to a backup version (no LLM involved)")
+                print("   • 'cache' / 'cache clear' - Show or clear cached LLM generations")
+                print("   • 'batch <file>' - Run one request per line from a file, then a single plan")
+                print("   • 'metrics' / 'metrics all' - Stage timings for this session / all sessions")
                 print("   • 'help' - Show this help message")
                 print("   • 'exit' - Quit the assistant")
                 continue
             elif user_input.lower() == "show":
                 assistant.show_current_file()
                 continue
+            elif user_input.lower() == "history":
+                assistant.show_history()
+                continue
+            elif re.match(r'^diff\s+\d+(\s+\d+)?$', user_input.lower()):
+                assistant.show_diff(*user_input.split()[1:])
+                continue
+            elif re.match(r'^restore\s+\d+$', user_input.lower()):
+                assistant.restore_version(user_input.split()[1])
+                continue
+            elif user_input.lower().startswith("batch "):
+                tasks = read_batch_tasks(user_input[6:].strip())
+                if tasks:
+                    assistant.run_batch(tasks)
+                else:
+                    print("⚠️ No tasks found.")
+                continue
+            elif user_input.lower() in ("metrics", "metrics all"):
+                if user_input.lower() == "metrics all" and os.path.exists(metrics.jsonl_path):
+                    print(metrics.summary(load_spans(metrics.jsonl_path)))
+                else:
+                    print(metrics.summary())
+                print(f"📈 Spans: {metrics.jsonl_path}")
+                continue
+            elif user_input.lower() in ("cache", "cache clear"):
+                if user_input.lower() == "cache clear":
+                    assistant.cache.clear()
+                    print("🧹 LLM cache cleared.")
+                stats = assistant.cache.stats()
+                print(f"🗄️ LLM cache: {stats['entries']} entries, {stats['bytes'] / 1024:.1f} KB, "
+                      f"{stats['hits']} hits / {stats['misses']} misses this session"
+                      f"{'' if stats['enabled'] else ' (bypassed)'}")
+                continue
             elif not user_input:
                 print("⚠️ Please enter a request, 'show', 'help', or 'exit'.")
                 continue
@@ -598,4 +1078,4 @@ def main():
             print("💡 You can continue using the assistant or type 'exit' to quit.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -1,17 +1,217 @@
+import contextlib
 import os
+import stat
+import tempfile
+import threading
+from bisect import bisect_right
+
+from modules.hcl_lexer import parse_blocks
 
 TERRAFORM_PATH = "hcl/main.tf"
 
 def read_terraform(_: str) -> str:
-    if not os.path.exists(TERRAFORM_PATH):
+    try:
+        return workspace.content()
+    except FileNotFoundError:
         return "main.tf not found"
-    with open(TERRAFORM_PATH, "r") as f:
-        return f.read()
 
 def write_terraform(content: str) -> str:
     try:
-        with open(TERRAFORM_PATH, "w") as f:
-            f.write(content)
+        workspace.write(content)
         return "main.tf updated"
     except Exception as e:
         return f"Error writing Terraform file: {e}"
+
+
+class BlockIndex:
+    """Index of the top-level blocks of a Terraform file.
+
+    Blocks are keyed by (block_type, label...), e.g.
+    ("resource", "azurerm_linux_virtual_machine", "vm"), and carry character
+    spans for the block, its nested blocks and its attributes. The index is
+    built in one pass and kept up to date by `replace_span`, which only
+    re-parses the block that was edited.
+    """
+
+    def __init__(self, content: str):
+        self.content = content
+        self._rebuild()
+
+    def _rebuild(self):
+        self.blocks = parse_blocks(self.content)
+        self._reindex()
+
+    def _reindex(self):
+        self._by_key = {block.key: block for block in self.blocks}
+        self._by_address = {block.address: block for block in self.blocks}
+        self._starts = [block.start for block in self.blocks]
+
+    def get(self, *key):
+        return self._by_key.get(tuple(key))
+
+    def find(self, address):
+        """Look up a block by address, e.g. `azurerm_linux_virtual_machine.vm` or `data.x.y`."""
+        return self._by_address.get(address) or self._by_key.get(tuple(address.split(".")))
+
+    def resource(self, resource_type, name):
+        return self._by_key.get(("resource", resource_type, name))
+
+    def resources(self, *resource_types):
+        return [b for b in self.blocks if b.type == "resource" and b.labels[:1] and b.labels[0] in resource_types]
+
+    def block_at(self, pos):
+        """Top-level block containing the character offset, if any."""
+        i = bisect_right(self._starts, pos) - 1
+        if i >= 0 and self.blocks[i].end is not None and pos < self.blocks[i].end:
+            return self.blocks[i]
+        return None
+
+    def replace_span(self, start, end, new_text):
+        """Replace content[start:end] and update the index incrementally."""
+        old_block = self.block_at(start)
+        self.content = self.content[:start] + new_text + self.content[end:]
+        delta = len(new_text) - (end - start)
+
+        if old_block is None or end > old_block.end:
+            # Edit touches the space between blocks; start over
+            self._rebuild()
+            return
+
+        i = self.blocks.index(old_block)
+        reparsed = parse_blocks(self.content, old_block.start, old_block.end + delta)
+        if len(reparsed) != 1 or reparsed[0].end != old_block.end + delta:
+            self._rebuild()
+            return
+        for block in self.blocks[i + 1:]:
+            block.shift(delta)
+        self.blocks[i] = reparsed[0]
+        self._reindex()
+
+    def reset(self, content):
+        """Replace the whole content and index it again."""
+        self.content = content
+        self._rebuild()
+
+    def set_attribute_value(self, attribute, value):
+        self.replace_span(attribute.value_start, attribute.value_end, value)
+
+    def append_block(self, block_text):
+        """Append a new top-level block at the end of the file."""
+        start = len(self.content.rstrip())
+        head = self.content[:start]
+        self.content = head + ("\n\n" if head else "") + block_text.strip() + "\n"
+        self.blocks.extend(parse_blocks(self.content, start))
+        self._reindex()
+
+
+class Workspace:
+    """A Terraform file kept in memory, re-read only when it changes on disk.
+
+    The text is cached and its BlockIndex built on first use, so reads and
+    whole-file writes never pay for parsing. The file counts as changed when
+    its inode, size or mtime differ from the last read or write. Edits are
+    serialized by a lock and written back atomically: a temp file in the same
+    directory, one fsync, then os.replace, so a crash leaves the old file or
+    the new one, never a truncated one.
+    """
+
+    def __init__(self, path=TERRAFORM_PATH):
+        self.path = path
+        self.lock = threading.RLock()
+        self._text = None
+        self._index = None  # built from _text on demand
+        self._signature = None
+        self._depth = 0  # nested edit() calls; only the outermost one writes
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"{os.path.basename(self.path)} not found") from None
+        return (os.path.abspath(self.path), st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _load(self):
+        if self._depth:
+            # Inside an edit the cached index is the working copy, whatever happens on disk
+            return self._index.content
+        signature = self._stat()
+        if self._text is None or signature != self._signature:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._text = f.read()
+            self._index = None
+            self._signature = signature
+        return self._text
+
+    def _load_index(self):
+        text = self._load()
+        if self._index is None:
+            self._index = BlockIndex(text)
+        return self._index
+
+    def content(self) -> str:
+        with self.lock:
+            return self._load()
+
+    def index(self) -> BlockIndex:
+        """The cached index of the current content; read from it and change the file through edit()."""
+        with self.lock:
+            return self._load_index()
+
+    @contextlib.contextmanager
+    def edit(self):
+        """Yield the cached index to edit in place; it is written back once, when the outermost edit ends.
+
+        If a nested edit raises, its changes are undone so an outer edit that
+        catches the error writes only its own. If the outermost edit or the
+        write raises, nothing is written and the cache is dropped, so
+        half-applied edits never reach the file or the next reader.
+        """
+        with self.lock:
+            index = self._load_index()
+            before = index.content
+            self._depth += 1
+            try:
+                yield index
+                if self._depth == 1 and index.content != before:
+                    self._write(index.content)
+            except BaseException:
+                if self._depth == 1:
+                    self._text = self._index = None
+                elif index.content != before:
+                    index.reset(before)
+                raise
+            finally:
+                self._depth -= 1
+
+    def write(self, content: str):
+        with self.lock:
+            self._write(content)
+
+    def _write(self, content):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(self.path)}.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            with contextlib.suppress(FileNotFoundError):
+                os.chmod(tmp_path, stat.S_IMODE(os.stat(self.path).st_mode))
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
+        self._signature = self._stat()
+        self._text = content
+        if self._index is not None and self._index.content != content:
+            self._index = None
+
+
+# The agent tools' main.tf (relative to the working directory, like TERRAFORM_PATH)
+workspace = Workspace()
+
+
+def load_index() -> BlockIndex:
+    """Block index of the current main.tf (cached; edit through workspace.edit())."""
+    return workspace.index()
@@ -1,9 +1,33 @@
-import subprocess
+import functools
+import glob
+import hashlib
 import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of one process are serialized
+    fcntl = None
+
+from modules.hcl_lexer import parse_blocks
+from modules.json_scan import CHUNK_SIZE
+from modules.metrics import metrics
+from modules.plan_changes import load_changeset
+from modules.plugin_cache import record_usage, terraform_env
+from modules.state_reader import STATE_FILE, read_state_header
+
+# asyncio is imported inside the functions that run terraform: it costs more at startup
+# than everything else the agent tools import
 
 def get_hcl_dir():
+    # TF_ASSISTANT_HCL_DIR points the agent tools at another workspace
     base_dir = os.path.dirname(os.path.abspath(__file__))
-    hcl_dir = os.path.join(base_dir, "..", "hcl")
+    hcl_dir = os.environ.get("TF_ASSISTANT_HCL_DIR") or os.path.join(base_dir, "..", "hcl")
     if not os.path.exists(os.path.join(hcl_dir, "main.tf")):
         raise FileNotFoundError("main.tf not found in hcl directory.")
     return hcl_dir
@@ -19,47 +43,464 @@ def confirm_then_run(action_func, message: str):
         return action_func("")
     return wrapper
 def plan_then_confirm_apply(_: str) -> str:
-    plan_output = run_tf_plan("")
-    print(plan_output)  # Display plan
+    # Errors stream to the console as the plan runs; the change set is shown once it is saved
+    result, path = run_saved_plan()
+    if path is None:
+        return result.output
+    print(result.output)
     confirm = input("Do you want to APPLY these changes? (yes/no): ").strip().lower()
     if confirm != "yes":
         raise CancelledByUser("Terraform operation cancelled by user.")
-    return run_tf_apply("")
-def run_tf_init(_: str) -> str:
+    return apply_saved_plan().output
+
+# Per-command timeouts in seconds; None waits forever
+TIMEOUTS = {"init": 600, "plan": 1800, "apply": 3600, "destroy": 3600}
+
+
+class TerraformResult:
+    """Outcome of one terraform command, with the same fields as subprocess.CompletedProcess."""
+
+    def __init__(self, args, returncode, stdout, stderr, duration, timed_out=False, cancelled=False):
+        self.args = args
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.duration = duration
+        self.timed_out = timed_out
+        self.cancelled = cancelled
+        self.changes = None  # ChangeSet of a successful saved plan
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and not self.timed_out and not self.cancelled
+
+    @property
+    def output(self):
+        """stdout on success, otherwise stderr (what the tools have always returned)."""
+        return self.stdout if self.returncode == 0 else self.stderr
+
+
+def print_line(stream_name, line):
+    print(line, file=sys.stderr if stream_name == "stderr" else sys.stdout, flush=True)
+
+
+async def _terminate(proc, grace=10):
+    """Ask terraform to stop (it cleans up state locks on SIGTERM), then kill it."""
+    # os.kill rather than proc.terminate(): Popen.send_signal polls the child
+    # first, which can reap it behind the asyncio child watcher's back
+    import asyncio
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        if proc.returncode is not None:
+            return
+        try:
+            os.kill(proc.pid, sig)
+        except ProcessLookupError:
+            pass
+        try:
+            await asyncio.wait_for(proc.wait(), grace)
+            return
+        except asyncio.TimeoutError:
+            continue
+
+
+async def stream_terraform(args, cwd, on_line=None, timeout=None, cancel_event=None, env=None, keep_stdout=True):
+    """Run `terraform <args>` in `cwd`, passing each output line to on_line(stream_name, line).
+
+    The command is stopped when `timeout` seconds pass or `cancel_event`
+    (a threading.Event or asyncio.Event) is set. Cancelling the awaiting task
+    also stops the process. With keep_stdout=False stdout lines are only
+    passed on, not collected into the result.
+    """
+    import asyncio
+    started = time.monotonic()
+    proc = await asyncio.create_subprocess_exec(
+        "terraform", *args,
+        cwd=cwd,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env=env,
+    )
+    captured = {"stdout": [], "stderr": []}
+
+    async def pump(stream, name):
+        async for raw in stream:
+            line = raw.decode("utf-8", errors="replace").rstrip("\n")
+            if keep_stdout or name == "stderr":
+                captured[name].append(line)
+            if on_line:
+                on_line(name, line)
+
+    async def watch_cancel():
+        while not cancel_event.is_set():
+            await asyncio.sleep(0.2)
+
+    work = asyncio.ensure_future(asyncio.gather(pump(proc.stdout, "stdout"), pump(proc.stderr, "stderr"), proc.wait()))
+    waiters = [work]
+    if cancel_event is not None:
+        waiters.append(asyncio.ensure_future(watch_cancel()))
+
+    timed_out = cancelled = False
     try:
-        os.chdir(get_hcl_dir())
-        result = subprocess.run(["terraform", "init"], capture_output=True, text=True)
-        return result.stdout if result.returncode == 0 else result.stderr
-    except Exception as e:
-        return f"Error running terraform init: {e}"
+        done, _ = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        if work not in done:
+            await _terminate(proc)
+            await asyncio.gather(work, return_exceptions=True)
+            # The command may have finished on its own just as it was stopped
+            timed_out = not done and proc.returncode != 0
+            cancelled = bool(done) and proc.returncode != 0
+    except asyncio.CancelledError:
+        await _terminate(proc)
+        raise
+    finally:
+        for waiter in waiters[1:]:
+            waiter.cancel()
 
-def run_tf_plan(_: str) -> str:
+    return TerraformResult(
+        ["terraform", *args],
+        proc.returncode,
+        "\n".join(captured["stdout"]),
+        "\n".join(captured["stderr"]),
+        time.monotonic() - started,
+        timed_out=timed_out,
+        cancelled=cancelled,
+    )
+
+
+def _outcome(result):
+    """Span outcome for a TerraformResult."""
+    if result.timed_out:
+        return "timeout"
+    if result.cancelled:
+        return "cancelled"
+    return "ok" if result.returncode == 0 else "error"
+
+
+LOCK_FILE = ".assistant.lock"
+
+
+class WorkspaceLock:
+    """Exclusive lock on a workspace, across processes (flock) and threads.
+
+    Re-entrant within a thread, so a stage holding it can run terraform
+    commands that take it again. Every terraform command run through this
+    module holds it, so the planner, the assistant and a scheduler run never
+    init, plan or apply the same workspace at once.
+    """
+
+    _held = {}  # workspace path -> [RLock, lock file fd, depth]
+    _registry = threading.Lock()
+
+    def __init__(self, workspace):
+        self.path = os.path.join(os.path.abspath(workspace), LOCK_FILE)
+
+    def __enter__(self):
+        with self._registry:
+            entry = self._held.setdefault(self.path, [threading.RLock(), None, 0])
+        entry[0].acquire()
+        if entry[2] == 0:
+            fd = os.open(self.path, os.O_CREAT | os.O_RDWR)
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            entry[1] = fd
+        entry[2] += 1
+        return self
+
+    def __exit__(self, *exc):
+        entry = self._held[self.path]
+        entry[2] -= 1
+        if entry[2] == 0:
+            if fcntl:
+                fcntl.flock(entry[1], fcntl.LOCK_UN)
+            os.close(entry[1])
+            entry[1] = None
+        entry[0].release()
+
+
+def holds_workspace_lock(func):
+    """Run func(cwd, ...) holding the workspace lock; cwd defaults to the hcl directory."""
+    @functools.wraps(func)
+    def wrapper(cwd=None, *args, **kwargs):
+        cwd = cwd or get_hcl_dir()
+        with WorkspaceLock(cwd):
+            return func(cwd, *args, **kwargs)
+    return wrapper
+
+
+def run_terraform(args, cwd=None, timeout=None, echo=True, cancel_event=None, on_line=None, env=None, keep_stdout=True):
+    """Synchronous wrapper around stream_terraform, safe to call from any thread.
+
+    Every command shares the plugin cache from modules.plugin_cache unless
+    an explicit `env` is given, and holds the workspace lock.
+    """
+    import asyncio
+    if on_line is None and echo:
+        on_line = print_line
+    env = env or terraform_env()
+    cwd = cwd or get_hcl_dir()
+    with WorkspaceLock(cwd):
+        return asyncio.run(stream_terraform(args, cwd, on_line, timeout, cancel_event, env, keep_stdout))
+
+
+PLAN_DIR = ".tfplans"
+CONFIG_PATTERNS = ("*.tf", "*.tfvars", "*.tf.json", ".terraform.lock.hcl")
+
+
+def plan_key(cwd):
+    """Hash of the configuration files plus the state lineage/serial."""
+    digest = hashlib.sha256()
+    for pattern in CONFIG_PATTERNS:
+        for path in sorted(glob.glob(os.path.join(cwd, pattern))):
+            digest.update(os.path.basename(path).encode())
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    lineage, serial = read_state_header(cwd)
+    digest.update(f"{lineage}:{serial}".encode())
+    return digest.hexdigest()[:16]
+
+
+def plan_file(cwd):
+    return os.path.join(cwd, PLAN_DIR, f"{plan_key(cwd)}.tfplan")
+
+
+def gc_plans(cwd, keep=None):
+    """Delete saved plans other than `keep`; they no longer match config or state."""
+    for path in glob.glob(os.path.join(cwd, PLAN_DIR, "*.tfplan")):
+        if path != keep:
+            os.remove(path)
+
+
+@holds_workspace_lock
+def run_saved_plan(cwd=None, extra_args=(), targets=None, refresh=True, **kwargs):
+    """Run terraform plan and save it under a key for the current config and state.
+
+    Returns (result, plan_path); plan_path is None when planning failed.
+    The human-readable plan is neither kept nor echoed: on success
+    result.changes is the saved plan's ChangeSet and result.stdout its
+    rendering. Errors and warnings (stderr) are echoed as usual.
+
+    `targets` (resource addresses) and refresh=False make a fast plan for
+    checking an edit. It is saved apart from the full plan, so
+    apply_saved_plan never applies it.
+    """
+    cwd = cwd or get_hcl_dir()
+    full_path = plan_file(cwd)
+    fast = bool(targets) or not refresh
+    path = full_path[:-len(".tfplan")] + ".fast.tfplan" if fast else full_path
+    # A full plan made for the same config and state is still good to apply
+    gc_plans(cwd, keep=full_path if fast else None)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    extra_args = [*extra_args, *(f"-target={t}" for t in targets or ()), *([] if refresh else ["-refresh=false"])]
+    echo = kwargs.pop("echo", True)
+    on_line = kwargs.pop("on_line", None) or (print_line if echo else None)
+
+    def on_stderr(stream_name, line):
+        if on_line and stream_name == "stderr":
+            on_line(stream_name, line)
+
+    with metrics.span("plan", targets=len(targets or ()), refresh=refresh) as span:
+        result = run_terraform(["plan", "-input=false", f"-out={path}", *extra_args], cwd=cwd,
+                               timeout=kwargs.pop("timeout", TIMEOUTS["plan"]), on_line=on_stderr,
+                               keep_stdout=False, **kwargs)
+        span.set(_outcome(result), output_bytes=len(result.stderr))
+    if not result.ok:
+        if os.path.exists(path):
+            os.remove(path)
+        return result, None
+    if refresh and not targets:
+        _mark_refreshed(cwd)
     try:
-        os.chdir(get_hcl_dir())
-        result = subprocess.run(["terraform", "plan"], capture_output=True, text=True)
-        return result.stdout if result.returncode == 0 else result.stderr
-    except Exception as e:
-        return f"Error running terraform plan: {e}"
+        result.changes = show_plan_changes(path, cwd)
+        result.stdout = result.changes.render()
+    except (OSError, RuntimeError, ValueError) as e:
+        # The saved plan is still good to apply; only its summary is missing
+        result.stdout = f"Plan saved to {path}, but it could not be read back: {e}"
+    return result, path
 
-def run_tf_apply(_: str) -> str:
+
+REFRESH_MARKER = os.path.join(".terraform", ".assistant_refresh")
+
+
+def _mark_refreshed(cwd):
+    # A full plan refreshes every resource without writing the state; remember which state it checked
+    lineage, serial = read_state_header(cwd)
     try:
-        os.chdir(get_hcl_dir())
-        result = subprocess.run(["terraform", "apply", "-auto-approve"], capture_output=True, text=True)
-        return result.stdout if result.returncode == 0 else result.stderr
-    except Exception as e:
-        return f"Error running terraform apply: {e}"
+        with open(os.path.join(cwd, REFRESH_MARKER), "w") as f:
+            f.write(f"{lineage}:{serial}")
+    except OSError:
+        pass
 
-def run_tf_destroy(_: str) -> str:
+
+def last_refresh(cwd=None):
+    """Unix time the state was last known to match the real infrastructure, or None.
+
+    That is the last write of terraform.tfstate (apply, refresh) or the last
+    full plan against the current state, whichever is later.
+    """
+    cwd = cwd or get_hcl_dir()
+    times = []
+    state_path = os.path.join(cwd, STATE_FILE)
+    if os.path.exists(state_path):
+        times.append(os.path.getmtime(state_path))
+    marker = os.path.join(cwd, REFRESH_MARKER)
+    if os.path.exists(marker):
+        lineage, serial = read_state_header(cwd)
+        with open(marker, "r") as f:
+            if f.read().strip() == f"{lineage}:{serial}":
+                times.append(os.path.getmtime(marker))
+    return max(times, default=None)
+
+
+def show_plan_changes(plan_path, cwd=None):
+    """ChangeSet of a saved plan, parsed from `terraform show -json` as it streams in."""
+    cwd = cwd or get_hcl_dir()
+    with metrics.span("plan_show") as span, tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen(["terraform", "show", "-json", plan_path], cwd=cwd, stdin=subprocess.DEVNULL,
+                                stdout=subprocess.PIPE, stderr=stderr, env=terraform_env())
+        try:
+            changes = load_changeset(proc.stdout)
+            # Prior state and configuration follow; terraform still has to be able to write them
+            while proc.stdout.read(CHUNK_SIZE):
+                pass
+        finally:
+            proc.stdout.close()
+            returncode = proc.wait()
+        if returncode != 0:
+            stderr.seek(0)
+            raise RuntimeError(f"terraform show -json failed: {stderr.read().decode('utf-8', errors='replace').strip()}")
+        span.set(resources=len(changes))
+    return changes
+
+
+@holds_workspace_lock
+def apply_saved_plan(cwd=None, **kwargs):
+    """Apply the saved plan for the current config and state, exactly as it was planned.
+
+    If config or state changed since the plan was made, nothing is applied
+    and the result explains that a new plan is needed.
+    """
+    cwd = cwd or get_hcl_dir()
+    path = plan_file(cwd)
+    if not os.path.exists(path):
+        gc_plans(cwd)
+        return TerraformResult(["terraform", "apply"], 1, "",
+                               "No saved plan matches the current configuration and state; run plan again.", 0.0)
+    with metrics.span("apply") as span:
+        result = run_terraform(["apply", "-input=false", path], cwd=cwd,
+                               timeout=kwargs.pop("timeout", TIMEOUTS["apply"]), **kwargs)
+        span.set(_outcome(result), output_bytes=len(result.stdout) + len(result.stderr))
+    # A plan can only be applied once; the state serial has moved on either way
+    gc_plans(cwd)
+    return result
+
+
+INIT_FINGERPRINT = os.path.join(".terraform", ".assistant_init")
+# Files the assistant itself keeps in .terraform; they say nothing about what init installed
+ASSISTANT_FILES = {INIT_FINGERPRINT, REFRESH_MARKER}
+# Blocks that decide what `terraform init` installs: required_providers and backend live in `terraform`
+INIT_BLOCK_TYPES = ("terraform", "provider", "module")
+
+
+def init_fingerprint(cwd):
+    """Hash of everything `terraform init` depends on.
+
+    Covers the lock file, the terraform/provider/module blocks of every .tf
+    file and a listing (path, size, mtime) of the .terraform directory, so a
+    deleted or half-installed provider also forces a new init.
+    """
+    digest = hashlib.sha256()
+    lock_file = os.path.join(cwd, ".terraform.lock.hcl")
+    if os.path.exists(lock_file):
+        with open(lock_file, "rb") as f:
+            digest.update(f.read())
+
+    for path in sorted(glob.glob(os.path.join(cwd, "*.tf"))):
+        with open(path, "r", encoding="utf-8") as f:
+            content = f.read()
+        for block in parse_blocks(content):
+            if block.type in INIT_BLOCK_TYPES and block.end is not None:
+                digest.update(block.text(content).encode())
+
+    terraform_dir = os.path.join(cwd, ".terraform")
+    skipped = {os.path.join(cwd, name) for name in ASSISTANT_FILES}
+    for root, dirs, files in os.walk(terraform_dir):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            if path in skipped:
+                continue
+            stat = os.lstat(path)
+            digest.update(f"{os.path.relpath(path, terraform_dir)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+@holds_workspace_lock
+def ensure_init(cwd=None, upgrade=False, force=False, **kwargs):
+    """Run terraform init unless nothing it depends on changed since the last successful init.
+
+    Returns (result, skipped). `-upgrade` is only passed when asked for.
+    """
+    cwd = cwd or get_hcl_dir()
+    marker = os.path.join(cwd, INIT_FINGERPRINT)
+    started = time.monotonic()
+    if not force and not upgrade and os.path.exists(marker):
+        with open(marker, "r") as f:
+            if f.read().strip() == init_fingerprint(cwd):
+                # The fingerprint check is what a skipped init costs
+                metrics.record("init", time.monotonic() - started, "skipped")
+                return TerraformResult(["terraform", "init"], 0, "Terraform already initialized; configuration unchanged since last init.", "", 0.0), True
+
+    args = ["init", "-input=false"] + (["-upgrade"] if upgrade else [])
+    with metrics.span("init", upgrade=upgrade) as span:
+        result = run_terraform(args, cwd=cwd, timeout=kwargs.pop("timeout", TIMEOUTS["init"]), **kwargs)
+        span.set(_outcome(result))
+    if result.ok:
+        with open(marker, "w") as f:
+            f.write(init_fingerprint(cwd))
+        record_usage(cwd)
+    elif os.path.exists(marker):
+        os.remove(marker)
+    return result, False
+
+
+def _run_tool(command, run):
     try:
-        os.chdir(get_hcl_dir())
-        result = subprocess.run(["terraform", "destroy", "-auto-approve"], capture_output=True, text=True)
-        return result.stdout if result.returncode == 0 else result.stderr
+        result = run()
+        if result.timed_out:
+            return f"Error running terraform {command}: timed out after {TIMEOUTS[command]}s"
+        return result.output
     except Exception as e:
-        return f"Error running terraform destroy: {e}"
+        return f"Error running terraform {command}: {e}"
+
+def run_tf_init(options: str) -> str:
+    # "upgrade" re-resolves provider versions, "force" re-runs init even if nothing changed
+    options = (options or "").lower()
+    return _run_tool("init", lambda: ensure_init(upgrade="upgrade" in options, force="force" in options)[0])
+
+def run_tf_plan(_: str) -> str:
+    return _run_tool("plan", lambda: run_saved_plan()[0])
+
+def run_tf_apply(_: str) -> str:
+    def apply():
+        # Apply exactly what was planned; plan first if there is no up-to-date saved plan
+        if not os.path.exists(plan_file(get_hcl_dir())):
+            result, path = run_saved_plan()
+            if path is None:
+                return result
+        return apply_saved_plan()
+    return _run_tool("apply", apply)
+
+def run_tf_destroy(_: str) -> str:
+    def destroy():
+        with metrics.span("destroy") as span:
+            result = run_terraform(["destroy", "-input=false", "-auto-approve"], timeout=TIMEOUTS["destroy"])
+            span.set(_outcome(result))
+        return result
+    return _run_tool("destroy", destroy)
 
 def init_and_plan(_: str) -> str:
-    init_result = run_tf_init("")
-    if "Error" in init_result or "failed" in init_result.lower():
-        return f"Terraform init failed:\n{init_result}"
+    init_result, _ = ensure_init()
+    if not init_result.ok:
+        return f"Terraform init failed:\n{init_result.output}"
     return run_tf_plan("")
 
@@ -1,53 +1,95 @@
-from modules.terraform_io import read_terraform, write_terraform
-
 # modules/vm_manager.py
 
 import re
 
-def modify_disk(input: str) -> str:
+from modules.hcl_patch import apply_operation
+from modules.parser import disk_change
+from modules.terraform_io import BlockIndex, workspace
+
+VM_TYPES = ("azurerm_linux_virtual_machine", "azurerm_windows_virtual_machine")
+TAG_ENTRY = re.compile(r'("[^"]*"|[\w-]+)\s*[=:]\s*("(?:[^"\\]|\\.)*"|[^\s,}]+)')
+
+
+def find_vm(index: BlockIndex, vm_name=None):
+    """Return the VM block to edit: the named one, or the only VM in the file."""
+    vms = index.resources(*VM_TYPES)
+    if vm_name:
+        for vm in vms:
+            # Match either the Terraform name or the VM's `name` attribute
+            name_attr = vm.attributes.get("name")
+            if vm.labels[1] == vm_name or (name_attr and name_attr.value(index.content).strip('"') == vm_name):
+                return vm
+        raise ValueError(f"VM '{vm_name}' not found in main.tf")
+    if not vms:
+        raise ValueError("No virtual machine found in main.tf")
+    if len(vms) > 1:
+        names = ", ".join(vm.labels[1] for vm in vms)
+        raise ValueError(f"Multiple VMs found ({names}); specify one with vm=<name>")
+    return vms[0]
+
+
+def resize_disk(index: BlockIndex, amount: int, mode="increment", vm_name=None):
+    """Change os_disk.disk_size_gb of a VM in the index; returns (vm_address, old_size, new_size)."""
+    vm = find_vm(index, vm_name)
+    os_disk = vm.find_block("os_disk")
+    size_attr = os_disk.attributes.get("disk_size_gb") if os_disk else None
+    if size_attr is None:
+        raise ValueError(f"Could not find current disk size in {vm.address}")
+
+    match = re.match(r'"?(\d+)"?$', size_attr.value(index.content))
+    if not match:
+        raise ValueError(f"Disk size of {vm.address} is not a literal number")
+
+    current_size = int(match.group(1))
+    new_size = current_size + amount if mode == "increment" else amount
+    index.set_attribute_value(size_attr, str(new_size))
+    return vm.address, current_size, new_size
+
+
+def _parse_disk_input(input):
+    """Accept {"mode", "amount", "vm"} dicts, "key=value;..." strings or plain language."""
+    if isinstance(input, dict):
+        return input.get("mode", "increment"), int(input["amount"]), input.get("vm")
+
+    text = str(input)
+    vm_match = re.search(r'\bvm=([\w-]+)', text)
+    vm_name = vm_match.group(1) if vm_match else None
+    mode_match = re.search(r'\bmode=(increment|absolute)', text)
+
+    amount_match = re.search(r'amount=(\d+)', text) or re.search(r'(\d+)', re.sub(r'\bvm=[\w-]+', '', text))
+    if not amount_match:
+        raise ValueError("Couldn't extract disk size from input")
+
+    if mode_match:
+        mode = mode_match.group(1)
+    else:
+        change = disk_change(text)
+        mode = change[0] if change else "increment"
+    return mode, int(amount_match.group(1)), vm_name
+
+
+def modify_disk(input) -> str:
     try:
-        # Step 1: Load Terraform file
-        from modules.terraform_io import read_terraform, write_terraform
-        tf_content = read_terraform("")
-
-        # Step 2: Extract number from plain language
-        match = re.search(r'(\d+)', input)
-        if not match:
-            return "[❌] Error: Couldn't extract disk size from input"
-
-        amount = int(match.group(1))
-
-        # Step 3: Find current size
-        current_size_match = re.search(
-            r'os_disk\s*{[^}]*?disk_size_gb\s*=\s*(\d+)',
-            tf_content,
-            re.DOTALL
-        )
-
-        if not current_size_match:
-            return "[❌] Error: Could not find current disk size in tf_content"
-
-        current_size = int(current_size_match.group(1))
-        new_size = current_size + amount
-
-        # Step 4: Replace and write
-        updated_tf = re.sub(
-            r'(os_disk\s*{[^}]*disk_size_gb\s*=\s*)\d+',
-            rf'\g<1>{new_size}',
-            tf_content,
-            flags=re.DOTALL
-        )
-        write_terraform(updated_tf)
-
-        return f"[✅] Disk size updated from {current_size} to {new_size}GB in main.tf"
+        # Step 1: Work out what to change
+        mode, amount, vm_name = _parse_disk_input(input)
+
+        # Step 2: Locate the VM's os_disk through the block index and rewrite its size; written on success
+        with workspace.edit() as index:
+            address, current_size, new_size = resize_disk(index, amount, mode, vm_name)
+
+        return f"[✅] Disk size of {address} updated from {current_size} to {new_size}GB in main.tf"
     except Exception as e:
         return f"[❌] Error: {e}"
 
 
 def create_vm(input: str) -> str:
-    parts = dict(item.split("=") for item in input.split(";"))
-    vm_name, region, size = parts["vm"], parts["region"], parts["size"]
-    
+    try:
+        parts = dict(item.split("=", 1) for item in input.split(";"))
+        vm_name, region, size = parts["vm"], parts["region"], parts["size"]
+    except (KeyError, ValueError):
+        return "[❌] Error: CreateVM input must be 'vm=<name>;region=<region>;size=<disk size>'"
+    disk_size = ''.join(filter(str.isdigit, size)) or "30"
+
     block = f"""
 resource "azurerm_linux_virtual_machine" "{vm_name}" {{
   name                = "{vm_name}"
@@ -59,9 +101,7 @@ resource "azurerm_linux_virtual_machine" "{vm_name}" {{
   os_disk {{
     caching              = "ReadWrite"
     storage_account_type = "Standard_LRS"
-    disk_size = ''.join(filter(str.isdigit, size))
-...
-disk_size_gb         = "{disk_size}"
+    disk_size_gb         = {disk_size}
   }}
   source_image_reference {{
     publisher = "Canonical"
@@ -71,7 +111,145 @@ disk_size_gb         = "{disk_size}"
   }}
 }}
 """
-    tf = read_terraform("")
-    updated = tf + "\n" + block
-    result = write_terraform(updated)
-    return f"Created VM block for {vm_name}. {result}"
+    try:
+        with workspace.edit() as index:
+            if index.resource("azurerm_linux_virtual_machine", vm_name):
+                return f"[❌] Error: VM '{vm_name}' already exists in main.tf"
+            index.append_block(block)
+    except FileNotFoundError as e:
+        return f"[❌] Error: {e}"
+    except OSError as e:
+        return f"Error writing Terraform file: {e}"
+    return f"Created VM block for {vm_name}. main.tf updated"
+
+
+def _key_values(input: str):
+    """Parse 'key=value;key=value' tool input."""
+    return dict(item.strip().split("=", 1) for item in input.split(";") if item.strip())
+
+
+def _edit_file(edit):
+    """Apply edit(index) to main.tf and write it back; returns the tool result."""
+    try:
+        with workspace.edit() as index:
+            message = edit(index)
+        return f"[✅] {message} in main.tf"
+    except Exception as e:
+        return f"[❌] Error: {e}"
+
+
+def change_vm_size(index: BlockIndex, size, vm_name=None):
+    vm = find_vm(index, vm_name)
+    old = vm.attributes.get("size")
+    previous = old.value(index.content).strip('"') if old else "unset"
+    apply_operation(index, {"op": "set", "address": vm.address, "attribute": "size", "value": f'"{size}"'})
+    return f"Size of {vm.address} changed from {previous} to {size}"
+
+
+def remove_vm(index: BlockIndex, vm_name=None):
+    vm = find_vm(index, vm_name)
+    apply_operation(index, {"op": "delete", "address": vm.address})
+    return f"Removed {vm.address}"
+
+
+def _tag_map(index, vm):
+    """Current tags of a VM as an ordered dict of HCL key/value literals."""
+    attr = vm.attributes.get("tags")
+    if attr is None:
+        return {}
+    text = attr.value(index.content).strip()
+    if not (text.startswith("{") and text.endswith("}")):
+        raise ValueError(f"tags of {vm.address} is not a literal map ({text}); edit it by hand")
+    return {key.strip('"'): value for key, value in TAG_ENTRY.findall(text[1:-1])}
+
+
+def _format_tags(tags, indent):
+    # Keys that aren't HCL identifiers (e.g. "app.kubernetes.io/name") must stay quoted
+    keys = {key: key if re.fullmatch(r'[A-Za-z_][\w-]*', key) else f'"{key}"' for key in tags}
+    width = max(len(k) for k in keys.values())
+    lines = [f'{indent}    {keys[key]:<{width}} = {value}' for key, value in tags.items()]
+    return "{\n" + "\n".join(lines) + f"\n{indent}  }}"
+
+
+def _write_tags(index, vm, tags):
+    if not tags:
+        if "tags" in vm.attributes:
+            apply_operation(index, {"op": "unset", "address": vm.address, "attribute": "tags"})
+        return
+    line_start = index.content.rfind("\n", 0, vm.start) + 1
+    indent = re.match(r'[ \t]*', index.content[line_start:]).group()
+    apply_operation(index, {"op": "set", "address": vm.address, "attribute": "tags",
+                            "value": _format_tags(tags, indent)})
+
+
+def tag_vm(index: BlockIndex, key, value, vm_name=None):
+    vm = find_vm(index, vm_name)
+    value = value.strip('"')
+    tags = _tag_map(index, vm)
+    tags[key] = f'"{value}"'
+    _write_tags(index, vm, tags)
+    return f'Tag {key} = "{value}" set on {vm.address}'
+
+
+def untag_vm(index: BlockIndex, key, vm_name=None):
+    vm = find_vm(index, vm_name)
+    tags = _tag_map(index, vm)
+    if key not in tags:
+        raise ValueError(f"{vm.address} has no tag '{key}'")
+    del tags[key]
+    _write_tags(index, vm, tags)
+    return f"Tag {key} removed from {vm.address}"
+
+
+def apply_parsed_request(index: BlockIndex, parsed):
+    """Apply a parse_request() result to the index; returns None when it isn't a local edit."""
+    action, vm_name = parsed.get("action"), parsed.get("vm")
+    if action == "ModifyDiskSize":
+        address, current_size, new_size = resize_disk(index, parsed["amount"], parsed["mode"], vm_name)
+        return f"Disk size of {address} updated from {current_size} to {new_size}GB"
+    if action == "SetVMSize":
+        return change_vm_size(index, parsed["size"], vm_name)
+    if action == "DeleteVM":
+        # Never pick "the only VM" for a delete; an unnamed one is for the LLM to work out
+        return remove_vm(index, vm_name) if vm_name else None
+    if action == "SetTag":
+        return tag_vm(index, parsed["tag"], parsed["value"], vm_name)
+    if action == "RemoveTag":
+        return untag_vm(index, parsed["tag"], vm_name)
+    # CreateVM's template has placeholder network/resource group values, so it is not a local edit here
+    return None
+
+
+def set_vm_size(input: str) -> str:
+    try:
+        parts = _key_values(input)
+        size = parts["size"]
+    except (KeyError, ValueError):
+        return "[❌] Error: SetVMSize input must be '[vm=<name>;]size=<Azure size, e.g. Standard_B2s>'"
+    return _edit_file(lambda index: change_vm_size(index, size, parts.get("vm")))
+
+
+def delete_vm(input: str) -> str:
+    vm_name = _key_values(input).get("vm") if "=" in input else input.strip().strip("'\"") or None
+    if not vm_name:
+        # Never pick "the only VM" for a delete
+        return "[❌] Error: DeleteVM input must name the VM: 'vm=<name>'"
+    return _edit_file(lambda index: remove_vm(index, vm_name))
+
+
+def set_tag(input: str) -> str:
+    try:
+        parts = _key_values(input)
+        key, value = parts["tag"], parts["value"]
+    except (KeyError, ValueError):
+        return "[❌] Error: SetTag input must be '[vm=<name>;]tag=<key>;value=<value>'"
+    return _edit_file(lambda index: tag_vm(index, key, value, parts.get("vm")))
+
+
+def remove_tag(input: str) -> str:
+    try:
+        parts = _key_values(input)
+        key = parts["tag"]
+    except (KeyError, ValueError):
+        return "[❌] Error: RemoveTag input must be '[vm=<name>;]tag=<key>'"
+    return _edit_file(lambda index: untag_vm(index, key, parts.get("vm")))
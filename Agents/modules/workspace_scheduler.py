@@ -0,0 +1,154 @@
+# modules/workspace_scheduler.py
+
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from modules.terraform_runner import WorkspaceLock, apply_saved_plan, ensure_init, print_line, run_saved_plan
+
+
+class WorkspaceOutcome:
+    """What happened in one workspace: status, planned changes and per-stage timings."""
+
+    def __init__(self, workspace):
+        self.workspace = workspace
+        self.status = "pending"  # ok | failed | cancelled | skipped
+        self.stage = None
+        self.changes = None  # {"add": n, "change": n, "destroy": n}
+        self.applied = False
+        self.timings = {}
+        self.error = ""
+
+    @property
+    def total_time(self):
+        return sum(self.timings.values())
+
+
+def run_workspace(workspace, apply=False, cancel_event=None, echo=False):
+    """Init (when needed), plan and optionally apply a single workspace."""
+    outcome = WorkspaceOutcome(workspace)
+    name = os.path.basename(os.path.abspath(workspace))
+
+    def on_line(stream_name, line):
+        print_line(stream_name, f"[{name}] {line}")
+
+    options = {"cancel_event": cancel_event, "echo": echo, "on_line": on_line if echo else None}
+
+    def failed(stage, result):
+        outcome.stage = stage
+        outcome.status = "cancelled" if result.cancelled else "failed"
+        lines = (result.stderr or result.stdout).strip().splitlines()
+        outcome.error = lines[-1] if lines else ("cancelled" if result.cancelled else "")
+        return outcome
+
+    def stopped(stage):
+        # Another workspace failed under fail-fast; don't start the next stage
+        outcome.stage, outcome.status, outcome.error = stage, "cancelled", "stopped after another workspace failed"
+        return outcome
+
+    with WorkspaceLock(workspace):
+        started = time.monotonic()
+        result, skipped = ensure_init(workspace, **options)
+        outcome.timings["init"] = 0.0 if skipped else time.monotonic() - started
+        if not result.ok:
+            return failed("init", result)
+
+        if cancel_event is not None and cancel_event.is_set():
+            return stopped("plan")
+        started = time.monotonic()
+        result, plan_path = run_saved_plan(workspace, **options)
+        outcome.timings["plan"] = time.monotonic() - started
+        if plan_path is None:
+            return failed("plan", result)
+        outcome.changes = result.changes.counts() if result.changes is not None else None
+
+        if apply and outcome.changes != {"add": 0, "change": 0, "destroy": 0}:
+            if cancel_event is not None and cancel_event.is_set():
+                return stopped("apply")
+            started = time.monotonic()
+            result = apply_saved_plan(workspace, **options)
+            outcome.timings["apply"] = time.monotonic() - started
+            if not result.ok:
+                return failed("apply", result)
+            outcome.applied = True
+
+    outcome.status = "ok"
+    return outcome
+
+
+def run_fleet(workspaces, apply=False, max_workers=4, fail_fast=False, echo=False):
+    """Run init/plan (and optionally apply) across workspaces, at most max_workers at a time.
+
+    With fail_fast, the first failure stops running terraform processes and
+    skips workspaces that have not started; otherwise every workspace runs.
+    """
+    cancel_event = threading.Event()
+    outcomes = {}
+
+    def run(workspace):
+        if cancel_event.is_set():
+            outcome = WorkspaceOutcome(workspace)
+            outcome.status = "skipped"
+            return outcome
+        return run_workspace(workspace, apply, cancel_event, echo)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = {pool.submit(run, ws): ws for ws in workspaces}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                workspace = pending.pop(future)
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    outcome = WorkspaceOutcome(workspace)
+                    outcome.status, outcome.error = "failed", str(e)
+                outcomes[workspace] = outcome
+                if fail_fast and outcome.status == "failed":
+                    cancel_event.set()
+
+    return [outcomes[ws] for ws in workspaces]
+
+
+def format_summary(outcomes, wall_time=None) -> str:
+    icons = {"ok": "✅", "failed": "❌", "cancelled": "🚫", "skipped": "⏭️"}
+    lines = [f"{'':2} {'Workspace':<30} {'Add':>4} {'Chg':>4} {'Del':>4} {'Init':>7} {'Plan':>7} {'Apply':>7}  Notes"]
+    for o in outcomes:
+        changes = o.changes or {}
+        times = [f"{o.timings[s]:6.1f}s" if s in o.timings else f"{'-':>7}" for s in ("init", "plan", "apply")]
+        notes = "applied" if o.applied else (f"{o.stage}: {o.error}" if o.status in ("failed", "cancelled") else "")
+        lines.append(f"{icons.get(o.status, '?'):2} {os.path.basename(os.path.abspath(o.workspace)):<30} "
+                     f"{changes.get('add', '-'):>4} {changes.get('change', '-'):>4} {changes.get('destroy', '-'):>4} "
+                     f"{' '.join(times)}  {notes}")
+
+    totals = {k: sum((o.changes or {}).get(k, 0) for o in outcomes) for k in ("add", "change", "destroy")}
+    counts = {s: sum(1 for o in outcomes if o.status == s) for s in icons}
+    summary = (f"{counts['ok']} ok, {counts['failed']} failed, {counts['cancelled']} cancelled, {counts['skipped']} skipped; "
+               f"{totals['add']} to add, {totals['change']} to change, {totals['destroy']} to destroy")
+    if wall_time is not None:
+        serial = sum(o.total_time for o in outcomes)
+        summary += f"; {wall_time:.1f}s wall time ({serial:.1f}s if run one by one)"
+    lines.append(summary)
+    return "\n".join(lines)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Plan (and optionally apply) many Terraform workspaces in parallel.")
+    parser.add_argument("workspaces", nargs="+", help="Workspace directories containing *.tf files")
+    parser.add_argument("--apply", action="store_true", help="Apply each saved plan that has changes")
+    parser.add_argument("--jobs", "-j", type=int, default=4, help="Maximum concurrent terraform processes")
+    parser.add_argument("--fail-fast", action="store_true", help="Stop everything on the first failure")
+    parser.add_argument("--quiet", "-q", action="store_true", help="Don't stream terraform output")
+    args = parser.parse_args(argv)
+
+    started = time.monotonic()
+    outcomes = run_fleet(args.workspaces, args.apply, args.jobs, args.fail_fast, echo=not args.quiet)
+    print(format_summary(outcomes, time.monotonic() - started))
+    return 0 if all(o.status == "ok" for o in outcomes) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
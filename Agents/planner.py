@@ -1,127 +1,242 @@
 # === File: main.py ===
-from langchain.agents import Tool
-from langchain.agents import initialize_agent
-from langchain_community.llms import Ollama
-
+import argparse
+import contextlib
+import os
+import threading
+import time
+
+# Only light modules at import time: LangChain, the LLM client and the agent are loaded by
+# AgentLoader, so the prompt shows at once and routed requests never wait for them
 from modules.parser import parse_request
-from langchain_core.agents import AgentAction,AgentFinish
-from modules.terraform_io import read_terraform
-from modules.vm_manager import modify_disk, create_vm
-from modules.terraform_runner import run_tf_plan, run_tf_apply, run_tf_destroy, run_tf_init,confirm_then_run,init_and_plan,plan_then_confirm_apply
-
-
+from modules.terraform_io import TERRAFORM_PATH, read_terraform
+from modules.state_reader import read_state
+from modules.vm_manager import modify_disk, create_vm, set_vm_size, delete_vm, set_tag, remove_tag
+from modules.router import RouteStats, route
+from modules.metrics import metrics
+from modules.observations import observations, show_full_output
+from modules.terraform_runner import run_tf_plan, run_tf_apply, run_tf_destroy, run_tf_init,confirm_then_run,init_and_plan,plan_then_confirm_apply,CancelledByUser
 
-llm = Ollama(model="llama3")
+MODEL = "llama3"
 
+# Turned into LangChain Tools when the agent is built
 tools = [
-    Tool(name="ParseRequest", func=parse_request, description="Parses user input into structured action"),
-    Tool(name="ReadTerraform", func=read_terraform, description="Reads the Terraform file content"),
-    Tool(name="ModifyDiskSize", func=modify_disk, description="Modifies disk size in Terraform HCL"),
-    Tool(name="CreateVM", func=create_vm, description="Creates a new VM in Terraform HCL"),
-    Tool(
+    dict(name="ParseRequest", func=parse_request, description="Parses user input into structured action"),
+    dict(name="ReadTerraform", func=read_terraform, description="Reads the Terraform file content"),
+    dict(name="ReadState", func=read_state, description="Looks up real deployed values in terraform.tfstate by address, e.g. 'azurerm_linux_virtual_machine.vm.os_disk' or 'azurerm_linux_virtual_machine.vm.size'. Input 'list' to list all resources in state."),
+    dict(name="ModifyDiskSize", func=modify_disk, description="Modifies disk size in Terraform HCL"),
+    dict(name="CreateVM", func=create_vm, description="Creates a new VM in Terraform HCL"),
+    dict(name="SetVMSize", func=set_vm_size, description="Changes the VM size in Terraform HCL. Input: '[vm=<name>;]size=<Azure size, e.g. Standard_B2s>'"),
+    dict(name="DeleteVM", func=delete_vm, description="Removes a VM block from Terraform HCL. Input: 'vm=<name>'"),
+    dict(name="SetTag", func=set_tag, description="Adds or updates a tag on a VM in Terraform HCL. Input: '[vm=<name>;]tag=<key>;value=<value>'"),
+    dict(name="RemoveTag", func=remove_tag, description="Removes a tag from a VM in Terraform HCL. Input: '[vm=<name>;]tag=<key>'"),
+    dict(
         name="TerraformInit",
         func=run_tf_init,
-        description="Initializes the Terraform working directory. Must be run before plan or apply."
+        description="Initializes the Terraform working directory. Must be run before plan or apply. Skipped when nothing changed since the last init; input 'upgrade' to upgrade providers or 'force' to always re-run."
     ),
-    Tool(
+    dict(
         name="TerraformPlan",
         func=confirm_then_run(run_tf_plan, "Terraform is about to run PLAN. Proceed?"),
         description="Runs 'terraform plan'. Only works if 'terraform init' was run beforehand and asks for apply confirmation from user"
     ),
-    Tool(
+    dict(
         name="TerraformApply",
         func=confirm_then_run(run_tf_apply, "Terraform is about to APPLY changes. Proceed?"),
         description="Runs 'terraform apply'. Only works if 'terraform init' and 'terraform plan' were run beforehand"
     ),
-    Tool(
+    dict(
         name="TerraformDestroy",
         func=confirm_then_run(run_tf_destroy, "Terraform is about to DESTROY infrastructure. Proceed?"),
         description="Destroy infrastructure using Terraform"
     ),
-    Tool(
+    dict(
         name="InitAndPlan",
         func=confirm_then_run(init_and_plan, "Terraform is about to run INIT and PLAN. Proceed?"),
         description="Initialize and plan Terraform changes"
     ),
-    Tool(
-    name="TerraformPlanThenApply",
-    func=plan_then_confirm_apply,
-    description="Plans the infrastructure and then asks for confirmation before applying it."
-)
-
-
-    
+    dict(
+        name="TerraformPlanThenApply",
+        func=plan_then_confirm_apply,
+        description="Plans the infrastructure and then asks for confirmation before applying it."
+    ),
+    dict(
+        name="ShowFullOutput",
+        func=show_full_output,
+        description="Shows the full text of a tool output that was compacted. Input: the output id, e.g. 'obs-3', or a line range like 'obs-3:120-240'"
+    ),
 ]
 
-# Tool names that require confirmation
-tools_requiring_confirmation = ["TerraformApply","TerraformPlan","TerraformDestroy", "ModifyDiskSize", "CreateVM"]
-
-# Create the agent
-agent = initialize_agent(
-    tools=tools,
-    llm=llm,
-    agent="zero-shot-react-description",
-    verbose=True,
-)
-
-
-
-# === Interactive chat loop ===
-print("🛠️ DevOps Assistant Chat (type 'exit' to quit)")
-while True:
-    user_input = input("\n> You: ")
-    if user_input.lower() in ["exit", "quit"]:
-        print("👋 Exiting assistant.")
-        break
-    try:
-        response = agent.invoke(user_input)
+# Tools that edit main.tf and ask first, whether the router or the agent calls them
+# (TerraformPlan/Apply/Destroy already confirm through confirm_then_run)
+tools_requiring_confirmation = ["ModifyDiskSize", "CreateVM", "DeleteVM", "SetVMSize", "SetTag", "RemoveTag"]
+
+
+def confirm_edit(tool_name, func):
+    """Ask before running an editing tool, showing the input it was given."""
+    def wrapper(tool_input):
+        answer = input(f"\n⚠️  {tool_name} is about to edit main.tf with '{tool_input}'. Proceed? (yes/no): ")
+        if answer.strip().lower() != "yes":
+            raise CancelledByUser(f"{tool_name} cancelled by user.")
+        return func(tool_input)
+    return wrapper
+
+
+def ollama():
+    # Shared pooled client; the model starts loading in the background as soon as it is built
+    from modules.llm_client import ollama_llm
+    return ollama_llm(MODEL)
+
+
+class AgentLoader:
+    """Imports LangChain and builds the agent in a background thread; get() waits until it is ready."""
+
+    def __init__(self, tool_funcs, make_llm):
+        self.tool_funcs = tool_funcs
+        self.make_llm = make_llm
+        self.agent = None
+        self.error = None
+        self._ready = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._build, name="agent-loader", daemon=True)
+                self._thread.start()
+        return self
+
+    def _build(self):
+        started = time.perf_counter()
+        try:
+            from langchain.agents import Tool, initialize_agent
+            # The agent sees compacted outputs; routed requests still print the full ones
+            agent_tools = [Tool(name=t["name"], func=observations.wrap(t["name"], self.tool_funcs[t["name"]]),
+                                description=t["description"])
+                           for t in tools]
+            self.agent = initialize_agent(
+                tools=agent_tools,
+                llm=self.make_llm(),
+                agent="zero-shot-react-description",
+                verbose=True,
+            )
+        except Exception as e:
+            self.error = e
+        finally:
+            metrics.record("agent_build", time.perf_counter() - started, "error" if self.error else "ok")
+            self._ready.set()
+
+    def get(self):
+        if not self._ready.is_set():
+            self.start()
+            print("⏳ Loading the LLM agent...")
+            self._ready.wait()
+        if self.error:
+            raise RuntimeError(f"Could not build the LLM agent: {self.error}")
+        return self.agent
+
+
+def main(argv=None):
+    cli = argparse.ArgumentParser(description="DevOps assistant chat")
+    cli.add_argument("--record", metavar="FILE", help="Record LLM and tool calls of this session to FILE (.jsonl.gz)")
+    cli.add_argument("--replay", metavar="FILE", help="Re-run a recorded session with the LLM answers taken from FILE")
+    cli.add_argument("--lazy", action="store_true",
+                     help="Load the LLM agent on the first request that needs it instead of in the background")
+    args = cli.parse_args(argv)
+
+    recorder = replay = None
+    # Tool and agent timings go to metrics.jsonl / metrics.prom (TF_ASSISTANT_METRICS_DIR overrides the location)
+    metrics_dir = os.environ.get("TF_ASSISTANT_METRICS_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "metrics")
+    if args.replay:
+        from modules.session_replay import ReplayLLM, SessionReplay
+        replay = SessionReplay(args.replay)
+        print(f"🔁 Replaying {len(replay.requests)} request(s) in {replay.prepare_workspace()}")
+        make_llm = lambda: ReplayLLM(replay=replay)
+        metrics_dir = None  # keep replays out of the real timings
+    elif args.record:
+        from modules.session_replay import RecordingLLM, SessionRecorder
+        main_tf = None
+        if os.path.exists(TERRAFORM_PATH):
+            with open(TERRAFORM_PATH, "r") as f:
+                main_tf = f.read()
+        recorder = SessionRecorder(args.record, main_tf=main_tf, model=MODEL)
+        make_llm = lambda: RecordingLLM(inner=ollama(), recorder=recorder)
+    else:
+        make_llm = ollama
+    metrics.configure(metrics_dir)
+
+    tool_funcs = {}
+    for tool in tools:
+        func = metrics.traced(tool["name"], tool["func"])
+        if recorder or replay:
+            func = (recorder or replay).wrap_tool(tool["name"], func)
+        if tool["name"] in tools_requiring_confirmation and not replay:
+            func = confirm_edit(tool["name"], func)
+        tool_funcs[tool["name"]] = func
+
+    loader = AgentLoader(tool_funcs, make_llm)
+    if not args.lazy:
+        loader.start()
+    route_stats = RouteStats()
+
+    def handle(user_input):
+        """Answer one request, through its tool when the router understands it, else through the agent."""
+        # Requests the rule-based router understands go straight to their tool, skipping the LLM
+        routed = route(user_input)
+        if routed:
+            tool_name, tool_input = routed
+            with route_stats.timed(tool_name):
+                response = tool_funcs[tool_name](tool_input)
+            print(f"\n⚡ {tool_name}: {response}")
+            if not str(response).startswith("[❌]"):
+                return
+            # The router guessed wrong (or the tool couldn't do it); let the agent read the request
+            print("↪️ Handing the request to the LLM agent instead...")
+        agent = loader.get()
+        observations.request = user_input
+        with route_stats.timed(None), metrics.span("agent", prompt_chars=len(user_input)):
+            response = agent.invoke(user_input)
         print(f"\n🤖 Assistant: {response}")
-    except Exception as e:
-        if type(e).__name__ == "CancelledByUser":
-            print(f"\n🚫 {e}")
-            continue  # Go back to user input
-        print(f"\n⚠️ Error: {e}")
-
-
-# === File: modules/parser.py ===
-def parse_request(input: str) -> str:
-    # This is a placeholder; ideally, you parse with regex or structured LLM output
-    return f"Parsed: action=increase_disk, vm=dev-vm, region=us-central1, size=100GB"
-
-
-# === File: modules/terraform_io.py ===
-def read_terraform(_: str) -> str:
-    try:
-        with open("hcl/main.tf", "r") as f:
-            return f.read()
-    except FileNotFoundError:
-        return "main.tf not found"
-
-
-# === File: modules/vm_manager.py ===
-def modify_disk(input: str) -> str:
-    # Simulate HCL modification
-    return f"Updated dev-vm disk size to {input} in main.tf"
-
-def create_vm(input: str) -> str:
-    return f"Appended new VM block to main.tf for {input}"
-
-
-# === File: modules/prompt_user.py ===
-def ask_user(_: str) -> str:
-    return input("Do you want to continue? (yes/no): ")
-
-
-# === File: modules/terraform_runner.py ===
-def run_tf_init(_: str) -> str:
-    return "Terraform init output: ✓ Initialization complete"
-
-def run_tf_plan(_: str) -> str:
-    return "Terraform plan output: ✓ Changes detected"
-
-def run_tf_apply(_: str) -> str:
-    return "Terraform apply output: ✓ Changes applied"
-def run_tf_destroy(_: str) -> str:
-    return "Terraform destroy output: ✓ Resources destroyed"
 
- 
+    if replay:
+        for recorded in replay.requests:
+            print(f"\n> Replay: {recorded['text']}")
+            try:
+                with replay.request(recorded):
+                    handle(recorded["text"])
+            except Exception as e:
+                print(f"\n⚠️ Error: {e}")
+        print("\n" + replay.report())
+        return 0
+
+    # === Interactive chat loop ===
+    print("🛠️ DevOps Assistant Chat (type 'exit' to quit, 'stats' for fast-path hit rates, 'metrics' for timings)")
+    if recorder:
+        print(f"⏺️ Recording this session to {recorder.path}")
+    while True:
+        user_input = input("\n> You: ")
+        if user_input.lower() in ["exit", "quit"]:
+            print(route_stats.report())
+            if recorder:
+                recorder.close()
+            print("👋 Exiting assistant.")
+            break
+        if user_input.strip().lower() == "stats":
+            print(route_stats.report())
+            continue
+        if user_input.strip().lower() == "metrics":
+            print(metrics.summary())
+            continue
+        try:
+            with recorder.request(user_input) if recorder else contextlib.nullcontext():
+                handle(user_input)
+        except Exception as e:
+            if type(e).__name__ == "CancelledByUser":
+                print(f"\n🚫 {e}")
+                continue  # Go back to user input
+            print(f"\n⚠️ Error: {e}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
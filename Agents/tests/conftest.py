@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Tests import `modules.*` and `bench.*` the way the entry points do
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
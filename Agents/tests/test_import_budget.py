@@ -0,0 +1,18 @@
+import pytest
+
+from bench.import_budget import HEAVY, MODULES, measure
+
+# Twice the script's budget: catches a heavy import sneaking back in without failing on a busy machine
+BUDGET_MS = 300
+RUNS = 3
+
+
+@pytest.mark.parametrize("module", MODULES)
+def test_no_heavy_packages_at_startup(module):
+    _, packages = measure(module)
+    assert not packages & HEAVY
+
+
+def test_planner_import_time():
+    best = min(measure("planner")[0] for _ in range(RUNS))
+    assert best < BUDGET_MS
@@ -0,0 +1,86 @@
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from bench.fake_ollama import FakeOllama
+from modules.llm_client import OllamaClient
+from modules.metrics import metrics
+
+PROMPT = "Explain this terraform error"
+
+
+@pytest.fixture
+def fake():
+    with FakeOllama() as server:
+        yield server
+
+
+@pytest.fixture
+def client(fake):
+    client = OllamaClient("llama3", host=fake.url)
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def spans(monkeypatch):
+    monkeypatch.setattr(metrics, "spans", [])
+    return metrics.spans
+
+
+def stage(spans, name):
+    return [span for span in spans if span["stage"] == name]
+
+
+def test_reuses_the_connection(client, spans):
+    first = "".join(client.generate(PROMPT))
+    second = "".join(client.generate(PROMPT))
+
+    assert first == second != ""
+    assert [span["reused_connection"] for span in stage(spans, "llm_request")] == [False, True]
+    assert len(client._idle) == 1
+
+
+def test_retries_a_dropped_reused_connection(fake, client, spans):
+    "".join(client.generate(PROMPT))
+    fake.drop_connections()
+
+    assert "".join(client.generate(PROMPT)) != ""
+    requests = stage(spans, "llm_request")
+    assert [span["outcome"] for span in requests] == ["ok", "ok"]
+    assert requests[-1]["reused_connection"] is False
+    assert fake.requests == 2
+
+
+def test_early_closed_stream_is_not_pooled(client, spans):
+    stream = client.generate(PROMPT)
+    next(stream)
+    stream.close()
+
+    assert client._idle == []
+    assert stage(spans, "llm_request")[-1]["outcome"] == "aborted"
+    # The next request gets a fresh connection, not the half-read one
+    "".join(client.generate(PROMPT))
+    assert stage(spans, "llm_request")[-1]["reused_connection"] is False
+
+
+def test_preload_loads_the_model(fake, client, spans):
+    client.preload().join(timeout=10)
+
+    assert client.loaded.is_set()
+    assert fake.requests == 1
+    assert [span["outcome"] for span in stage(spans, "llm_preload")] == ["ok"]
+    # The preload's connection serves the first real request
+    "".join(client.generate(PROMPT))
+    assert stage(spans, "llm_request")[-1]["reused_connection"] is True
+
+
+def test_records_request_spans(client, spans):
+    "".join(client.generate(PROMPT))
+
+    first_token, = stage(spans, "llm_first_token")
+    request, = stage(spans, "llm_request")
+    assert first_token["model"] == request["model"] == "llama3"
+    assert 0 < first_token["seconds"] <= request["seconds"]
+    assert request["outcome"] == "ok"
+    assert request["response_tokens"] > 0 and request["prompt_tokens"] > 0
@@ -0,0 +1,33 @@
+from modules.llm_stream import ResponseCleaner
+
+
+def clean(text):
+    cleaner = ResponseCleaner()
+    cleaner.feed(text)
+    return cleaner.finish(), cleaner
+
+
+def test_fence_on_the_closing_brace_line():
+    result, cleaner = clean('```hcl\nresource "a" "b" {\n  x = 1\n}```\nI set x.')
+    assert result == 'resource "a" "b" {\n  x = 1\n}'
+    assert not cleaner.malformed
+
+
+def test_fence_while_a_block_is_open():
+    _, cleaner = clean('```hcl\nresource "a" "b" {\n  x = 1\n```\nI set x.')
+    assert cleaner.malformed
+    assert cleaner.stop_reason == "code block closed with unbalanced braces"
+
+
+def test_heredoc_body_is_kept_verbatim():
+    text = ('resource "a" "b" {\n  user_data = <<-EOT\n    Welcome to the web server running here\n'
+            '    echo "}" {\n    EOT\n}\n')
+    result, cleaner = clean(text)
+    assert result == text.strip()
+    assert cleaner.stop_reason is None
+
+
+def test_prose_inside_an_open_block():
+    _, cleaner = clean('resource "a" "b" {\n  x = 1\n  This line is plain prose in a block\n}')
+    assert cleaner.malformed
+    assert cleaner.stop_reason == "explanatory text inside an open block"
@@ -0,0 +1,48 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from modules.parser import parse_request
+from modules.router import route
+
+SAMPLE = Path(__file__).resolve().parent.parent / "hcl" / "main.tf"
+
+
+@pytest.fixture(autouse=True)
+def sample_workspace(tmp_path, monkeypatch):
+    # The router checks VM names against hcl/main.tf in the working directory; the sample has one VM, "vm"
+    (tmp_path / "hcl").mkdir()
+    shutil.copy(SAMPLE, tmp_path / "hcl" / "main.tf")
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.mark.parametrize("request_text", [
+    "delete vm web and create vm api in eastus",
+    "set disk size to 100GB and add a tag env=prod",
+    "increase the disk; add tag env=prod",
+    "make the vm bigger: Standard_D4s_v3",
+    "change vm size of web to Standard_B2s",
+    "delete the vm",
+    "add a storage account with 100GB",
+    "create vm vm in eastus",
+])
+def test_ambiguous_requests_go_to_the_agent(request_text):
+    assert route(request_text) is None
+
+
+def test_to_is_a_target_size():
+    assert route("increase the disk to 100GB") == ("ModifyDiskSize", "mode=absolute;amount=100")
+    assert route("increase the disk of vm vm by 10GB") == ("ModifyDiskSize", "vm=vm;mode=increment;amount=10")
+
+
+def test_only_known_regions():
+    assert parse_request("create a vm called web in the westeurope region")["region"] == "westeurope"
+    assert parse_request("create a vm called web in the cloud")["region"] is None
+    assert route("create a vm called web in the cloud") is None
+
+
+def test_routes_plain_requests():
+    assert route("resize vm vm to Standard_B2s") == ("SetVMSize", "vm=vm;size=Standard_B2s")
+    assert route("add tag env=prod") == ("SetTag", "tag=env;value=prod")
+    assert route("plan and apply") == ("TerraformPlanThenApply", "")
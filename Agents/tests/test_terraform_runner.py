@@ -0,0 +1,72 @@
+import json
+import os
+import stat
+import sys
+
+import pytest
+
+from modules import terraform_runner
+from modules.terraform_runner import ensure_init, run_saved_plan
+
+# Stand-in terraform: init installs a provider, plan saves a plan file, show prints an empty change set
+FAKE_TERRAFORM = f"""#!{sys.executable}
+import json, os, sys
+args = sys.argv[1:]
+if args[0] == "init":
+    os.makedirs(".terraform/providers/example", exist_ok=True)
+    with open(".terraform/providers/example/provider", "w") as f:
+        f.write("binary")
+elif args[0] == "plan":
+    out = next(a[len("-out="):] for a in args if a.startswith("-out="))
+    with open(out, "w") as f:
+        f.write("plan")
+elif args[0] == "show":
+    print(json.dumps({{"resource_changes": []}}))
+"""
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    terraform = bin_dir / "terraform"
+    terraform.write_text(FAKE_TERRAFORM)
+    terraform.chmod(terraform.stat().st_mode | stat.S_IXUSR)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(terraform_runner, "terraform_env", lambda: dict(os.environ))
+
+    cwd = tmp_path / "hcl"
+    cwd.mkdir()
+    (cwd / "main.tf").write_text('provider "azurerm" {\n  features {}\n}\n')
+    (cwd / "terraform.tfstate").write_text(json.dumps({"lineage": "abc", "serial": 1, "resources": []}))
+    return str(cwd)
+
+
+def test_full_plan_keeps_init_skipped(workspace):
+    _, skipped = ensure_init(workspace, echo=False)
+    assert not skipped
+
+    _, plan_path = run_saved_plan(workspace, echo=False)
+    assert plan_path is not None
+    assert terraform_runner.last_refresh(workspace) is not None
+
+    _, skipped = ensure_init(workspace, echo=False)
+    assert skipped
+
+
+def test_workspace_lock_is_reentrant_and_exclusive(workspace):
+    import threading
+    order = []
+
+    def other():
+        with terraform_runner.WorkspaceLock(workspace):
+            order.append("other")
+
+    with terraform_runner.WorkspaceLock(workspace):
+        thread = threading.Thread(target=other)
+        thread.start()
+        ensure_init(workspace, echo=False)  # takes the lock again in this thread
+        thread.join(0.2)
+        order.append("owner")
+    thread.join()
+    assert order == ["owner", "other"]
@@ -1,6 +1,6 @@
 # tools.py
 from langchain.agents import Tool
-from modules.parser import parse_request
+from modules.parser import disk_change
 from modules.vm_manager import modify_disk
 
 def modify_disk_wrapper(input_str: str) -> str:
@@ -14,12 +14,12 @@ def modify_disk_wrapper(input_str: str) -> str:
         return f"❌ Invalid ModifyDiskSize input: {e}"
 
 def parse_request_wrapper(request: str) -> str:
-    result = parse_request(request)
-    if result.get("action") == "ModifyDiskSize":
+    change = disk_change(request)
+    if change:
         # Ensure proper format for ModifyDiskSize tool
-        return f"mode={result['mode']};amount={result['amount']}"
+        return f"mode={change[0]};amount={change[1]}"
     else:
-        raise ValueError(f"❌ Unsupported action: {result.get('action')}")
+        raise ValueError("❌ Unsupported action: not a disk size change")
 
 tools = [
     Tool.from_function(